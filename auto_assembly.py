@@ -0,0 +1,175 @@
+import datetime
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import cache, partial
+
+import more_itertools
+from requests import RequestException
+
+import config
+from metrics import metrics
+from sticker_index import get_sticker_index
+from sticker_queue import get_sticker_job_queue
+from utils import run_concurrently
+from wb_api.classes import Order
+from wb_api.client import WBApiClient
+from wb_api.errors import WBAPIError
+
+_AUTO_ASSEMBLY_RULES = config.AUTO_ASSEMBLY_RULES if hasattr(config, 'AUTO_ASSEMBLY_RULES') else [
+    {'supply': 'Поставка {date}'}
+]
+_AUTO_ASSEMBLY_CUTOFF = config.AUTO_ASSEMBLY_CUTOFF if hasattr(config, 'AUTO_ASSEMBLY_CUTOFF') else None
+_AUTO_ASSEMBLY_BATCH_SIZE = config.AUTO_ASSEMBLY_BATCH_SIZE if hasattr(config, 'AUTO_ASSEMBLY_BATCH_SIZE') else 10
+
+
+@dataclass
+class AssemblyPlan:
+    assignments: dict[str, list[Order]] = field(default_factory=dict)
+    supply_ids: dict[str, str] = field(default_factory=dict)
+    skipped: list[Order] = field(default_factory=list)
+    outdated: list[int] = field(default_factory=list)
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def orders_count(self) -> int:
+        return sum(len(orders) for orders in self.assignments.values())
+
+    def get_order_ids(self) -> dict[str, list[int]]:
+        return {
+            supply_name: [order.id for order in orders]
+            for supply_name, orders in self.assignments.items()
+        }
+
+
+@dataclass
+class AssemblyReport:
+    plan: AssemblyPlan
+    created_supplies: list[str] = field(default_factory=list)
+    assigned: dict[str, int] = field(default_factory=dict)
+    failed: list[int] = field(default_factory=list)
+
+    @property
+    def assigned_count(self) -> int:
+        return sum(self.assigned.values())
+
+
+def get_assembly_date(order: Order, cutoff: str | None = _AUTO_ASSEMBLY_CUTOFF) -> datetime.date:
+    created_at = order.created_at.astimezone()
+    if cutoff and created_at.time() >= datetime.time.fromisoformat(cutoff):
+        return created_at.date() + datetime.timedelta(days=1)
+    return created_at.date()
+
+
+def get_supply_name(order: Order, rules: list[dict] = _AUTO_ASSEMBLY_RULES) -> str | None:
+    for rule in rules:
+        if 'articles' in rule and order.article not in rule['articles']:
+            continue
+        return rule['supply'].format(
+            date=get_assembly_date(order).strftime('%d.%m.%Y'),
+            article=order.article
+        )
+
+
+def make_plan(
+        wb_api_client: WBApiClient,
+        rules: list[dict] = _AUTO_ASSEMBLY_RULES,
+        approved_order_ids: dict[str, list[int]] = None
+) -> AssemblyPlan:
+    started_at = time.monotonic()
+    new_orders, supplies = run_concurrently(
+        wb_api_client.get_new_orders,
+        wb_api_client.get_supplies,
+        executor=wb_api_client.fan_out_executor
+    )
+    plan = AssemblyPlan()
+    assignments = defaultdict(list)
+    if approved_order_ids is None:
+        for order in sorted(new_orders, key=lambda order: order.created_at):
+            supply_name = get_supply_name(order, rules)
+            if supply_name:
+                assignments[supply_name].append(order)
+            else:
+                plan.skipped.append(order)
+    else:
+        new_orders = {order.id: order for order in new_orders}
+        for supply_name, order_ids in approved_order_ids.items():
+            for order_id in order_ids:
+                if order_id in new_orders:
+                    assignments[supply_name].append(new_orders[order_id])
+                else:
+                    plan.outdated.append(order_id)
+    plan.assignments = dict(sorted(assignments.items()))
+    open_supplies = {supply.name: supply.id for supply in supplies if not supply.is_done}
+    plan.supply_ids = {
+        supply_name: open_supplies[supply_name]
+        for supply_name in plan.assignments
+        if supply_name in open_supplies
+    }
+    plan.timings['plan'] = time.monotonic() - started_at
+    return plan
+
+
+def _add_order(wb_api_client: WBApiClient, supply_id: str, order_id: int) -> bool:
+    try:
+        is_added = bool(wb_api_client.add_order_to_supply(supply_id, order_id))
+    except (WBAPIError, RequestException):
+        is_added = False
+    metrics.increment('auto_assembly_orders_total', result='assigned' if is_added else 'failed')
+    if is_added:
+        get_sticker_index(wb_api_client.seller_key).move_order(order_id, supply_id)
+    return is_added
+
+
+def execute_plan(
+        wb_api_client: WBApiClient,
+        plan: AssemblyPlan,
+        batch_size: int = _AUTO_ASSEMBLY_BATCH_SIZE
+) -> AssemblyReport:
+    report = AssemblyReport(plan=plan)
+    started_at = time.monotonic()
+    for supply_name in plan.assignments:
+        if supply_name not in plan.supply_ids:
+            plan.supply_ids[supply_name] = wb_api_client.create_new_supply(supply_name)
+            report.created_supplies.append(supply_name)
+    plan.timings['create_supplies'] = time.monotonic() - started_at
+
+    started_at = time.monotonic()
+    orders = [
+        (supply_name, order)
+        for supply_name, supply_orders in plan.assignments.items()
+        for order in supply_orders
+    ]
+    for batch in more_itertools.chunked(orders, batch_size):
+        results = run_concurrently(*[
+            partial(_add_order, wb_api_client, plan.supply_ids[supply_name], order.id)
+            for supply_name, order in batch
+        ], executor=wb_api_client.fan_out_executor)
+        for (supply_name, order), is_added in zip(batch, results):
+            if is_added:
+                report.assigned[supply_name] = report.assigned.get(supply_name, 0) + 1
+            else:
+                report.failed.append(order.id)
+    plan.timings['assign'] = time.monotonic() - started_at
+    for supply_name in report.assigned:
+        get_sticker_job_queue().enqueue_speculative(plan.supply_ids[supply_name], wb_api_client.seller_key)
+    return report
+
+
+@cache
+def _get_seller_lock(seller_key: str) -> threading.Lock:
+    return threading.Lock()
+
+
+def run_auto_assembly(
+        wb_api_client: WBApiClient,
+        approved_order_ids: dict[str, list[int]] = None
+) -> AssemblyReport | None:
+    seller_lock = _get_seller_lock(wb_api_client.seller_key)
+    if not seller_lock.acquire(blocking=False):
+        return
+    try:
+        return execute_plan(wb_api_client, make_plan(wb_api_client, approved_order_ids=approved_order_ids))
+    finally:
+        seller_lock.release()
@@ -1,18 +1,28 @@
+import datetime
+import html
 import logging
+import multiprocessing
+import time
+from contextlib import suppress
 from functools import partial
 
 from environs import Env
-from telegram import Update
+from telegram import Update, TelegramError
 from telegram.ext import (
     Updater,
     CallbackQueryHandler,
     MessageHandler,
     CommandHandler,
+    InlineQueryHandler,
     Filters,
     CallbackContext
 )
 
-from wb_api.client import WBApiClient
+import config
+from export import EXPORT_FORMATS
+from warm_start import warm_up, mark_first_response
+from wb_api.errors import CircuitOpenError
+from wb_api.registry import wb_client_registry
 from bot_lib import (
     show_start_menu,
     show_supplies,
@@ -27,9 +37,30 @@ from bot_lib import (
     create_new_supply,
     delete_supply,
     edit_supply,
-    show_order_details, get_confirmation_to_close_supply, send_supply_qr_code
+    export_supply_orders,
+    find_order,
+    show_order_details, get_confirmation_to_close_supply, send_supply_qr_code,
+    deliver_sticker_jobs,
+    show_auto_assembly_preview,
+    auto_assemble_orders,
+    run_scheduled_auto_assembly,
+    answer_inline_query,
+    return_to_new_orders,
+    show_batch_stickers_menu,
+    toggle_batch_supply,
+    send_batch_stickers
 )
 from logger import TGLoggerHandler
+from metrics import metrics, start_metrics_server
+from outbound import outbound_scheduler
+from profiling import profile, get_slowest_profiles_archive
+from tracing import span
+from persistence import CompactPicklePersistence
+from utils import preload_modules_in_background
+from sticker_queue import get_sticker_job_queue, run_worker
+
+_STICKER_WORKERS = config.STICKER_WORKERS if hasattr(config, 'STICKER_WORKERS') else 2
+_AUTO_ASSEMBLY_INTERVAL = config.AUTO_ASSEMBLY_INTERVAL if hasattr(config, 'AUTO_ASSEMBLY_INTERVAL') else 0
 
 tg_logger = logging.getLogger('TG_logger')
 
@@ -49,12 +80,15 @@ def handle_supplies_menu(update: Update, context: CallbackContext):
         return show_supply(update, context, supply_id)
     if query == 'new_supply':
         return ask_for_supply_name(update, context)
+    if query == 'batch_stickers':
+        return show_batch_stickers_menu(update, context, page_number=0)
     if query.startswith('page_'):
         _, page_number = query.split('_', maxsplit=2)
         return show_supplies(
             update,
             context,
-            page_number=int(page_number)
+            page_number=int(page_number),
+            from_cache=True
         )
 
 
@@ -71,10 +105,26 @@ def handle_supply(update: Update, context: CallbackContext):
         return edit_supply(update, context, supply_id)
     if query.startswith('qr_'):
         return send_supply_qr_code(update, context, supply_id)
+    if query.startswith('export_'):
+        return export_supply_orders(update, context, supply_id)
     if query.startswith('show_supplies'):
         return show_supplies(update, context)
 
 
+def handle_batch_stickers(update: Update, context: CallbackContext):
+    query = update.callback_query.data
+    if query.startswith('toggle_'):
+        _, supply_id = query.split('_', maxsplit=1)
+        return toggle_batch_supply(update, context, supply_id)
+    if query.startswith('page_'):
+        _, page_number = query.split('_', maxsplit=1)
+        return show_batch_stickers_menu(update, context, page_number=int(page_number))
+    if query == 'batch_run':
+        return send_batch_stickers(update, context)
+    if query == 'show_supplies':
+        return show_supplies(update, context, from_cache=True)
+
+
 def handle_confirmation_to_close_supply(update: Update, context: CallbackContext):
     query = update.callback_query.data
     if query.startswith('yes_'):
@@ -92,7 +142,7 @@ def handle_order_details(update: Update, context: CallbackContext):
         _, supply_id = query.split('_', maxsplit=1)
         return show_supply(update, context, supply_id)
     if query == 'new_orders':
-        return show_new_orders(update, context)
+        return return_to_new_orders(update, context)
 
 
 def handle_new_supply_name(update: Update, context: CallbackContext):
@@ -106,7 +156,7 @@ def handle_new_orders(update: Update, context: CallbackContext):
     query = update.callback_query.data
     if query.startswith('page_'):
         _, page = query.split('_', maxsplit=1)
-        return show_new_orders(update, context, int(page))
+        return show_new_orders(update, context, int(page), from_cache=True)
     else:
         order_id = int(update.callback_query.data)
         return show_new_order_details(update, context, order_id)
@@ -130,7 +180,8 @@ def handle_edit_supply(update: Update, context: CallbackContext):
             update,
             context,
             supply_id=supply_id,
-            page_number=int(page)
+            page_number=int(page),
+            from_cache=True
         )
     elif query.startswith('supply_'):
         _, supply_id = query.split('_', maxsplit=1)
@@ -140,6 +191,80 @@ def handle_edit_supply(update: Update, context: CallbackContext):
         return show_order_details(update, context, int(order_id), supply_id)
 
 
+def handle_auto_assembly(update: Update, context: CallbackContext):
+    if update.message:
+        return show_auto_assembly_preview(update, context)
+    if update.callback_query.data == 'run_auto_assembly':
+        return auto_assemble_orders(update, context)
+
+
+def handle_open_supply(update: Update, context: CallbackContext):
+    supply_id = update.message.text.removeprefix('/supply').strip()
+    if not supply_id:
+        return show_supplies(update, context)
+    return show_supply(update, context, supply_id)
+
+
+def handle_inline_query(update: Update, context: CallbackContext, user_ids: list[int]):
+    if update.inline_query.from_user.id not in user_ids:
+        return
+    with metrics.time('handler', state='INLINE_QUERY'):
+        answer_inline_query(update, context)
+
+
+def handle_find_order(update: Update, context: CallbackContext):
+    query = update.message.text.removeprefix('/find').strip()
+    if not query:
+        return show_start_menu(update, context)
+    return find_order(update, context, query)
+
+
+def handle_export_command(update: Update, context: CallbackContext):
+    with suppress(TelegramError):
+        outbound_scheduler.call(
+            context.bot.delete_message,
+            chat_id=update.message.chat_id,
+            message_id=update.message.message_id
+        )
+    previous_state = context.user_data.get('state') or 'START'
+    arguments = update.message.text.split()[1:]
+    export_format = 'csv'
+    if arguments and arguments[-1].lower() in EXPORT_FORMATS:
+        export_format = arguments.pop().lower()
+    try:
+        if len(arguments) == 1:
+            export_supply_orders(update, context, supply_id=arguments[0], export_format=export_format)
+            return previous_state
+        if len(arguments) == 2:
+            date_from, date_to = [datetime.datetime.strptime(argument, '%d.%m.%Y').date() for argument in arguments]
+            export_supply_orders(update, context, date_from=date_from, date_to=date_to, export_format=export_format)
+            return previous_state
+    except ValueError:
+        pass
+    outbound_scheduler.send_message(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        text='Выгрузка заказов:\n'
+             '/export <номер поставки> [csv|parquet]\n'
+             '/export <дд.мм.гггг> <дд.мм.гггг> [csv|parquet]'
+    )
+    return previous_state
+
+
+def notify_wb_api_unavailable(update: Update, context: CallbackContext, error: CircuitOpenError):
+    retry_in = max(int(error.retry_at - time.monotonic()), 1)
+    text = f'API Wildberries сейчас недоступно, действие не выполнено. Попробуйте через {retry_in} с.'
+    if update.callback_query:
+        with suppress(TelegramError):
+            context.bot.answer_callback_query(
+                update.callback_query.id,
+                text,
+                show_alert=True
+            )
+    else:
+        outbound_scheduler.send_message(context.bot, chat_id=update.effective_chat.id, text=text)
+
+
 def handle_users_reply(update: Update, context: CallbackContext, user_ids: int):
     if update.effective_chat.id not in user_ids:
         return
@@ -154,12 +279,30 @@ def handle_users_reply(update: Update, context: CallbackContext, user_ids: int):
     if user_reply in ['/start', 'start']:
         user_state = 'START'
         context.user_data['state'] = user_state
+    elif update.message and user_reply and user_reply.startswith('/export'):
+        user_state = 'EXPORT_ORDERS'
+    elif update.message and user_reply and user_reply.startswith('/assemble'):
+        user_state = 'HANDLE_AUTO_ASSEMBLY'
+    elif update.message and user_reply and user_reply.startswith('/supply'):
+        user_state = 'OPEN_SUPPLY'
+    elif update.message and user_reply and user_reply.startswith('/find'):
+        user_state = 'FIND_ORDER'
+    elif update.message and user_reply and context.user_data.get('state') != 'HANDLE_NEW_SUPPLY_NAME':
+        user_state = 'FIND_ORDER'
     else:
         user_state = context.user_data.get('state')
 
-    if user_state not in ['HANDLE_NEW_SUPPLY_NAME', 'START']:
+    if user_state not in [
+        'HANDLE_NEW_SUPPLY_NAME',
+        'START',
+        'FIND_ORDER',
+        'EXPORT_ORDERS',
+        'HANDLE_AUTO_ASSEMBLY',
+        'OPEN_SUPPLY'
+    ]:
         if update.message:
-            context.bot.delete_message(
+            outbound_scheduler.call(
+                context.bot.delete_message,
                 chat_id=update.message.chat_id,
                 message_id=update.message.message_id
             )
@@ -175,33 +318,110 @@ def handle_users_reply(update: Update, context: CallbackContext, user_ids: int):
         'HANDLE_NEW_SUPPLY_NAME': handle_new_supply_name,
         'HANDLE_SUPPLY_CHOICE': handle_supply_choice,
         'HANDLE_EDIT_SUPPLY': handle_edit_supply,
-        'HANDLE_CONFIRMATION_TO_CLOSE_SUPPLY': handle_confirmation_to_close_supply
+        'HANDLE_CONFIRMATION_TO_CLOSE_SUPPLY': handle_confirmation_to_close_supply,
+        'HANDLE_BATCH_STICKERS': handle_batch_stickers,
+        'FIND_ORDER': handle_find_order,
+        'EXPORT_ORDERS': handle_export_command,
+        'HANDLE_AUTO_ASSEMBLY': handle_auto_assembly,
+        'OPEN_SUPPLY': handle_open_supply
     }
 
     state_handler = state_functions.get(user_state, show_start_menu)
-    next_state = state_handler(
-        update=update,
-        context=context
-    ) or user_state
+    try:
+        with metrics.time('handler', state=user_state or 'START'), \
+                profile('update', state=user_state, user_reply=user_reply, chat_id=update.effective_chat.id), \
+                span('update', state=user_state or 'START', user_reply=user_reply, chat_id=update.effective_chat.id):
+            next_state = state_handler(
+                update=update,
+                context=context
+            ) or user_state
+    except CircuitOpenError as error:
+        notify_wb_api_unavailable(update, context, error)
+        return
     context.user_data['state'] = next_state
+    mark_first_response()
+
+
+def handle_stats_command(update: Update, context: CallbackContext, admin_id: int):
+    if update.effective_chat.id != admin_id:
+        return
+    stats = html.escape(metrics.render_summary()) or 'Статистики пока нет'
+    outbound_scheduler.send_message(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        text=f'<pre>{stats[:4000]}</pre>',
+        parse_mode='HTML'
+    )
+
+
+def handle_slow_command(update: Update, context: CallbackContext, admin_id: int):
+    if update.effective_chat.id != admin_id:
+        return
+    archive_file = get_slowest_profiles_archive()
+    if not archive_file:
+        outbound_scheduler.send_message(
+            context.bot,
+            chat_id=update.effective_chat.id,
+            text='Медленных обновлений не найдено. Профилирование включается в config.py (PROFILING_ENABLED)'
+        )
+        return
+    with archive_file:
+        outbound_scheduler.call(
+            context.bot.send_document,
+            chat_id=update.effective_chat.id,
+            document=archive_file.getvalue(),
+            filename=archive_file.name
+        )
 
 
 def error_handler(update: Update, context: CallbackContext):
     tg_logger.error(msg='Ошибка в боте', exc_info=context.error)
 
 
+def start_sticker_workers(wb_tokens: list[str], workers_count: int = _STICKER_WORKERS):
+    sticker_job_queue = get_sticker_job_queue()
+    sticker_job_queue.requeue_interrupted()
+    process_context = multiprocessing.get_context('spawn')
+    for _ in range(workers_count):
+        process_context.Process(
+            target=run_worker,
+            args=(sticker_job_queue.db_path, sticker_job_queue.results_dir, wb_tokens),
+            daemon=True
+        ).start()
+
+
 def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(name)s %(levelname)s: %(message)s'
+    )
     env = Env()
     env.read_env()
-    WBApiClient(token=env('WB_API_KEY'))
+    sellers = env.json('SELLERS', None) or {env('WB_API_KEY'): env.list('USER_IDS', subcast=int)}
+    for wb_token, user_ids in sellers.items():
+        wb_client_registry.register(wb_token, [int(user_id) for user_id in user_ids])
+    start_sticker_workers(list(sellers))
     handle_users_reply_with_owner_id = partial(
         handle_users_reply,
-        user_ids=env.list('USER_IDS', subcast=int)
+        user_ids=wb_client_registry.user_ids
     )
     token = env('TG_TOKEN')
-    updater = Updater(token)
+    persistence = CompactPicklePersistence()
+    updater = Updater(token, persistence=persistence)
     dispatcher = updater.dispatcher
+    if admin_id := env.int('ADMIN_ID', None):
+        dispatcher.add_handler(CommandHandler(
+            'stats',
+            partial(handle_stats_command, admin_id=admin_id)
+        ))
+        dispatcher.add_handler(CommandHandler(
+            'slow',
+            partial(handle_slow_command, admin_id=admin_id)
+        ))
     dispatcher.add_handler(CallbackQueryHandler(handle_users_reply_with_owner_id))
+    dispatcher.add_handler(InlineQueryHandler(
+        partial(handle_inline_query, user_ids=wb_client_registry.user_ids)
+    ))
     dispatcher.add_handler(MessageHandler(Filters.text, handle_users_reply_with_owner_id))
     dispatcher.add_handler(CommandHandler('start', handle_users_reply_with_owner_id))
     if tg_token := env('TG_LOGGER_TOKEN', None):
@@ -211,7 +431,18 @@ def main():
             chat_id=env.int('ADMIN_ID')
         ))
         dispatcher.add_error_handler(error_handler)
+    updater.job_queue.run_repeating(deliver_sticker_jobs, interval=2, first=0)
+    if _AUTO_ASSEMBLY_INTERVAL:
+        updater.job_queue.run_repeating(run_scheduled_auto_assembly, interval=_AUTO_ASSEMBLY_INTERVAL, first=10)
+    persistence.run_periodic_flush(updater.job_queue)
+    metrics.register_gauges('tg_outbound', outbound_scheduler.get_stats)
+    metrics.register_gauges('wb_cache', wb_client_registry.get_cache_stats)
+    if metrics_port := env.int('METRICS_PORT', None):
+        start_metrics_server(metrics_port, env('METRICS_HOST', '127.0.0.1'))
+    for wb_api_client in wb_client_registry.get_clients():
+        warm_up(wb_api_client)
     updater.start_polling()
+    preload_modules_in_background('stickers')
 
 
 if __name__ == '__main__':
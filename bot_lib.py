@@ -1,19 +1,60 @@
-from collections import Counter
+import html
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
 from contextlib import suppress
+from datetime import date, datetime
+from functools import partial
+from typing import Any, Callable, Iterable
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, TelegramError
+from requests import RequestException
+
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Message,
+    TelegramError
+)
 from telegram.ext import CallbackContext
 
 import config
-from stickers import get_supply_sticker, get_orders_stickers
-from paginator import Paginator, PaginatorItem
-from utils import convert_to_created_ago
+from auto_assembly import AssemblyPlan, AssemblyReport, make_plan, run_auto_assembly
+from export import export_orders, is_format_available, iter_order_history, iter_supply_orders
+from media import get_thumbnail, prefetch_thumbnails, remember_file_id
+from sticker_index import SearchResult, get_sticker_index, is_order_query
+from sticker_queue import StickerJob, get_sticker_job_queue
+from metrics import metrics
+from outbound import outbound_scheduler
+from paginator import Paginator, PaginatorItem, clamp_page_number, page_cache, view_cache
+from tracing import span
+from utils import convert_to_created_ago, run_concurrently, LazyModule
+from wb_api.classes import Order, OrderQRCode, OrderStatus, SupplyQRCode
+from wb_api.circuit_breaker import is_outage_error
 from wb_api.client import WBApiClient
+from wb_api.errors import CircuitOpenError, WBAPIError
+from wb_api.registry import wb_client_registry
 
 _MAIN_MENU_BUTTON = InlineKeyboardButton('Основное меню', callback_data='start')
 _SUPPLIES_QUANTITY = config.SUPPLIES_QUANTITY if hasattr(config, 'SUPPLIES_QUANTITY') else 40
 _PAGE_SIZE = config.PAGINATOR_PAGE_SIZE if hasattr(config, 'PAGINATOR_PAGE_SIZE') else 8
 
+_LAST_GOOD_DATA_SIZE = 500
+_ASSEMBLY_STAGE_NAMES = {
+    'plan': 'планирование',
+    'create_supplies': 'создание поставок',
+    'assign': 'добавление заказов'
+}
+
+tg_logger = logging.getLogger('TG_logger')
+stickers = LazyModule('stickers')
+
+_last_good_data = OrderedDict()
+_last_good_data_lock = threading.Lock()
+
 
 def answer_to_user(
         update: Update,
@@ -22,7 +63,8 @@ def answer_to_user(
         keyboard: list[list[InlineKeyboardButton]] = None,
         add_main_menu_button: bool = True,
         parse_mode: str = 'HTML',
-        edit_current_message: bool = False
+        edit_current_message: bool = False,
+        photo: str | bytes = None
 ):
     if not keyboard:
         keyboard = []
@@ -30,33 +72,149 @@ def answer_to_user(
     if add_main_menu_button:
         keyboard.append([_MAIN_MENU_BUTTON])
 
-    if edit_current_message:
+    chat_id = update.effective_chat.id
+    message_id = update.effective_message.message_id
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    if edit_current_message and not getattr(update.effective_message, 'photo', None):
         try:
-            message = context.bot.edit_message_text(
-                chat_id=update.effective_chat.id,
-                message_id=update.effective_message.message_id,
+            message = outbound_scheduler.edit_message_text(
+                context.bot,
+                chat_id=chat_id,
+                message_id=message_id,
                 text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
+                reply_markup=reply_markup,
                 parse_mode=parse_mode
             )
         except TelegramError:
             pass
         else:
-            return message
+            return message or update.effective_message
 
     with suppress(TelegramError):
-        context.bot.delete_message(
-            chat_id=update.effective_chat.id,
-            message_id=update.effective_message.message_id
+        outbound_scheduler.call(
+            context.bot.delete_message,
+            chat_id=chat_id,
+            message_id=message_id
         )
-    return context.bot.send_message(
-        chat_id=update.effective_chat.id,
+    if photo:
+        with suppress(TelegramError):
+            return outbound_scheduler.call(
+                context.bot.send_photo,
+                chat_id=chat_id,
+                photo=photo,
+                caption=text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
+    return outbound_scheduler.send_message(
+        context.bot,
+        chat_id=chat_id,
         text=text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=reply_markup,
         parse_mode=parse_mode
     )
 
 
+def get_wb_api_client(update: Update) -> WBApiClient:
+    return wb_client_registry.get_client_for_user(update.effective_chat.id)
+
+
+def get_view(update: Update, view: str):
+    return view_cache.get(update.effective_chat.id, update.effective_message.message_id, view)
+
+
+def set_views(update: Update, message: Message, views: dict):
+    view_cache.set(update.effective_chat.id, message.message_id, views)
+
+
+def carry_views(update: Update, message: Message):
+    view_cache.carry(update.effective_chat.id, update.effective_message.message_id, message.message_id)
+
+
+def clear_page_caches():
+    page_cache.clear()
+    view_cache.clear()
+
+
+def answer_with_product_photo(
+        update: Update,
+        context: CallbackContext,
+        text: str,
+        keyboard: list[list[InlineKeyboardButton]],
+        article: str
+):
+    wb_api_client = get_wb_api_client(update)
+    photo = get_thumbnail(wb_api_client, article)
+    message = answer_to_user(
+        update,
+        context,
+        text,
+        keyboard,
+        photo=photo
+    )
+    if isinstance(photo, bytes) and message.photo:
+        remember_file_id(wb_api_client, article, message.photo[-1].file_id)
+    return message
+
+
+def load_with_fallback(method: Callable, *args, **kwargs) -> tuple[Any, datetime | None]:
+    key = (id(method.__self__), method.__name__, args, tuple(sorted(kwargs.items())))
+    try:
+        data = method(*args, **kwargs)
+    except (CircuitOpenError, RequestException) as error:
+        if isinstance(error, RequestException) and not is_outage_error(error):
+            raise
+        with _last_good_data_lock:
+            last_good_data = _last_good_data.get(key)
+        if not last_good_data:
+            raise
+        fetched_at, data = last_good_data
+        return data, fetched_at
+    with _last_good_data_lock:
+        _last_good_data[key] = (datetime.now(), data)
+        _last_good_data.move_to_end(key)
+        if len(_last_good_data) > _LAST_GOOD_DATA_SIZE:
+            _last_good_data.popitem(last=False)
+    return data, None
+
+
+def get_stale_data_note(stale_at: datetime | None) -> str:
+    if not stale_at:
+        return ''
+    return f'\n\n⚠️ API Wildberries недоступно, данные от {stale_at:%H:%M}'
+
+
+def get_order_statuses(wb_api_client: WBApiClient, order_ids: list[int]) -> dict[int, OrderStatus]:
+    try:
+        return wb_api_client.get_order_statuses(order_ids)
+    except (WBAPIError, RequestException):
+        return {}
+
+
+def get_order_status_flag(status: OrderStatus | None) -> str:
+    if not status:
+        return ''
+    if status.is_cancelled:
+        return '❌ '
+    if status.is_problem:
+        return '⚠️ '
+    return ''
+
+
+def get_flagged_orders_note(orders: list[Order], statuses: dict[int, OrderStatus], limit: int = 20) -> str:
+    flagged_orders = [
+        f'{get_order_status_flag(statuses.get(order.id))}{order.id} - {order.article}'
+        for order in orders
+        if get_order_status_flag(statuses.get(order.id))
+    ]
+    if not flagged_orders:
+        return ''
+    note = '\n\nОтмененные и проблемные заказы:\n' + '\n'.join(flagged_orders[:limit])
+    if len(flagged_orders) > limit:
+        note += f'\nи еще {len(flagged_orders) - limit}шт.'
+    return note
+
+
 def show_start_menu(update: Update, context: CallbackContext):
     text = 'Основное меню'
     keyboard = [
@@ -73,27 +231,45 @@ def show_start_menu(update: Update, context: CallbackContext):
     return 'HANDLE_MAIN_MENU'
 
 
+def load_supplies(update: Update, quantity: int = _SUPPLIES_QUANTITY) -> tuple[list, datetime | None]:
+    wb_api_client = get_wb_api_client(update)
+    supplies, stale_at = load_with_fallback(
+        wb_api_client.get_supplies,
+        only_active=False,
+        quantity=quantity
+    )
+    get_sticker_index(wb_api_client.seller_key).update_supplies(supplies)
+    sorted_supplies = sorted(supplies, key=lambda s: s.created_at, reverse=True)
+    page_cache.set(update.effective_chat.id, 'supplies', (sorted_supplies, stale_at))
+    return sorted_supplies, stale_at
+
+
 def show_supplies(
         update: Update,
         context: CallbackContext,
         page_number: int = 0,
         quantity: int = _SUPPLIES_QUANTITY,
-        page_size: int = _PAGE_SIZE
+        page_size: int = _PAGE_SIZE,
+        from_cache: bool = False
 ):
-    wb_api_client = WBApiClient()
-    supplies = wb_api_client.get_supplies(only_active=False, quantity=quantity)
+    cached_supplies = page_cache.get(update.effective_chat.id, 'supplies') if from_cache else None
+    if cached_supplies:
+        sorted_supplies, stale_at = cached_supplies
+    else:
+        sorted_supplies, stale_at = load_supplies(update, quantity)
     keyboard = [[InlineKeyboardButton('Создать новую поставку', callback_data='new_supply')]]
-    if supplies:
-        sorted_supplies = sorted(supplies, key=lambda s: s.created_at, reverse=True)
+    if sorted_supplies:
+        keyboard.append([InlineKeyboardButton('Стикеры для нескольких поставок', callback_data='batch_stickers')])
+        page_number = clamp_page_number(page_number, len(sorted_supplies), page_size)
         is_done = {0: 'Открыта', 1: 'Закрыта'}
-        paginator_items = [
-            PaginatorItem(
+        paginator = Paginator(
+            sorted_supplies,
+            page_size,
+            item_factory=lambda supply: PaginatorItem(
                 callback_data=supply.id,
                 button_text=f'{supply.name} | {supply.id} | {is_done[supply.is_done]}'
             )
-            for supply in sorted_supplies
-        ]
-        paginator = Paginator(paginator_items, page_size)
+        )
         paginator_keyboard = paginator.get_keyboard(
             page_number=page_number,
             callback_data_prefix='supply_',
@@ -107,6 +283,7 @@ def show_supplies(
     else:
         text = 'У вас еще нет поставок. Создайте первую'
         add_main_menu_button = True
+    text += get_stale_data_note(stale_at)
     answer_to_user(
         update,
         context,
@@ -122,21 +299,33 @@ def show_new_orders(
         update: Update,
         context: CallbackContext,
         page_number: int = 0,
-        page_size: int = _PAGE_SIZE
+        page_size: int = _PAGE_SIZE,
+        from_cache: bool = False
 ):
-    wb_api_client = WBApiClient()
-    new_orders = wb_api_client.get_new_orders()
-    if new_orders:
+    cached_orders = None
+    if from_cache:
+        cached_orders = page_cache.get(update.effective_chat.id, 'new_orders') or get_view(update, 'new_orders')
+    if cached_orders:
+        sorted_orders, stale_at = cached_orders
+    else:
+        wb_api_client = get_wb_api_client(update)
+        new_orders, stale_at = load_with_fallback(wb_api_client.get_new_orders)
         sorted_orders = sorted(new_orders, key=lambda o: o.created_at)
-        paginator_items = [
-            PaginatorItem(
+        page_cache.set(update.effective_chat.id, 'new_orders', (sorted_orders, stale_at))
+    if sorted_orders:
+        page_number = clamp_page_number(page_number, len(sorted_orders), page_size)
+        prefetch_thumbnails(
+            get_wb_api_client(update),
+            [order.article for order in sorted_orders[page_number * page_size:(page_number + 1) * page_size]]
+        )
+        paginator = Paginator(
+            sorted_orders,
+            page_size,
+            item_factory=lambda order: PaginatorItem(
                 callback_data=str(order.id),
                 button_text=f'{order.article} | {convert_to_created_ago(order.created_at)}'
             )
-            for order in sorted_orders
-        ]
-
-        paginator = Paginator(paginator_items, page_size)
+        )
         keyboard = paginator.get_keyboard(
             page_number=page_number,
             main_menu_button=_MAIN_MENU_BUTTON,
@@ -150,7 +339,8 @@ def show_new_orders(
         keyboard = None
         add_main_menu_button = True
         text = 'Нет новых заказов'
-    answer_to_user(
+    text += get_stale_data_note(stale_at)
+    message = answer_to_user(
         update,
         context,
         text,
@@ -158,19 +348,36 @@ def show_new_orders(
         add_main_menu_button=add_main_menu_button,
         edit_current_message=True
     )
+    set_views(update, message, {'new_orders': (sorted_orders, stale_at), 'new_orders_page': page_number})
     return 'HANDLE_NEW_ORDERS'
 
 
+def return_to_new_orders(update: Update, context: CallbackContext):
+    return show_new_orders(update, context, get_view(update, 'new_orders_page') or 0, from_cache=True)
+
+
 def show_supply(update: Update, context: CallbackContext, supply_id: str):
-    wb_api_client = WBApiClient()
-    supply = wb_api_client.get_supply(supply_id)
-    orders = wb_api_client.get_supply_orders(supply_id)
+    wb_api_client = get_wb_api_client(update)
+    view = f'supply_{supply_id}'
+    cached_supply = get_view(update, view)
+    if cached_supply:
+        (supply, supply_stale_at), (orders, orders_stale_at) = cached_supply
+    else:
+        (supply, supply_stale_at), (orders, orders_stale_at) = run_concurrently(
+            partial(load_with_fallback, wb_api_client.get_supply, supply_id),
+            partial(load_with_fallback, wb_api_client.get_supply_orders, supply_id),
+            executor=wb_api_client.fan_out_executor
+        )
+        sticker_index = get_sticker_index(wb_api_client.seller_key)
+        sticker_index.update_supplies([supply])
+        sticker_index.update_supply(supply_id, orders)
 
     if not supply.is_done:
         if orders:
             keyboard = [
                 [InlineKeyboardButton('Создать стикеры', callback_data=f'stickers_{supply_id}')],
                 [InlineKeyboardButton('Редактировать заказы', callback_data=f'edit_{supply_id}')],
+                [InlineKeyboardButton('Выгрузить заказы в CSV', callback_data=f'export_{supply_id}')],
                 [InlineKeyboardButton('Отправить в доставку', callback_data=f'close_{supply_id}')]
             ]
         else:
@@ -180,6 +387,7 @@ def show_supply(update: Update, context: CallbackContext, supply_id: str):
     else:
         keyboard = [
             [InlineKeyboardButton('Создать стикеры', callback_data=f'stickers_{supply_id}')],
+            [InlineKeyboardButton('Выгрузить заказы в CSV', callback_data=f'export_{supply_id}')],
             [InlineKeyboardButton('QR-код поставки', callback_data=f'qr_{supply_id}')]
         ]
 
@@ -190,61 +398,95 @@ def show_supply(update: Update, context: CallbackContext, supply_id: str):
              for article, count in Counter(sorted(articles)).items()]
         )
         text = f'Заказы по поставке {supply.name}:\n\n{joined_orders}'
+        text += get_flagged_orders_note(orders, get_order_statuses(wb_api_client, [order.id for order in orders]))
     else:
         text = f'В поставке нет заказов'
+    text += get_stale_data_note(supply_stale_at or orders_stale_at)
 
     keyboard.append(
         [InlineKeyboardButton('Назад к списку поставок', callback_data='show_supplies')]
     )
-    answer_to_user(
+    message = answer_to_user(
         update,
         context,
         text,
         keyboard
     )
+    set_views(update, message, {view: ((supply, supply_stale_at), (orders, orders_stale_at))})
     return 'HANDLE_SUPPLY'
 
 
+def get_orders_with_qr_codes(
+        update: Update,
+        context: CallbackContext,
+        supply_id: str
+) -> list[tuple[Order, OrderQRCode]]:
+    wb_api_client = get_wb_api_client(update)
+    orders = wb_api_client.get_supply_orders(supply_id)
+    if not orders:
+        return []
+    sorted_orders = sorted(orders, key=lambda o: o.created_at)
+    order_ids = [order.id for order in sorted_orders]
+    if not wb_api_client.is_cached('get_qr_codes_for_orders', order_ids):
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            'Загружаются данные по заказам. Подождите'
+        )
+    qr_codes = wb_api_client.get_qr_codes_for_orders(order_ids)
+    context.user_data['current_supply'] = supply_id
+    get_sticker_index(wb_api_client.seller_key).update_supply(supply_id, orders, qr_codes)
+    qr_codes_by_order_id = {qr_code.order_id: qr_code for qr_code in qr_codes}
+    return [
+        (order, qr_codes_by_order_id[order.id])
+        for order in sorted_orders
+        if order.id in qr_codes_by_order_id
+    ]
+
+
+def _get_supply_order_item(
+        order_with_qr_code: tuple[Order, OrderQRCode],
+        statuses: dict[int, OrderStatus]
+) -> PaginatorItem:
+    order, qr_code = order_with_qr_code
+    return PaginatorItem(
+        callback_data=str(order.id),
+        button_text=f'{get_order_status_flag(statuses.get(order.id))}'
+                    f'{order.article} | {qr_code.part_a} {qr_code.part_b}'
+    )
+
+
 def edit_supply(
         update: Update,
         context: CallbackContext,
         supply_id: str,
         page_number: int = 0,
-        page_size: int = _PAGE_SIZE
+        page_size: int = _PAGE_SIZE,
+        from_cache: bool = False
 ):
-    wb_api_client = WBApiClient()
     keyboard = [[InlineKeyboardButton('Вернуться к поставке', callback_data=f'supply_{supply_id}')]]
 
-    orders = wb_api_client.get_supply_orders(supply_id)
-    order_ids = {order.id for order in orders}
-    if orders:
-        sorted_orders = sorted(orders, key=lambda o: o.created_at)
-        if context.user_data.get('order_ids') == order_ids:
-            qr_codes = context.user_data.get('qr_codes')
-        else:
-            context.bot.answer_callback_query(
-                update.callback_query.id,
-                'Загружаются данные по заказам. Подождите'
-            )
-            qr_codes = wb_api_client.get_qr_codes_for_orders([order.id for order in sorted_orders])
-            context.user_data['order_ids'] = order_ids
-            context.user_data['qr_codes'] = qr_codes
-            context.user_data['current_supply'] = supply_id
-        paginator_items = []
-        for order in sorted_orders:
-            with suppress(StopIteration):
-                qr_code = next(filter(
-                    lambda qr: qr.order_id == order.id,
-                    qr_codes
-                ))
-                paginator_items.append(
-                    PaginatorItem(
-                        callback_data=str(order.id),
-                        button_text=f'{order.article} | {qr_code.part_a} {qr_code.part_b}'
-                    )
-                )
-
-        paginator = Paginator(paginator_items, page_size)
+    view = f'supply_orders_{supply_id}'
+    orders_with_qr_codes = None
+    if from_cache:
+        orders_with_qr_codes = page_cache.get(update.effective_chat.id, view) or get_view(update, view)
+    if orders_with_qr_codes is None:
+        orders_with_qr_codes = get_orders_with_qr_codes(update, context, supply_id)
+        page_cache.set(update.effective_chat.id, view, orders_with_qr_codes)
+    if orders_with_qr_codes:
+        page_number = clamp_page_number(page_number, len(orders_with_qr_codes), page_size)
+        prefetch_thumbnails(
+            get_wb_api_client(update),
+            [order.article for order, _ in orders_with_qr_codes[page_number * page_size:(page_number + 1) * page_size]]
+        )
+        statuses = get_order_statuses(
+            get_wb_api_client(update),
+            [order.id for order, _ in orders_with_qr_codes]
+        )
+        paginator = Paginator(
+            orders_with_qr_codes,
+            page_size,
+            item_factory=partial(_get_supply_order_item, statuses=statuses)
+        )
         paginator_keyboard = paginator.get_keyboard(
             page_number=page_number,
             callback_data_prefix=f'{supply_id}_',
@@ -256,10 +498,17 @@ def edit_supply(
         page_info = f' (стр. {page_number + 1})' if paginator.is_paginated else ''
         text = f'Заказы в поставке {supply_id}{page_info}:\n' \
                f'Всего {paginator.items_count}шт'
+        flagged_count = sum(
+            1
+            for order, _ in orders_with_qr_codes
+            if get_order_status_flag(statuses.get(order.id))
+        )
+        if flagged_count:
+            text += f'\n❌ Отменено или с проблемой: {flagged_count}шт'
     else:
         text = 'В поставке нет заказов'
         add_main_menu_button = True
-    answer_to_user(
+    message = answer_to_user(
         update,
         context,
         text,
@@ -267,6 +516,7 @@ def edit_supply(
         add_main_menu_button=add_main_menu_button,
         edit_current_message=True
     )
+    set_views(update, message, {view: orders_with_qr_codes})
     return 'HANDLE_EDIT_SUPPLY'
 
 
@@ -276,23 +526,30 @@ def show_order_details(
         order_id: int,
         supply_id: str
 ):
-    wb_api_client = WBApiClient()
-    context.bot.answer_callback_query(
-        update.callback_query.id,
-        f'Информация по заказу {order_id}'
-    )
-    orders = wb_api_client.get_supply_orders(supply_id)
-    for order in orders:
-        if order.id == order_id:
-            current_order = order
+    wb_api_client = get_wb_api_client(update)
+    if update.callback_query:
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            f'Информация по заказу {order_id}'
+        )
+    orders_with_qr_codes = get_view(update, f'supply_orders_{supply_id}') or []
+    for current_order, order_qr_code in orders_with_qr_codes:
+        if current_order.id == order_id:
             break
     else:
-        return
+        orders = wb_api_client.get_supply_orders(supply_id)
+        for order in orders:
+            if order.id == order_id:
+                current_order = order
+                break
+        else:
+            return
 
-    order_qr_code, *_ = wb_api_client.get_qr_codes_for_orders([current_order.id])
+        order_qr_code, *_ = wb_api_client.get_qr_codes_for_orders([current_order.id])
+        get_sticker_index(wb_api_client.seller_key).update_supply(supply_id, orders, [order_qr_code])
 
     keyboard = [
-        [InlineKeyboardButton('Перенести в поставку', callback_data=f'add_to_supply_{order.id}')],
+        [InlineKeyboardButton('Перенести в поставку', callback_data=f'add_to_supply_{current_order.id}')],
         [InlineKeyboardButton('Вернуться к поставке', callback_data=f'supply_{supply_id}')]
     ]
 
@@ -303,6 +560,56 @@ def show_order_details(
            f'Время с момента заказа: <b>{convert_to_created_ago(current_order.created_at)}</b>\n' \
            f'Цена: <b>{current_order.converted_price / 100} ₽</b>'
 
+    message = answer_with_product_photo(
+        update,
+        context,
+        text,
+        keyboard,
+        current_order.article
+    )
+    carry_views(update, message)
+    return 'HANDLE_ORDER_DETAILS'
+
+
+def index_active_supplies(wb_api_client: WBApiClient):
+    sticker_index = get_sticker_index(wb_api_client.seller_key)
+
+    def index_supply(supply_id: str):
+        orders = wb_api_client.get_supply_orders(supply_id)
+        qr_codes = wb_api_client.get_qr_codes_for_orders([order.id for order in orders]) if orders else []
+        sticker_index.update_supply(supply_id, orders, qr_codes)
+
+    supplies = wb_api_client.get_supplies(only_active=True, quantity=_SUPPLIES_QUANTITY)
+    sticker_index.update_supplies(supplies)
+    run_concurrently(
+        *[partial(index_supply, supply.id) for supply in supplies],
+        executor=wb_api_client.fan_out_executor
+    )
+
+
+def find_order(update: Update, context: CallbackContext, query: str):
+    wb_api_client = get_wb_api_client(update)
+    sticker_index = get_sticker_index(wb_api_client.seller_key)
+    found_order = sticker_index.find_order(query)
+    supply_ids = sticker_index.find_supplies_by_article(query)
+    if not found_order and not supply_ids and is_order_query(query):
+        index_active_supplies(wb_api_client)
+        found_order = sticker_index.find_order(query)
+        supply_ids = sticker_index.find_supplies_by_article(query)
+
+    if found_order:
+        order_id, supply_id = found_order
+        if next_state := show_order_details(update, context, order_id, supply_id):
+            return next_state
+    if supply_ids:
+        text = f'Артикул <b>{html.escape(query)}</b> есть в поставках:'
+        keyboard = [
+            [InlineKeyboardButton(supply_id, callback_data=f'supply_{supply_id}')]
+            for supply_id in supply_ids
+        ]
+    else:
+        text = f'Заказ по номеру стикера, номеру заказа или артикулу <b>{html.escape(query)}</b> не найден'
+        keyboard = []
     answer_to_user(
         update,
         context,
@@ -312,9 +619,45 @@ def show_order_details(
     return 'HANDLE_ORDER_DETAILS'
 
 
+def _get_inline_query_result(result: SearchResult) -> InlineQueryResultArticle:
+    supplies = ', '.join(result.supply_ids)
+    if result.kind == 'supply':
+        title = f'Поставка {result.name}'
+        description = result.key
+        command = f'/supply {result.key}'
+    elif result.kind == 'order':
+        title = f'Заказ {result.key}'
+        description = f'Артикул {result.name}, поставка {supplies}'
+        command = f'/find {result.key}'
+    else:
+        title = f'Артикул {result.key}'
+        description = f'Поставки: {supplies}'
+        command = f'/find {result.key}'
+    return InlineQueryResultArticle(
+        id=f'{result.kind}_{result.key}'[:64],
+        title=title,
+        description=description,
+        input_message_content=InputTextMessageContent(command)
+    )
+
+
+def answer_inline_query(update: Update, context: CallbackContext):
+    inline_query = update.inline_query
+    wb_api_client = wb_client_registry.get_client_for_user(inline_query.from_user.id)
+    results = get_sticker_index(wb_api_client.seller_key).search(inline_query.query) if inline_query.query else []
+    context.bot.answer_inline_query(
+        inline_query.id,
+        results=[_get_inline_query_result(result) for result in results],
+        cache_time=5,
+        is_personal=True
+    )
+
+
 def show_new_order_details(update: Update, context: CallbackContext, order_id: int):
-    wb_api_client = WBApiClient()
-    for order in wb_api_client.get_new_orders():
+    wb_api_client = get_wb_api_client(update)
+    cached_orders = get_view(update, 'new_orders')
+    new_orders = cached_orders[0] if cached_orders else wb_api_client.get_new_orders()
+    for order in new_orders:
         if order.id == order_id:
             current_order = order
             break
@@ -335,42 +678,393 @@ def show_new_order_details(update: Update, context: CallbackContext, order_id: i
            f'Время с момента заказа: <b>{convert_to_created_ago(current_order.created_at)}</b>\n' \
            f'Цена: <b>{current_order.converted_price / 100} ₽</b>'
 
-    answer_to_user(
+    message = answer_with_product_photo(
         update,
         context,
         text,
-        keyboard
+        keyboard,
+        current_order.article
     )
+    carry_views(update, message)
     return 'HANDLE_ORDER_DETAILS'
 
 
 def send_stickers(update: Update, context: CallbackContext, supply_id: str):
-    wb_api_client = WBApiClient()
+    wb_api_client = get_wb_api_client(update)
+    orders = wb_api_client.get_supply_orders(supply_id)
+    if not orders:
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            'В поставке нет заказов'
+        )
+        return
+
+    sticker_job_queue = get_sticker_job_queue()
+    job, is_new_job = sticker_job_queue.enqueue(
+        supply_id,
+        [order.id for order in orders],
+        update.effective_chat.id,
+        wb_api_client.seller_key
+    )
+    if not is_new_job:
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            'Стикеры для этой поставки уже готовятся'
+        )
+        return
+
     context.bot.answer_callback_query(
         update.callback_query.id,
         'Запущена подготовка стикеров. Подождите'
     )
-    orders = wb_api_client.get_supply_orders(supply_id)
-    order_qr_codes = wb_api_client.get_qr_codes_for_orders(
-        [order.id for order in orders]
-    )
-    articles = set([order.article for order in orders])
-    products = [wb_api_client.get_product(article) for article in articles]
-    with get_orders_stickers(
-            orders,
-            products,
-            order_qr_codes,
-            supply_id
-    ) as zip_file:
-        context.bot.send_document(
+    message = outbound_scheduler.send_message(
+        context.bot,
+        chat_id=update.effective_chat.id,
+        text=f'Стикеры для поставки {supply_id}: задание в очереди'
+    )
+    sticker_job_queue.set_status_message(job.id, message.message_id)
+
+
+def show_batch_stickers_menu(
+        update: Update,
+        context: CallbackContext,
+        page_number: int = None,
+        page_size: int = _PAGE_SIZE
+):
+    cached_supplies = page_cache.get(update.effective_chat.id, 'supplies')
+    sorted_supplies, _ = cached_supplies or load_supplies(update)
+    selected_supplies = context.user_data.setdefault('batch_supplies', [])
+    if page_number is None:
+        page_number = context.user_data.get('batch_page', 0)
+    page_number = clamp_page_number(page_number, len(sorted_supplies), page_size)
+    context.user_data['batch_page'] = page_number
+    paginator = Paginator(
+        sorted_supplies,
+        page_size,
+        item_factory=lambda supply: PaginatorItem(
+            callback_data=supply.id,
+            button_text=f'{"✅ " if supply.id in selected_supplies else ""}{supply.name} | {supply.id}'
+        )
+    )
+    keyboard = paginator.get_keyboard(
+        page_number=page_number,
+        callback_data_prefix='toggle_',
+        main_menu_button=_MAIN_MENU_BUTTON
+    )
+    if selected_supplies:
+        keyboard.append([
+            InlineKeyboardButton(f'Создать стикеры ({len(selected_supplies)})', callback_data='batch_run')
+        ])
+    keyboard.append([InlineKeyboardButton('Назад к списку поставок', callback_data='show_supplies')])
+    text = 'Выберите поставки, для которых нужно подготовить стикеры'
+    if paginator.is_paginated:
+        text = f'{text}\n(стр. {page_number + 1})'
+    answer_to_user(
+        update,
+        context,
+        text,
+        keyboard,
+        add_main_menu_button=False,
+        edit_current_message=True
+    )
+    return 'HANDLE_BATCH_STICKERS'
+
+
+def toggle_batch_supply(update: Update, context: CallbackContext, supply_id: str):
+    selected_supplies = context.user_data.setdefault('batch_supplies', [])
+    if supply_id in selected_supplies:
+        selected_supplies.remove(supply_id)
+    else:
+        selected_supplies.append(supply_id)
+    return show_batch_stickers_menu(update, context)
+
+
+def send_batch_stickers(update: Update, context: CallbackContext):
+    wb_api_client = get_wb_api_client(update)
+    supply_ids = context.user_data.get('batch_supplies', [])
+    supply_orders = run_concurrently(*[
+        partial(wb_api_client.get_supply_orders, supply_id)
+        for supply_id in supply_ids
+    ], executor=wb_api_client.fan_out_executor)
+    supply_orders = {
+        supply_id: [order.id for order in orders]
+        for supply_id, orders in zip(supply_ids, supply_orders)
+        if orders
+    }
+    if not supply_orders:
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            'В выбранных поставках нет заказов'
+        )
+        return
+
+    sticker_job_queue = get_sticker_job_queue()
+    jobs = sticker_job_queue.enqueue_batch(
+        supply_orders,
+        update.effective_chat.id,
+        wb_api_client.seller_key
+    )
+    context.bot.answer_callback_query(
+        update.callback_query.id,
+        f'Запущена подготовка стикеров для поставок: {len(supply_orders)}. Подождите'
+    )
+    for job, is_new_job in jobs:
+        if not is_new_job:
+            continue
+        message = outbound_scheduler.send_message(
+            context.bot,
             chat_id=update.effective_chat.id,
-            document=zip_file.getvalue(),
-            filename=zip_file.name
+            text=f'Стикеры для поставки {job.supply_id}: задание в очереди'
+        )
+        sticker_job_queue.set_status_message(job.id, message.message_id)
+    context.user_data['batch_supplies'] = []
+    context.user_data['batch_page'] = 0
+    return show_supplies(update, context, from_cache=True)
+
+
+def _update_sticker_job_message(context: CallbackContext, job: StickerJob, text: str):
+    if job.status_message_id:
+        with suppress(TelegramError):
+            outbound_scheduler.edit_message_text(
+                context.bot,
+                chat_id=job.chat_id,
+                message_id=job.status_message_id,
+                text=text
+            )
+            return
+    outbound_scheduler.send_message(context.bot, chat_id=job.chat_id, text=text)
+
+
+def _send_sticker_job_parts(context: CallbackContext, job: StickerJob):
+    sticker_job_queue = get_sticker_job_queue()
+    for part_number, part_path in sticker_job_queue.get_undelivered_parts(job.id):
+        extension = os.path.splitext(part_path)[1]
+        if job.parts_total == 1:
+            filename = f'Stickers for {job.supply_id}{extension}'
+        elif job.parts_total:
+            filename = f'Stickers for {job.supply_id} part {part_number} of {job.parts_total}{extension}'
+        else:
+            filename = f'Stickers for {job.supply_id} part {part_number}{extension}'
+        with metrics.time('sticker_stage', stage='send'), \
+                span('sticker_part_delivery', trace_id=job.trace_id, job_id=job.id, part_number=part_number):
+            with open(part_path, 'rb') as part_file:
+                outbound_scheduler.call(
+                    context.bot.send_document,
+                    chat_id=job.chat_id,
+                    document=part_file,
+                    filename=filename
+                )
+        sticker_job_queue.mark_part_delivered(job.id, part_number)
+        with suppress(OSError):
+            os.remove(part_path)
+
+
+def deliver_sticker_jobs(context: CallbackContext):
+    sticker_job_queue = get_sticker_job_queue()
+    for part_path in sticker_job_queue.expire_speculative():
+        with suppress(OSError):
+            os.remove(part_path)
+    for job in sticker_job_queue.get_undelivered_jobs():
+        try:
+            if job.status in ('running', 'done'):
+                _send_sticker_job_parts(context, job)
+            if job.status == 'done':
+                for stage, duration in job.timings.items():
+                    metrics.observe('sticker_stage_seconds', duration, stage=stage)
+                _update_sticker_job_message(
+                    context,
+                    job,
+                    f'Стикеры для поставки {job.supply_id} готовы'
+                )
+                sticker_job_queue.mark_delivered(job.id)
+            elif job.status == 'failed':
+                tg_logger.error(f'Ошибка при создании стикеров для поставки {job.supply_id}: {job.error}')
+                _update_sticker_job_message(
+                    context,
+                    job,
+                    f'Не удалось создать стикеры для поставки {job.supply_id}. Попробуйте позже'
+                )
+                sticker_job_queue.mark_delivered(job.id)
+                for _, part_path in sticker_job_queue.get_undelivered_parts(job.id):
+                    with suppress(OSError):
+                        os.remove(part_path)
+            elif job.status == 'running' and job.total and job.rendered != job.reported:
+                _update_sticker_job_message(
+                    context,
+                    job,
+                    f'Стикеры для поставки {job.supply_id}: '
+                    f'готово {job.rendered} из {job.total} артикулов'
+                )
+                sticker_job_queue.set_reported(job.id, job.rendered)
+        except TelegramError:
+            continue
+
+
+def _send_orders_export(
+        context: CallbackContext,
+        chat_id: int,
+        wb_api_client: WBApiClient,
+        order_chunks: Iterable[list[Order]],
+        export_format: str,
+        filename: str,
+        title: str
+):
+    try:
+        file_path, rows_count = export_orders(wb_api_client, order_chunks, export_format)
+    except Exception:
+        tg_logger.exception(f'Ошибка при выгрузке {title}')
+        outbound_scheduler.send_message(context.bot, chat_id=chat_id, text=f'Не удалось выгрузить {title}')
+        return
+    try:
+        if not rows_count:
+            outbound_scheduler.send_message(context.bot, chat_id=chat_id, text=f'Нет заказов для выгрузки {title}')
+            return
+        with open(file_path, 'rb') as export_file:
+            outbound_scheduler.call(
+                context.bot.send_document,
+                chat_id=chat_id,
+                document=export_file,
+                filename=filename,
+                caption=f'Выгрузка {title}: {rows_count} заказов'
+            )
+    finally:
+        with suppress(OSError):
+            os.remove(file_path)
+
+
+def export_supply_orders(
+        update: Update,
+        context: CallbackContext,
+        supply_id: str = None,
+        date_from: date = None,
+        date_to: date = None,
+        export_format: str = 'csv'
+):
+    chat_id = update.effective_chat.id
+    if not is_format_available(export_format):
+        outbound_scheduler.send_message(
+            context.bot,
+            chat_id=chat_id,
+            text=f'Формат {export_format} недоступен. Для Parquet установите пакет pyarrow'
+        )
+        return
+    wb_api_client = get_wb_api_client(update)
+    if supply_id:
+        order_chunks = iter_supply_orders(wb_api_client, supply_id)
+        title = f'поставки {supply_id}'
+        filename = f'Orders {supply_id}.{export_format}'
+    else:
+        order_chunks = iter_order_history(wb_api_client, date_from, date_to)
+        title = f'заказов с {date_from:%d.%m.%Y} по {date_to:%d.%m.%Y}'
+        filename = f'Orders {date_from:%Y-%m-%d} - {date_to:%Y-%m-%d}.{export_format}'
+    if update.callback_query:
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            f'Готовлю выгрузку {title}'
         )
+    else:
+        outbound_scheduler.send_message(context.bot, chat_id=chat_id, text=f'Готовлю выгрузку {title}')
+    threading.Thread(
+        target=_send_orders_export,
+        args=(context, chat_id, wb_api_client, order_chunks, export_format, filename, title),
+        daemon=True
+    ).start()
+
+
+def get_assembly_plan_text(plan: AssemblyPlan) -> str:
+    lines = []
+    for supply_name, orders in plan.assignments.items():
+        new_supply_mark = '' if supply_name in plan.supply_ids else ' (новая)'
+        lines.append(f'{html.escape(supply_name)}{new_supply_mark}: {len(orders)} шт.')
+    if plan.skipped:
+        lines.append(f'Не подходят ни под одно правило: {len(plan.skipped)} шт.')
+    return '\n'.join(lines)
+
+
+def get_assembly_report_text(report: AssemblyReport) -> str:
+    lines = [f'Автосборка: добавлено {report.assigned_count} из {report.plan.orders_count} заказов']
+    for supply_name, assigned_count in report.assigned.items():
+        new_supply_mark = ' (новая)' if supply_name in report.created_supplies else ''
+        lines.append(f'{html.escape(supply_name)}{new_supply_mark}: {assigned_count} шт.')
+    if report.failed:
+        lines.append(f'Не удалось добавить: {", ".join(str(order_id) for order_id in report.failed)}')
+    if report.plan.skipped:
+        lines.append(f'Не подходят ни под одно правило: {len(report.plan.skipped)} шт.')
+    if report.plan.outdated:
+        lines.append(
+            f'Уже не новые, пропущены: {", ".join(str(order_id) for order_id in report.plan.outdated)}'
+        )
+    timings = ', '.join(
+        f'{_ASSEMBLY_STAGE_NAMES.get(stage, stage)} {duration:.1f} с.'
+        for stage, duration in report.plan.timings.items()
+    )
+    lines.append(f'Время: {timings}')
+    return '\n'.join(lines)
+
+
+def show_auto_assembly_preview(update: Update, context: CallbackContext):
+    wb_api_client = get_wb_api_client(update)
+    plan = make_plan(wb_api_client)
+    if not plan.assignments:
+        answer_to_user(update, context, 'Новых заказов для автосборки нет')
+        return 'HANDLE_AUTO_ASSEMBLY'
+    text = (
+        f'Автосборка распределит {plan.orders_count} заказов:\n'
+        f'{get_assembly_plan_text(plan)}\n\n'
+        f'Это предварительный просмотр, заказы еще не добавлены в поставки'
+    )
+    keyboard = [
+        [InlineKeyboardButton('Собрать', callback_data='run_auto_assembly')]
+    ]
+    context.user_data['assembly_plan'] = plan.get_order_ids()
+    answer_to_user(update, context, text, keyboard)
+    return 'HANDLE_AUTO_ASSEMBLY'
+
+
+def auto_assemble_orders(update: Update, context: CallbackContext):
+    wb_api_client = get_wb_api_client(update)
+    approved_order_ids = context.user_data.pop('assembly_plan', None)
+    if approved_order_ids is None:
+        context.bot.answer_callback_query(
+            update.callback_query.id,
+            'Предпросмотр устарел, выполните /assemble еще раз'
+        )
+        return 'HANDLE_AUTO_ASSEMBLY'
+    context.bot.answer_callback_query(
+        update.callback_query.id,
+        'Распределяю заказы по поставкам'
+    )
+    report = run_auto_assembly(wb_api_client, approved_order_ids)
+    clear_page_caches()
+    if report is None:
+        text = 'Автосборка уже выполняется, попробуйте позже'
+    else:
+        text = get_assembly_report_text(report)
+    answer_to_user(update, context, text)
+    return 'HANDLE_AUTO_ASSEMBLY'
+
+
+def run_scheduled_auto_assembly(context: CallbackContext):
+    for wb_api_client in wb_client_registry.get_clients():
+        try:
+            report = run_auto_assembly(wb_api_client)
+        except (WBAPIError, RequestException, TimeoutError) as error:
+            tg_logger.warning(f'Автосборка не выполнена: {error}')
+            continue
+        if not report or not report.plan.assignments:
+            continue
+        clear_page_caches()
+        for user_id in wb_client_registry.get_user_ids(wb_api_client.seller_key):
+            outbound_scheduler.send_message(
+                context.bot,
+                chat_id=user_id,
+                text=get_assembly_report_text(report),
+                parse_mode='HTML'
+            )
 
 
 def ask_to_choose_supply(update: Update, context: CallbackContext):
-    wb_api_client = WBApiClient()
+    wb_api_client = get_wb_api_client(update)
     active_supplies = wb_api_client.get_supplies()
     order_id = update.callback_query.data.replace('add_to_supply_', '')
     keyboard = []
@@ -395,13 +1089,16 @@ def ask_to_choose_supply(update: Update, context: CallbackContext):
 
 def add_order_to_supply(update: Update, context: CallbackContext):
     supply_id, order_id = update.callback_query.data.split('_')
-    wb_api_client = WBApiClient()
+    wb_api_client = get_wb_api_client(update)
+    clear_page_caches()
     if not wb_api_client.add_order_to_supply(supply_id, order_id):
         context.bot.answer_callback_query(
             update.callback_query.id,
             'Произошла ошибка. Попробуйте позже'
         )
     else:
+        get_sticker_index(wb_api_client.seller_key).move_order(int(order_id), supply_id)
+        get_sticker_job_queue().enqueue_speculative(supply_id, wb_api_client.seller_key)
         context.bot.answer_callback_query(
             update.callback_query.id,
             f'Заказ {order_id} добавлен к поставке {supply_id}'
@@ -426,12 +1123,14 @@ def ask_for_supply_name(update: Update, context: CallbackContext):
 
 
 def create_new_supply(update: Update, context: CallbackContext):
-    wb_api_client = WBApiClient()
+    wb_api_client = get_wb_api_client(update)
     new_supply_name = update.message.text
     wb_api_client.create_new_supply(new_supply_name)
+    clear_page_caches()
     message_to_delete = context.chat_data.get('message_to_delete')
     if message_to_delete:
-        context.bot.delete_message(
+        outbound_scheduler.call(
+            context.bot.delete_message,
             chat_id=update.effective_chat.id,
             message_id=message_to_delete
         )
@@ -440,7 +1139,8 @@ def create_new_supply(update: Update, context: CallbackContext):
 
 
 def delete_supply(update, context, supply_id: str):
-    wb_api_client = WBApiClient()
+    wb_api_client = get_wb_api_client(update)
+    clear_page_caches()
     if not wb_api_client.delete_supply_by_id(supply_id):
         context.bot.answer_callback_query(
             update.callback_query.id,
@@ -455,7 +1155,8 @@ def delete_supply(update, context, supply_id: str):
 
 
 def close_supply(update: Update, context: CallbackContext, supply_id: str):
-    wb_api_client = WBApiClient()
+    wb_api_client = get_wb_api_client(update)
+    clear_page_caches()
     if not wb_api_client.send_supply_to_deliver(supply_id):
         context.bot.answer_callback_query(
             update.callback_query.id,
@@ -467,15 +1168,24 @@ def close_supply(update: Update, context: CallbackContext, supply_id: str):
             update.callback_query.id,
             'Отправлено в доставку'
         )
-        send_supply_qr_code(update, context, supply_id)
-        return show_supplies(update, context)
+        supply_qr_code, _ = run_concurrently(
+            partial(wb_api_client.get_supply_qr_code, supply_id),
+            partial(load_supplies, update),
+            executor=wb_api_client.fan_out_executor
+        )
+        _send_supply_sticker(update, context, supply_qr_code)
+        return show_supplies(update, context, from_cache=True)
 
 
 def send_supply_qr_code(update: Update, context: CallbackContext, supply_id: str):
-    wb_api_client = WBApiClient()
-    supply_qr_code = wb_api_client.get_supply_qr_code(supply_id)
-    supply_sticker = get_supply_sticker(supply_qr_code)
-    context.bot.send_photo(
+    wb_api_client = get_wb_api_client(update)
+    _send_supply_sticker(update, context, wb_api_client.get_supply_qr_code(supply_id))
+
+
+def _send_supply_sticker(update: Update, context: CallbackContext, supply_qr_code: SupplyQRCode):
+    supply_sticker = stickers.get_supply_sticker(supply_qr_code)
+    outbound_scheduler.call(
+        context.bot.send_photo,
         chat_id=update.effective_chat.id,
         photo=supply_sticker
     )
@@ -0,0 +1,165 @@
+import csv
+import datetime
+import importlib
+import importlib.util
+import logging
+import os
+import tempfile
+from contextlib import suppress
+from typing import Generator, Iterable
+
+import more_itertools
+from requests import RequestException
+
+import config
+from wb_api.classes import Order, Product
+from wb_api.client import WBApiClient
+from wb_api.errors import WBAPIError
+
+_EXPORT_CHUNK_SIZE = config.EXPORT_CHUNK_SIZE if hasattr(config, 'EXPORT_CHUNK_SIZE') else 1000
+
+EXPORT_FORMATS = ('csv', 'parquet')
+EXPORT_COLUMNS = (
+    'order_id',
+    'supply_id',
+    'sticker',
+    'article',
+    'name',
+    'brand',
+    'barcode',
+    'price',
+    'created_at'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def iter_supply_orders(
+        wb_api_client: WBApiClient,
+        supply_id: str,
+        chunk_size: int = _EXPORT_CHUNK_SIZE
+) -> Generator[list[Order], None, None]:
+    orders = sorted(wb_api_client.get_supply_orders(supply_id), key=lambda order: order.created_at)
+    yield from more_itertools.chunked(orders, chunk_size)
+
+
+def iter_order_history(
+        wb_api_client: WBApiClient,
+        date_from: datetime.date,
+        date_to: datetime.date,
+        chunk_size: int = _EXPORT_CHUNK_SIZE
+) -> Generator[list[Order], None, None]:
+    datestamp_from = int(datetime.datetime.combine(date_from, datetime.time.min).timestamp())
+    datestamp_to = int(datetime.datetime.combine(date_to, datetime.time.max).timestamp())
+    next_page = 0
+    while True:
+        orders, next_page = wb_api_client.get_orders(
+            next=next_page,
+            limit=chunk_size,
+            datestamp_from=datestamp_from,
+            datestamp_to=datestamp_to
+        )
+        if orders:
+            yield orders
+        if len(orders) < chunk_size or not next_page:
+            break
+
+
+def _get_stickers(wb_api_client: WBApiClient, orders: list[Order]) -> dict[int, str]:
+    try:
+        qr_codes = wb_api_client.fetch_qr_codes_for_orders([order.id for order in orders])
+    except (WBAPIError, RequestException) as error:
+        logger.warning(f'Не удалось получить стикеры для выгрузки: {error}')
+        return {}
+    return {qr_code.order_id: f'{qr_code.part_a} {qr_code.part_b}' for qr_code in qr_codes}
+
+
+def _load_products(wb_api_client: WBApiClient, articles: Iterable[str], products: dict[str, Product]):
+    missing_articles = sorted(set(articles) - set(products))
+    if not missing_articles:
+        return
+    for product_card in wb_api_client.get_products_by_articles(missing_articles):
+        product = Product.parse_from_card(product_card)
+        products[product.article] = product
+    for article in missing_articles:
+        products.setdefault(article, Product(article=article))
+
+
+def iter_export_rows(
+        wb_api_client: WBApiClient,
+        order_chunks: Iterable[list[Order]]
+) -> Generator[list[dict], None, None]:
+    products = {}
+    for orders in order_chunks:
+        stickers = _get_stickers(wb_api_client, orders)
+        _load_products(wb_api_client, [order.article for order in orders], products)
+        yield [
+            {
+                'order_id': order.id,
+                'supply_id': order.supply_id,
+                'sticker': stickers.get(order.id, ''),
+                'article': order.article,
+                'name': products[order.article].name,
+                'brand': products[order.article].brand,
+                'barcode': products[order.article].barcode,
+                'price': order.converted_price / 100,
+                'created_at': order.created_at.isoformat()
+            }
+            for order in orders
+        ]
+
+
+def write_csv(row_chunks: Iterable[list[dict]], file_path: str) -> int:
+    rows_count = 0
+    with open(file_path, 'w', newline='', encoding='utf-8-sig') as export_file:
+        writer = csv.DictWriter(export_file, fieldnames=EXPORT_COLUMNS, delimiter=';')
+        writer.writeheader()
+        for rows in row_chunks:
+            writer.writerows(rows)
+            rows_count += len(rows)
+    return rows_count
+
+
+def write_parquet(row_chunks: Iterable[list[dict]], file_path: str) -> int:
+    pyarrow = importlib.import_module('pyarrow')
+    parquet = importlib.import_module('pyarrow.parquet')
+    schema = pyarrow.schema([
+        ('order_id', pyarrow.int64()),
+        ('supply_id', pyarrow.string()),
+        ('sticker', pyarrow.string()),
+        ('article', pyarrow.string()),
+        ('name', pyarrow.string()),
+        ('brand', pyarrow.string()),
+        ('barcode', pyarrow.string()),
+        ('price', pyarrow.float64()),
+        ('created_at', pyarrow.string())
+    ])
+    rows_count = 0
+    with parquet.ParquetWriter(file_path, schema) as writer:
+        for rows in row_chunks:
+            writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+            rows_count += len(rows)
+    return rows_count
+
+
+def is_format_available(export_format: str) -> bool:
+    if export_format == 'parquet':
+        return importlib.util.find_spec('pyarrow') is not None
+    return export_format in EXPORT_FORMATS
+
+
+def export_orders(
+        wb_api_client: WBApiClient,
+        order_chunks: Iterable[list[Order]],
+        export_format: str = 'csv'
+) -> tuple[str, int]:
+    writers = {'csv': write_csv, 'parquet': write_parquet}
+    file_descriptor, file_path = tempfile.mkstemp(suffix=f'.{export_format}', prefix='orders_export_')
+    os.close(file_descriptor)
+    try:
+        rows_count = writers[export_format](iter_export_rows(wb_api_client, order_chunks), file_path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(file_path)
+        raise
+    return file_path, rows_count
@@ -0,0 +1,208 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from bot import handle_users_reply
+from bot_lib import deliver_sticker_jobs
+from loadtest.fake_bot import FakeBot
+from loadtest.fake_wb import FakeWBServer, FakeWBState
+from outbound import outbound_scheduler
+from paginator import page_cache
+from sticker_queue import get_sticker_job_queue, process_job
+from wb_api.client import WBApiClient
+from wb_api.registry import wb_client_registry
+
+SCENARIOS = {
+    'browse': [
+        '/start',
+        'show_supplies',
+        'page_1',
+        'page_0',
+        'supply_{supply_id}',
+    ],
+    'new_orders': [
+        '/start',
+        'new_orders',
+        'page_1',
+        '{new_order_id}',
+        'new_orders',
+    ],
+    'edit': [
+        '/start',
+        'show_supplies',
+        'supply_{supply_id}',
+        'edit_{supply_id}',
+        'page_1 supply_{supply_id}',
+        '{supply_id}_{order_id}',
+        'supply_{supply_id}',
+    ],
+    'full': [
+        '/start',
+        'show_supplies',
+        'supply_{supply_id}',
+        'edit_{supply_id}',
+        'page_1 supply_{supply_id}',
+        'supply_{supply_id}',
+        'stickers_{supply_id}',
+    ],
+}
+
+
+def make_update(user_id: int, user_reply: str, message_id: int) -> SimpleNamespace:
+    chat = SimpleNamespace(id=user_id)
+    if user_reply.startswith('/'):
+        message = SimpleNamespace(text=user_reply, chat_id=user_id, message_id=message_id, photo=[])
+        return SimpleNamespace(
+            effective_chat=chat,
+            effective_message=message,
+            message=message,
+            callback_query=None
+        )
+    return SimpleNamespace(
+        effective_chat=chat,
+        effective_message=SimpleNamespace(message_id=message_id, photo=[]),
+        message=None,
+        callback_query=SimpleNamespace(data=user_reply, id=f'{user_id}_{message_id}')
+    )
+
+
+def run_conversation(state: FakeWBState, bot: FakeBot, user_id: int, steps: list[str]) -> list[tuple[str, float, bool]]:
+    with state.lock:
+        open_supplies = [supply['id'] for supply in state.supplies.values() if not supply['done']]
+        supply_id = random.choice(open_supplies)
+        order_ids = [order['id'] for order in state.get_supply_orders(supply_id)]
+        new_order_ids = [order['id'] for order in state.get_supply_orders('')]
+    placeholders = {
+        'supply_id': supply_id,
+        'order_id': random.choice(order_ids) if order_ids else 0,
+        'new_order_id': random.choice(new_order_ids) if new_order_ids else 0,
+    }
+    context = SimpleNamespace(bot=bot, user_data={}, chat_data={})
+    results = []
+    for message_id, step in enumerate(steps, start=user_id * 1000):
+        user_reply = step.format(**placeholders)
+        update = make_update(user_id, user_reply, message_id)
+        started_at = time.monotonic()
+        try:
+            handle_users_reply(update, context, user_ids=[user_id])
+        except Exception:
+            results.append((step, time.monotonic() - started_at, False))
+        else:
+            results.append((step, time.monotonic() - started_at, True))
+    return results
+
+
+def process_sticker_jobs(bot: FakeBot, wb_api_client: WBApiClient, stop_event: threading.Event):
+    sticker_job_queue = get_sticker_job_queue()
+    context = SimpleNamespace(bot=bot)
+    while not stop_event.is_set():
+        job = sticker_job_queue.claim_next()
+        if job:
+            try:
+                process_job(sticker_job_queue, job, wb_api_client)
+            except Exception as error:
+                sticker_job_queue.fail(job.id, repr(error))
+        deliver_sticker_jobs(context)
+        if not job:
+            time.sleep(0.1)
+
+
+def get_percentile(latencies: list[float], percentile: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method='inclusive')[percentile - 1]
+
+
+def run_scenario(
+        name: str,
+        state: FakeWBState,
+        bot: FakeBot,
+        users: int,
+        iterations: int
+) -> dict:
+    page_cache.clear()
+    wb_calls_before = Counter(state.calls)
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        conversations = [
+            executor.submit(run_conversation, state, bot, user_id, SCENARIOS[name])
+            for _ in range(iterations)
+            for user_id in range(1, users + 1)
+        ]
+        results = [step for conversation in conversations for step in conversation.result()]
+    elapsed = time.monotonic() - started_at
+    latencies = [duration for _, duration, _ in results]
+    return {
+        'scenario': name,
+        'updates': len(results),
+        'errors': sum(1 for *_, is_ok in results if not is_ok),
+        'throughput': len(results) / elapsed,
+        'p50': get_percentile(latencies, 50),
+        'p95': get_percentile(latencies, 95),
+        'p99': get_percentile(latencies, 99),
+        'wb_calls': Counter(state.calls) - wb_calls_before,
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"{report['scenario']}: {report['updates']} обновлений, ошибок {report['errors']}, "
+        f"{report['throughput']:.1f} обн./с, "
+        f"p50 {report['p50'] * 1000:.0f} мс, p95 {report['p95'] * 1000:.0f} мс, p99 {report['p99'] * 1000:.0f} мс"
+    )
+    for endpoint, count in sorted(report['wb_calls'].items()):
+        print(f'    {endpoint}: {count}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон обработчиков бота на локальной заглушке WB API')
+    parser.add_argument('--scenario', choices=[*SCENARIOS, 'all'], default='all')
+    parser.add_argument('--users', type=int, default=10, help='количество одновременных пользователей')
+    parser.add_argument('--iterations', type=int, default=3, help='сколько раз каждый пользователь проходит сценарий')
+    parser.add_argument('--wb-latency', type=float, default=0.05, help='средняя задержка ответа WB API, с')
+    parser.add_argument('--wb-error-rate', type=float, default=0.0, help='доля ответов WB API с ошибкой 500')
+    parser.add_argument('--tg-latency', type=float, default=0.0, help='задержка ответа Telegram, с')
+    parser.add_argument('--tg-limits', action='store_true', help='соблюдать ограничения Telegram на частоту отправки')
+    args = parser.parse_args()
+
+    state = FakeWBState()
+    server = FakeWBServer(state, latency=args.wb_latency, error_rate=args.wb_error_rate).start()
+    wb_api_client = wb_client_registry.register(
+        token='',
+        user_ids=range(1, args.users + 1),
+        base_url=server.base_url,
+        requests_per_second=10 ** 6,
+        max_concurrent_requests=args.users
+    )
+    bot = FakeBot(latency=args.tg_latency)
+    if not args.tg_limits:
+        outbound_scheduler.set_limits(per_chat_rate=10 ** 6, per_chat_burst=10 ** 6, global_rate=10 ** 6)
+
+    os.chdir(tempfile.mkdtemp(prefix='wb_bot_loadtest_'))
+    stop_event = threading.Event()
+    sticker_worker = threading.Thread(target=process_sticker_jobs, args=(bot, wb_api_client, stop_event), daemon=True)
+    sticker_worker.start()
+
+    scenarios = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    for name in scenarios:
+        print_report(run_scenario(name, state, bot, args.users, args.iterations))
+
+    deadline = time.monotonic() + 300
+    while get_sticker_job_queue().get_undelivered_jobs() and time.monotonic() < deadline:
+        time.sleep(0.5)
+    stop_event.set()
+    sticker_worker.join()
+    print(f'Telegram: {dict(bot.calls)}')
+    print(f'Исходящие запросы: {outbound_scheduler.get_stats()}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import itertools
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+
+class FakeBot:
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+
+    def _call(self, method: str, chat_id: int = None, **kwargs):
+        with self._lock:
+            self.calls[method] += 1
+            message_id = next(self._message_ids)
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(
+            message_id=kwargs.get('message_id', message_id),
+            chat_id=chat_id,
+            text=kwargs.get('text'),
+            photo=[SimpleNamespace(file_id=f'photo_{message_id}')] if method == 'send_photo' else []
+        )
+
+    def send_message(self, chat_id: int, text: str, **kwargs):
+        return self._call('send_message', chat_id, text=text)
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, **kwargs):
+        return self._call('edit_message_text', chat_id, message_id=message_id, text=text)
+
+    def delete_message(self, chat_id: int, message_id: int, **kwargs):
+        self._call('delete_message', chat_id, message_id=message_id)
+        return True
+
+    def answer_callback_query(self, callback_query_id: str, text: str = None, **kwargs):
+        self._call('answer_callback_query')
+        return True
+
+    def send_document(self, chat_id: int, document, filename: str = None, **kwargs):
+        return self._call('send_document', chat_id)
+
+    def send_photo(self, chat_id: int, photo, **kwargs):
+        return self._call('send_photo', chat_id)
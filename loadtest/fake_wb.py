@@ -0,0 +1,301 @@
+import base64
+import datetime
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def _make_png(width: int = 4, height: int = 4) -> bytes:
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+    raw_rows = b''.join(b'\x00' + b'\xff\xff\xff' * width for _ in range(height))
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+        chunk(b'IDAT', zlib.compress(raw_rows)),
+        chunk(b'IEND', b'')
+    ])
+
+
+_PNG_BASE64 = base64.b64encode(_make_png()).decode()
+
+
+def _format_date(date: datetime.datetime) -> str:
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeWBState:
+
+    def __init__(
+            self,
+            supplies_count: int = 30,
+            orders_per_supply: int = 40,
+            new_orders_count: int = 60,
+            articles_count: int = 25
+    ):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.media_base_url = ''
+        now = datetime.datetime.utcnow()
+        self.articles = [f'ART-{number:04d}' for number in range(articles_count)]
+        self.supplies = {}
+        self.orders = {}
+        self.next_order_id = 1
+        for number in range(supplies_count):
+            supply_id = f'WB-GI-{number + 1:07d}'
+            self.supplies[supply_id] = {
+                'id': supply_id,
+                'name': f'Поставка {number + 1}',
+                'createdAt': _format_date(now - datetime.timedelta(days=supplies_count - number)),
+                'closedAt': None,
+                'done': number < supplies_count // 2
+            }
+            for _ in range(orders_per_supply):
+                self._add_order(supply_id, now)
+        for _ in range(new_orders_count):
+            self._add_order('', now)
+
+    def _add_order(self, supply_id: str, now: datetime.datetime):
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        self.orders[order_id] = {
+            'id': order_id,
+            'supplyId': supply_id,
+            'convertedPrice': random.randint(10000, 500000),
+            'article': random.choice(self.articles),
+            'createdAt': _format_date(now - datetime.timedelta(minutes=random.randint(1, 3000)))
+        }
+
+    def get_supply_orders(self, supply_id: str) -> list[dict]:
+        return [order for order in self.orders.values() if order['supplyId'] == supply_id]
+
+    def get_card(self, article: str) -> dict:
+        return {
+            'vendorCode': article,
+            'nmID': abs(hash(article)) % 10 ** 8,
+            'characteristics': [
+                {'Наименование': f'Товар {article}'},
+                {'Бренд': 'Бренд'},
+                {'Цвет': ['черный']},
+                {'Страна производства': ['Россия']}
+            ],
+            'sizes': [{'skus': [f'20000{abs(hash(article)) % 10 ** 8:08d}']}],
+            'mediaFiles': [f'{self.media_base_url}/media/{article}.png'] if self.media_base_url else []
+        }
+
+
+class FakeWBServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state: FakeWBState, latency: float = 0.05, error_rate: float = 0.0, port: int = 0):
+        super().__init__(('127.0.0.1', port), _FakeWBRequestHandler)
+        self.state = state
+        self.state.media_base_url = self.base_url
+        self.latency = latency
+        self.error_rate = error_rate
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _FakeWBRequestHandler(BaseHTTPRequestHandler):
+    server: FakeWBServer
+
+    routes = [
+        ('GET', r'/api/v3/supplies', 'get_supplies'),
+        ('POST', r'/api/v3/supplies', 'create_supply'),
+        ('GET', r'/api/v3/supplies/(?P<supply_id>[^/]+)', 'get_supply'),
+        ('DELETE', r'/api/v3/supplies/(?P<supply_id>[^/]+)', 'delete_supply'),
+        ('GET', r'/api/v3/supplies/(?P<supply_id>[^/]+)/orders', 'get_supply_orders'),
+        ('PATCH', r'/api/v3/supplies/(?P<supply_id>[^/]+)/orders/(?P<order_id>\d+)', 'add_order_to_supply'),
+        ('PATCH', r'/api/v3/supplies/(?P<supply_id>[^/]+)/deliver', 'deliver_supply'),
+        ('GET', r'/api/v3/supplies/(?P<supply_id>[^/]+)/barcode', 'get_supply_barcode'),
+        ('GET', r'/api/v3/orders/new', 'get_new_orders'),
+        ('GET', r'/api/v3/orders', 'get_orders'),
+        ('POST', r'/api/v3/orders/stickers', 'get_order_stickers'),
+        ('POST', r'/api/v3/orders/status', 'get_order_statuses'),
+        ('POST', r'/content/v1/cards/filter', 'filter_cards'),
+        ('POST', r'/content/v1/cards/cursor/list', 'list_cards'),
+        ('GET', r'/media/(?P<article>[^/]+)\.png', 'get_media'),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method: str):
+        url = urlparse(self.path)
+        for route_method, pattern, handler_name in self.routes:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                break
+        else:
+            self._send_json({'code': 'NotFound', 'message': url.path}, status=404)
+            return
+
+        state = self.server.state
+        with state.lock:
+            state.calls[handler_name] += 1
+        if self.server.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.server.latency)
+        if random.random() < self.server.error_rate:
+            self._send_json({'code': 'InternalServerError', 'message': 'Fake error'}, status=500)
+            return
+
+        body = {}
+        if length := int(self.headers.get('Content-Length') or 0):
+            body = json.loads(self.rfile.read(length))
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with state.lock:
+            response = getattr(self, handler_name)(state, body, params, **match.groupdict())
+        if response is None:
+            self.send_response(204)
+            self.end_headers()
+        elif isinstance(response, bytes):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+        else:
+            self._send_json(response)
+
+    def _send_json(self, content, status: int = 200):
+        encoded_content = json.dumps(content, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded_content)))
+        self.end_headers()
+        self.wfile.write(encoded_content)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    @staticmethod
+    def get_supplies(state: FakeWBState, body: dict, params: dict):
+        supplies = list(state.supplies.values())
+        start = int(params.get('next', 0))
+        limit = int(params.get('limit', 1000))
+        page = supplies[start:start + limit]
+        return {'supplies': page, 'next': start + len(page)}
+
+    @staticmethod
+    def create_supply(state: FakeWBState, body: dict, params: dict):
+        supply_id = f'WB-GI-{len(state.supplies) + 1:07d}'
+        state.supplies[supply_id] = {
+            'id': supply_id,
+            'name': body.get('name', ''),
+            'createdAt': _format_date(datetime.datetime.utcnow()),
+            'closedAt': None,
+            'done': False
+        }
+        return {'id': supply_id}
+
+    @staticmethod
+    def get_supply(state: FakeWBState, body: dict, params: dict, supply_id: str):
+        return state.supplies[supply_id]
+
+    @staticmethod
+    def delete_supply(state: FakeWBState, body: dict, params: dict, supply_id: str):
+        state.supplies.pop(supply_id, None)
+
+    @staticmethod
+    def get_supply_orders(state: FakeWBState, body: dict, params: dict, supply_id: str):
+        return {'orders': state.get_supply_orders(supply_id)}
+
+    @staticmethod
+    def add_order_to_supply(state: FakeWBState, body: dict, params: dict, supply_id: str, order_id: str):
+        state.orders[int(order_id)]['supplyId'] = supply_id
+
+    @staticmethod
+    def deliver_supply(state: FakeWBState, body: dict, params: dict, supply_id: str):
+        state.supplies[supply_id]['done'] = True
+        state.supplies[supply_id]['closedAt'] = _format_date(datetime.datetime.utcnow())
+
+    @staticmethod
+    def get_supply_barcode(state: FakeWBState, body: dict, params: dict, supply_id: str):
+        return {'barcode': supply_id, 'file': _PNG_BASE64}
+
+    @staticmethod
+    def get_new_orders(state: FakeWBState, body: dict, params: dict):
+        return {'orders': state.get_supply_orders('')}
+
+    @staticmethod
+    def get_orders(state: FakeWBState, body: dict, params: dict):
+        orders = list(state.orders.values())
+        start = int(params.get('next', 0))
+        limit = int(params.get('limit', 100))
+        page = orders[start:start + limit]
+        return {'orders': page, 'next': start + len(page)}
+
+    @staticmethod
+    def get_order_stickers(state: FakeWBState, body: dict, params: dict):
+        return {
+            'stickers': [
+                {
+                    'orderId': order_id,
+                    'file': _PNG_BASE64,
+                    'partA': str(1000000 + order_id),
+                    'partB': str(order_id % 10000).zfill(4)
+                }
+                for order_id in body.get('orders', [])
+                if order_id in state.orders
+            ]
+        }
+
+    @staticmethod
+    def get_order_statuses(state: FakeWBState, body: dict, params: dict):
+        return {
+            'orders': [
+                {
+                    'id': order_id,
+                    'supplierStatus': 'cancel' if order_id % 97 == 0 else 'confirm',
+                    'wbStatus': 'canceled_by_client' if order_id % 50 == 0 else 'waiting'
+                }
+                for order_id in body.get('orders', [])
+                if order_id in state.orders
+            ]
+        }
+
+    @staticmethod
+    def filter_cards(state: FakeWBState, body: dict, params: dict):
+        return {'data': [state.get_card(article) for article in body.get('vendorCodes', [])]}
+
+    @staticmethod
+    def list_cards(state: FakeWBState, body: dict, params: dict):
+        cursor = body.get('sort', {}).get('cursor', {})
+        start = int(cursor.get('nmID') or 0)
+        limit = int(cursor.get('limit', 1000))
+        cards = [state.get_card(article) for article in state.articles[start:start + limit]]
+        return {
+            'data': {
+                'cards': cards,
+                'cursor': {'nmID': start + len(cards), 'updatedAt': '', 'total': len(cards)}
+            }
+        }
+
+    @staticmethod
+    def get_media(state: FakeWBState, body: dict, params: dict, article: str):
+        return base64.b64decode(_PNG_BASE64)
@@ -1,17 +1,111 @@
 import logging
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import suppress
 
 import telegram
+from telegram.error import RetryAfter, TelegramError
+
+_MESSAGE_LIMIT = 4096
 
 
 class TGLoggerHandler(logging.Handler):
 
-    def __init__(self, tg_token, chat_id):
+    def __init__(
+            self,
+            tg_token,
+            chat_id,
+            queue_size: int = 1000,
+            batch_interval: float = 5,
+            min_send_interval: float = 3
+    ):
         super().__init__()
         self.chat_id = chat_id
         self.bot = telegram.Bot(token=tg_token)
+        self.batch_interval = batch_interval
+        self.min_send_interval = min_send_interval
+        self._records = queue.Queue(maxsize=queue_size)
+        self._dropped_count = 0
+        self._dropped_lock = threading.Lock()
+        self._last_sent_at = 0.0
+        self._sender = threading.Thread(target=self._send_batches, daemon=True)
+        self._sender.start()
 
     def emit(self, record):
-        self.bot.send_message(
-            self.chat_id,
-            self.format(record)
-        )
+        try:
+            self._records.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped_count += 1
+
+    def close(self):
+        with suppress(queue.Full):
+            self._records.put(None, timeout=1)
+        self._sender.join(timeout=self.batch_interval + 5)
+        super().close()
+
+    def _collect_batch(self) -> tuple[list[logging.LogRecord], bool]:
+        first_record = self._records.get()
+        if first_record is None:
+            return [], True
+        records = [first_record]
+        deadline = time.monotonic() + self.batch_interval
+        while (timeout := deadline - time.monotonic()) > 0:
+            try:
+                record = self._records.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if record is None:
+                return records, True
+            records.append(record)
+        return records, False
+
+    def _get_texts(self, records: list[logging.LogRecord]) -> list[str]:
+        repeats = Counter(self.format(record) for record in records)
+        batch_texts = [
+            f'{text}\n\n(повторилось {count} раз)' if count > 1 else text
+            for text, count in repeats.items()
+        ]
+        with self._dropped_lock:
+            dropped_count, self._dropped_count = self._dropped_count, 0
+        if dropped_count:
+            batch_texts.append(f'Пропущено {dropped_count} записей: очередь логов переполнена')
+        return batch_texts
+
+    @staticmethod
+    def _join_to_messages(texts: list[str]) -> list[str]:
+        messages = []
+        current_message = ''
+        for text in texts:
+            text = text[-_MESSAGE_LIMIT:]
+            if current_message and len(current_message) + len(text) + 2 > _MESSAGE_LIMIT:
+                messages.append(current_message)
+                current_message = ''
+            current_message = f'{current_message}\n\n{text}' if current_message else text
+        if current_message:
+            messages.append(current_message)
+        return messages
+
+    def _send(self, message: str):
+        delay = self._last_sent_at + self.min_send_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            self.bot.send_message(self.chat_id, message)
+        except RetryAfter as error:
+            time.sleep(error.retry_after)
+            self.bot.send_message(self.chat_id, message)
+        finally:
+            self._last_sent_at = time.monotonic()
+
+    def _send_batches(self):
+        is_closed = False
+        while not is_closed:
+            records, is_closed = self._collect_batch()
+            for message in self._join_to_messages(self._get_texts(records)):
+                try:
+                    self._send(message)
+                except TelegramError:
+                    continue
@@ -0,0 +1,178 @@
+import hashlib
+import io
+import os
+import pathlib
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from contextlib import suppress
+from typing import Iterable
+
+import requests
+
+import config
+from metrics import metrics
+from utils import LazyModule
+from wb_api.classes import Product
+from wb_api.client import WBApiClient
+from wb_api.errors import check_response
+
+_THUMBNAILS_DIR = config.THUMBNAILS_DIR if hasattr(config, 'THUMBNAILS_DIR') else 'thumbnails'
+_THUMBNAILS_CACHE_SIZE = config.THUMBNAILS_CACHE_SIZE if hasattr(config, 'THUMBNAILS_CACHE_SIZE') else 50 * 1024 ** 2
+_THUMBNAIL_WAIT_TIMEOUT = config.THUMBNAIL_WAIT_TIMEOUT if hasattr(config, 'THUMBNAIL_WAIT_TIMEOUT') else 0.3
+_MEDIA_WORKERS = config.MEDIA_WORKERS if hasattr(config, 'MEDIA_WORKERS') else 4
+_THUMBNAIL_SIZE = (320, 320)
+_DOWNLOAD_TIMEOUT = 10
+_MISSING_MEDIA_TTL = 600
+
+image = LazyModule('PIL.Image')
+
+
+class ThumbnailCache:
+
+    def __init__(self, directory: str = _THUMBNAILS_DIR, max_size: int = _THUMBNAILS_CACHE_SIZE):
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _get_path(self, seller_key: str, article: str) -> pathlib.Path:
+        file_name = hashlib.sha1(f'{seller_key}:{article}'.encode()).hexdigest()
+        return self.directory / f'{file_name}.jpg'
+
+    def has(self, seller_key: str, article: str) -> bool:
+        return self._get_path(seller_key, article).exists()
+
+    def get(self, seller_key: str, article: str) -> bytes | None:
+        path = self._get_path(seller_key, article)
+        with suppress(OSError):
+            content = path.read_bytes()
+            os.utime(path)
+            return content
+
+    def get_file_id(self, seller_key: str, article: str) -> str | None:
+        with suppress(OSError):
+            return self._get_path(seller_key, article).with_suffix('.file_id').read_text()
+
+    def set(self, seller_key: str, article: str, content: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._get_path(seller_key, article)
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_bytes(content)
+        os.replace(temp_path, path)
+        self._trim()
+
+    def set_file_id(self, seller_key: str, article: str, file_id: str):
+        path = self._get_path(seller_key, article)
+        if path.exists():
+            path.with_suffix('.file_id').write_text(file_id)
+
+    def _trim(self):
+        with self._lock:
+            thumbnails = []
+            for path in self.directory.glob('*.jpg'):
+                with suppress(OSError):
+                    stat = path.stat()
+                    thumbnails.append((stat.st_mtime, stat.st_size, path))
+            total_size = sum(size for _, size, _ in thumbnails)
+            for _, size, path in sorted(thumbnails):
+                if total_size <= self.max_size:
+                    break
+                for suffix in ('.jpg', '.file_id'):
+                    with suppress(OSError):
+                        path.with_suffix(suffix).unlink()
+                total_size -= size
+
+
+thumbnail_cache = ThumbnailCache()
+
+_executor = ThreadPoolExecutor(max_workers=_MEDIA_WORKERS, thread_name_prefix='media')
+_in_flight = {}
+_missing_media = {}
+_in_flight_lock = threading.Lock()
+
+
+def make_thumbnail(content: bytes) -> bytes:
+    with image.open(io.BytesIO(content)) as source_image:
+        thumbnail = source_image.convert('RGB')
+        thumbnail.thumbnail(_THUMBNAIL_SIZE)
+    thumbnail_file = io.BytesIO()
+    thumbnail.save(thumbnail_file, format='JPEG', quality=85)
+    return thumbnail_file.getvalue()
+
+
+def _finish_prefetch(seller_key: str, article: str, content: bytes | None):
+    with _in_flight_lock:
+        future = _in_flight.pop((seller_key, article), None)
+        if content is None:
+            _missing_media[(seller_key, article)] = time.monotonic()
+    if future:
+        future.set_result(content)
+
+
+def _download_thumbnail(seller_key: str, article: str, media_url: str):
+    content = None
+    try:
+        response = requests.get(media_url, timeout=_DOWNLOAD_TIMEOUT)
+        check_response(response)
+        content = make_thumbnail(response.content)
+        thumbnail_cache.set(seller_key, article, content)
+        metrics.increment('media_thumbnails_total', result='downloaded')
+    except Exception:
+        metrics.increment('media_thumbnails_total', result='failed')
+    finally:
+        _finish_prefetch(seller_key, article, content)
+
+
+def _load_media_urls(wb_api_client: WBApiClient, articles: list[str]):
+    media_urls = {}
+    try:
+        for product_card in wb_api_client.get_products_by_articles(articles):
+            product = Product.parse_from_card(product_card)
+            if product.media_urls:
+                media_urls[product.article] = product.media_urls[0]
+    finally:
+        for article in articles:
+            if article in media_urls:
+                _executor.submit(_download_thumbnail, wb_api_client.seller_key, article, media_urls[article])
+            else:
+                _finish_prefetch(wb_api_client.seller_key, article, None)
+
+
+def prefetch_thumbnails(wb_api_client: WBApiClient, articles: Iterable[str]):
+    seller_key = wb_api_client.seller_key
+    now = time.monotonic()
+    with _in_flight_lock:
+        missing_articles = sorted(
+            article
+            for article in set(articles)
+            if (seller_key, article) not in _in_flight
+            and now - _missing_media.get((seller_key, article), -_MISSING_MEDIA_TTL) >= _MISSING_MEDIA_TTL
+            and not thumbnail_cache.has(seller_key, article)
+        )
+        for article in missing_articles:
+            _in_flight[(seller_key, article)] = Future()
+    if missing_articles:
+        _executor.submit(_load_media_urls, wb_api_client, missing_articles)
+
+
+def get_thumbnail(
+        wb_api_client: WBApiClient,
+        article: str,
+        timeout: float = _THUMBNAIL_WAIT_TIMEOUT
+) -> str | bytes | None:
+    seller_key = wb_api_client.seller_key
+    if file_id := thumbnail_cache.get_file_id(seller_key, article):
+        return file_id
+    if content := thumbnail_cache.get(seller_key, article):
+        return content
+    prefetch_thumbnails(wb_api_client, [article])
+    with _in_flight_lock:
+        future = _in_flight.get((seller_key, article))
+    if not future:
+        return thumbnail_cache.get(seller_key, article)
+    with suppress(TimeoutError):
+        return future.result(timeout=timeout)
+
+
+def remember_file_id(wb_api_client: WBApiClient, article: str, file_id: str):
+    thumbnail_cache.set_file_id(wb_api_client.seller_key, article, file_id)
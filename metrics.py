@@ -0,0 +1,174 @@
+import bisect
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+from tracing import span
+
+_DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram:
+
+    def __init__(self, buckets: tuple = _DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_quantile(self, quantile: float) -> float:
+        rank = quantile * self.count
+        cumulative_count = 0
+        for bucket, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative_count += bucket_count
+            if cumulative_count >= rank:
+                return bucket
+        return float('inf')
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    joined_labels = ','.join(f'{key}="{value}"' for key, value in labels)
+    return f'{{{joined_labels}}}'
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauge_collectors = {}
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_gauges(self, prefix: str, collector: Callable[[], dict]):
+        self._gauge_collectors[prefix] = collector
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.increment(f'{name}_errors_total', **labels)
+            raise
+        finally:
+            self.observe(f'{name}_seconds', time.monotonic() - started_at, **labels)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                cumulative_count = 0
+                for bucket, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative_count += bucket_count
+                    bucket_labels = _format_labels((*labels, ('le', bucket)))
+                    lines.append(f'{name}_bucket{bucket_labels} {cumulative_count}')
+                bucket_labels = _format_labels((*labels, ('le', '+Inf')))
+                lines.append(f'{name}_bucket{bucket_labels} {histogram.count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        for prefix, collector in self._gauge_collectors.items():
+            for key, value in collector().items():
+                lines.append(f'{prefix}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def render_summary(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                label_values = ' '.join(str(value) for _, value in labels)
+                lines.append(
+                    f'{name} {label_values}: {histogram.count} шт., '
+                    f'ср. {histogram.sum / histogram.count:.2f} с., '
+                    f'p95 ≤ {histogram.get_quantile(0.95)} с.'
+                )
+            for (name, labels), value in sorted(self._counters.items()):
+                label_values = ' '.join(str(value) for _, value in labels)
+                lines.append(f'{name} {label_values}: {value:g}')
+        for prefix, collector in self._gauge_collectors.items():
+            for key, value in collector().items():
+                lines.append(f'{prefix}_{key}: {value}')
+        return '\n'.join(lines)
+
+
+metrics = MetricsRegistry()
+wb_call_observers = []
+
+
+@contextmanager
+def _observe_wb_call(method: str):
+    started_at = time.time()
+    error = None
+    try:
+        with metrics.time('wb_api_call', method=method), span(f'wb.{method}'):
+            yield
+    except Exception as exception:
+        error = exception
+        raise
+    finally:
+        for observer in wb_call_observers:
+            observer(method, started_at, time.time() - started_at, error)
+
+
+def track_wb_call(func):
+    if inspect.isgeneratorfunction(inspect.unwrap(func)):
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            with _observe_wb_call(func.__name__):
+                yield from func(*args, **kwargs)
+
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with _observe_wb_call(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        content = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
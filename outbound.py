@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
+
+import config
+from tracing import span
+
+_PER_CHAT_RATE = config.TG_PER_CHAT_RATE if hasattr(config, 'TG_PER_CHAT_RATE') else 1
+_PER_CHAT_BURST = config.TG_PER_CHAT_BURST if hasattr(config, 'TG_PER_CHAT_BURST') else 3
+_GLOBAL_RATE = config.TG_GLOBAL_RATE if hasattr(config, 'TG_GLOBAL_RATE') else 30
+_MAX_RETRIES = 3
+_MAX_TRACKED_MESSAGES = 10000
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, now: float, seconds: float):
+        self.reserve(now)
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class OutboundScheduler:
+
+    def __init__(
+            self,
+            per_chat_rate: float = _PER_CHAT_RATE,
+            per_chat_burst: int = _PER_CHAT_BURST,
+            global_rate: float = _GLOBAL_RATE
+    ):
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self._lock = threading.Lock()
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._sent_contents = OrderedDict()
+        self.calls_sent = 0
+        self.calls_saved = 0
+        self.retry_after_count = 0
+        self.throttled_seconds = 0.0
+
+    def set_limits(self, per_chat_rate: float, per_chat_burst: int, global_rate: float):
+        with self._lock:
+            self.per_chat_rate = per_chat_rate
+            self.per_chat_burst = per_chat_burst
+            self._global_bucket = TokenBucket(global_rate, global_rate)
+            self._chat_buckets.clear()
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chat_buckets:
+            self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return self._chat_buckets[chat_id]
+
+    def _wait_for_slot(self, chat_id: int):
+        with self._lock:
+            now = time.monotonic()
+            delay = max(
+                self._global_bucket.reserve(now),
+                self._get_chat_bucket(chat_id).reserve(now)
+            )
+            self.throttled_seconds += delay
+        if delay:
+            time.sleep(delay)
+
+    def _pause(self, chat_id: int, seconds: float):
+        with self._lock:
+            now = time.monotonic()
+            self._global_bucket.pause(now, seconds)
+            self._get_chat_bucket(chat_id).pause(now, seconds)
+            self.retry_after_count += 1
+
+    def _remember_content(self, chat_id: int, message_id: int, content_hash: int):
+        with self._lock:
+            self._sent_contents[(chat_id, message_id)] = content_hash
+            self._sent_contents.move_to_end((chat_id, message_id))
+            if len(self._sent_contents) > _MAX_TRACKED_MESSAGES:
+                self._sent_contents.popitem(last=False)
+
+    @staticmethod
+    def _get_content_hash(text: str, reply_markup: InlineKeyboardMarkup = None) -> int:
+        return hash((text, reply_markup.to_json() if reply_markup else None))
+
+    def call(self, method: Callable, chat_id: int, **kwargs):
+        with span(f'tg.{method.__name__}', chat_id=chat_id) as tg_span:
+            for attempt in range(_MAX_RETRIES + 1):
+                self._wait_for_slot(chat_id)
+                if tg_span:
+                    tg_span.attributes['attempts'] = attempt + 1
+                try:
+                    result = method(chat_id=chat_id, **kwargs)
+                except RetryAfter as error:
+                    if attempt == _MAX_RETRIES:
+                        raise
+                    self._pause(chat_id, error.retry_after)
+                    continue
+                with self._lock:
+                    self.calls_sent += 1
+                return result
+
+    def send_message(self, bot: Bot, chat_id: int, text: str, reply_markup: InlineKeyboardMarkup = None, **kwargs):
+        message = self.call(
+            bot.send_message,
+            chat_id=chat_id,
+            text=text,
+            reply_markup=reply_markup,
+            **kwargs
+        )
+        self._remember_content(chat_id, message.message_id, self._get_content_hash(text, reply_markup))
+        return message
+
+    def edit_message_text(
+            self,
+            bot: Bot,
+            chat_id: int,
+            message_id: int,
+            text: str,
+            reply_markup: InlineKeyboardMarkup = None,
+            **kwargs
+    ):
+        content_hash = self._get_content_hash(text, reply_markup)
+        with self._lock:
+            if self._sent_contents.get((chat_id, message_id)) == content_hash:
+                self.calls_saved += 1
+                return
+        try:
+            message = self.call(
+                bot.edit_message_text,
+                chat_id=chat_id,
+                message_id=message_id,
+                text=text,
+                reply_markup=reply_markup,
+                **kwargs
+            )
+        except BadRequest as error:
+            if 'message is not modified' not in error.message.lower():
+                raise
+            with self._lock:
+                self.calls_saved += 1
+            message = None
+        self._remember_content(chat_id, message_id, content_hash)
+        return message
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'calls_sent': self.calls_sent,
+                'calls_saved': self.calls_saved,
+                'retry_after_count': self.retry_after_count,
+                'throttled_seconds': round(self.throttled_seconds, 3)
+            }
+
+
+outbound_scheduler = OutboundScheduler()
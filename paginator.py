@@ -1,8 +1,25 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
 from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Callable, Iterable
 
-import more_itertools
 from telegram import InlineKeyboardButton
 
+import config
+
+_PAGE_CACHE_TTL = config.PAGE_CACHE_TTL if hasattr(config, 'PAGE_CACHE_TTL') else 120
+_PAGE_CACHE_SIZE = 1000
+_VIEW_CACHE_TTL = config.VIEW_CACHE_TTL if hasattr(config, 'VIEW_CACHE_TTL') else 300
+_VIEW_CACHE_SIZE = 1000
+
+
+def clamp_page_number(page_number: int, items_count: int, page_size: int) -> int:
+    return min(max(0, page_number), max(math.ceil(items_count / page_size) - 1, 0))
+
 
 @dataclass
 class PaginatorItem:
@@ -12,14 +29,31 @@ class PaginatorItem:
 
 class Paginator:
 
-    def __init__(self, item_list: list[PaginatorItem], page_size: int = 10):
+    def __init__(
+            self,
+            item_list: Sequence | Iterable,
+            page_size: int = 10,
+            item_factory: Callable[[Any], PaginatorItem] = None,
+            items_count: int = None
+    ):
         self.item_list = item_list
-        self.items_count = len(item_list)
+        self.item_factory = item_factory
+        self.items_count = len(item_list) if items_count is None else items_count
         self.page_size = page_size
-        self.pages = list(more_itertools.chunked(self.item_list, self.page_size))
-        self.total_pages = len(self.pages)
+        self.total_pages = math.ceil(self.items_count / self.page_size)
         self.is_paginated = self.total_pages > 1
-        self.max_page_number = self.total_pages - 1
+        self.max_page_number = max(self.total_pages - 1, 0)
+
+    def get_page(self, page_number: int) -> list[PaginatorItem]:
+        start = page_number * self.page_size
+        end = start + self.page_size
+        if isinstance(self.item_list, Sequence):
+            window = self.item_list[start:end]
+        else:
+            window = islice(self.item_list, start, end)
+        if self.item_factory:
+            return [self.item_factory(item) for item in window]
+        return list(window)
 
     def get_keyboard(
             self,
@@ -28,13 +62,13 @@ class Paginator:
             page_callback_data_postfix: str = '',
             main_menu_button: InlineKeyboardButton = None
     ) -> list[list[InlineKeyboardButton]]:
-        page_number = min(max(0, page_number), self.total_pages)
+        page_number = clamp_page_number(page_number, self.items_count, self.page_size)
         keyboard = [
             [InlineKeyboardButton(
                 item.button_text,
                 callback_data=f'{callback_data_prefix}{item.callback_data}'
             )]
-            for item in self.pages[page_number]
+            for item in self.get_page(page_number)
         ]
 
         keyboard_menu_buttons = [main_menu_button] if main_menu_button else []
@@ -55,3 +89,84 @@ class Paginator:
             )
         keyboard.append(keyboard_menu_buttons)
         return keyboard
+
+
+class PageCache:
+
+    def __init__(self, ttl: int = _PAGE_CACHE_TTL, max_size: int = _PAGE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id: int, view: str):
+        with self._lock:
+            cached_at, items = self._entries.get((user_id, view), (None, None))
+            if cached_at is None:
+                return
+            if time.monotonic() - cached_at > self.ttl:
+                del self._entries[(user_id, view)]
+                return
+            self._entries.move_to_end((user_id, view))
+            return items
+
+    def set(self, user_id: int, view: str, items):
+        with self._lock:
+            self._entries[(user_id, view)] = (time.monotonic(), items)
+            self._entries.move_to_end((user_id, view))
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ViewCache:
+
+    def __init__(self, ttl: int = _VIEW_CACHE_TTL, max_size: int = _VIEW_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _get_views(self, chat_id: int, message_id: int) -> dict | None:
+        cached_at, views = self._entries.get((chat_id, message_id), (None, None))
+        if cached_at is None:
+            return
+        if time.monotonic() - cached_at > self.ttl:
+            del self._entries[(chat_id, message_id)]
+            return
+        return views
+
+    def get(self, chat_id: int, message_id: int, view: str):
+        with self._lock:
+            views = self._get_views(chat_id, message_id)
+            if views is None:
+                return
+            self._entries.move_to_end((chat_id, message_id))
+            return views.get(view)
+
+    def set(self, chat_id: int, message_id: int, views: dict):
+        with self._lock:
+            cached_views = self._get_views(chat_id, message_id) or {}
+            self._entries[(chat_id, message_id)] = (time.monotonic(), {**cached_views, **views})
+            self._entries.move_to_end((chat_id, message_id))
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def carry(self, chat_id: int, from_message_id: int, to_message_id: int):
+        if from_message_id == to_message_id:
+            return
+        with self._lock:
+            views = self._get_views(chat_id, from_message_id)
+        if views:
+            self.set(chat_id, to_message_id, views)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache()
+view_cache = ViewCache()
@@ -0,0 +1,51 @@
+import threading
+
+from telegram.ext import PicklePersistence, JobQueue
+
+import config
+
+_PERSISTENCE_FILE = config.PERSISTENCE_FILE if hasattr(config, 'PERSISTENCE_FILE') else 'bot_data.pickle'
+_FLUSH_INTERVAL = config.PERSISTENCE_FLUSH_INTERVAL if hasattr(config, 'PERSISTENCE_FLUSH_INTERVAL') else 60
+
+# QR-коды и списки заказов не сохраняем: они тяжелые и загружаются заново
+_PERSISTENT_USER_DATA_KEYS = ('state', 'current_supply')
+_PERSISTENT_CHAT_DATA_KEYS = ('message_to_delete',)
+
+
+class CompactPicklePersistence(PicklePersistence):
+    def __init__(self, filename: str = _PERSISTENCE_FILE):
+        super().__init__(
+            filename,
+            store_user_data=True,
+            store_chat_data=True,
+            store_bot_data=False,
+            on_flush=True
+        )
+        self._lock = threading.Lock()
+
+    def update_user_data(self, user_id: int, data: dict):
+        with self._lock:
+            super().update_user_data(user_id, {
+                key: value
+                for key, value in data.items()
+                if key in _PERSISTENT_USER_DATA_KEYS
+            })
+
+    def update_chat_data(self, chat_id: int, data: dict):
+        with self._lock:
+            super().update_chat_data(chat_id, {
+                key: value
+                for key, value in data.items()
+                if key in _PERSISTENT_CHAT_DATA_KEYS
+            })
+
+    def flush(self):
+        with self._lock:
+            super().flush()
+
+    def run_periodic_flush(self, job_queue: JobQueue, interval: int = _FLUSH_INTERVAL):
+        job_queue.run_repeating(
+            lambda context: self.flush(),
+            interval=interval,
+            first=interval
+        )
@@ -0,0 +1,106 @@
+import cProfile
+import io
+import json
+import pathlib
+import pstats
+import threading
+import time
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import config
+from metrics import wb_call_observers
+
+_PROFILING_ENABLED = config.PROFILING_ENABLED if hasattr(config, 'PROFILING_ENABLED') else False
+_SLOW_THRESHOLD = config.PROFILING_THRESHOLD if hasattr(config, 'PROFILING_THRESHOLD') else 3
+_SLOWEST_COUNT = config.PROFILING_SLOWEST_COUNT if hasattr(config, 'PROFILING_SLOWEST_COUNT') else 20
+_PROFILES_DIR = config.PROFILES_DIR if hasattr(config, 'PROFILES_DIR') else 'profiles'
+
+_timeline = ContextVar('profiling_timeline', default=None)
+_trim_lock = threading.Lock()
+
+
+def _record_wb_call(method: str, started_at: float, duration: float, error: Exception | None):
+    timeline = _timeline.get()
+    if timeline is None:
+        return
+    timeline.append({
+        'method': method,
+        'started_at': started_at,
+        'duration': round(duration, 4),
+        'error': repr(error) if error else None
+    })
+
+
+if _PROFILING_ENABLED:
+    wb_call_observers.append(_record_wb_call)
+
+
+def _trim_profiles(profiles_dir: pathlib.Path, keep: int):
+    with _trim_lock:
+        profiles = []
+        for meta_path in profiles_dir.glob('*.json'):
+            with suppress(OSError, ValueError):
+                profiles.append((json.loads(meta_path.read_text())['duration'], meta_path))
+        profiles.sort(reverse=True)
+        for _, meta_path in profiles[keep:]:
+            for suffix in ('.json', '.prof', '.txt'):
+                with suppress(OSError):
+                    meta_path.with_suffix(suffix).unlink()
+
+
+def _save_profile(profiler: cProfile.Profile, kind: str, duration: float, details: dict, timeline: list):
+    profiles_dir = pathlib.Path(_PROFILES_DIR)
+    profiles_dir.mkdir(parents=True, exist_ok=True)
+    profile_path = profiles_dir / f'{int(time.time() * 1000)}_{kind}'
+    profiler.dump_stats(profile_path.with_suffix('.prof'))
+    with io.StringIO() as stats_text:
+        pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative').print_stats(40)
+        profile_path.with_suffix('.txt').write_text(stats_text.getvalue())
+    profile_path.with_suffix('.json').write_text(json.dumps(
+        {
+            'kind': kind,
+            'duration': round(duration, 4),
+            'details': details,
+            'wb_calls': timeline
+        },
+        ensure_ascii=False,
+        indent=2,
+        default=str
+    ))
+    _trim_profiles(profiles_dir, _SLOWEST_COUNT)
+
+
+@contextmanager
+def profile(kind: str, **details):
+    if not _PROFILING_ENABLED or _timeline.get() is not None:
+        yield
+        return
+    timeline_token = _timeline.set([])
+    profiler = cProfile.Profile()
+    started_at = time.monotonic()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        duration = time.monotonic() - started_at
+        timeline = _timeline.get()
+        _timeline.reset(timeline_token)
+        if duration >= _SLOW_THRESHOLD:
+            _save_profile(profiler, kind, duration, details, timeline)
+
+
+def get_slowest_profiles_archive() -> io.BytesIO | None:
+    profiles_dir = pathlib.Path(_PROFILES_DIR)
+    profile_files = sorted(profiles_dir.glob('*.*')) if profiles_dir.exists() else []
+    if not profile_files:
+        return
+    archive_file = io.BytesIO()
+    archive_file.name = 'slowest_updates.zip'
+    with ZipFile(archive_file, 'w', ZIP_DEFLATED) as archive:
+        for profile_file in profile_files:
+            with suppress(OSError):
+                archive.write(profile_file, profile_file.name)
+    return archive_file
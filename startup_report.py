@@ -0,0 +1,77 @@
+import argparse
+import pathlib
+import re
+import subprocess
+import sys
+from collections import Counter
+
+_IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+_LAZY_MODULES = ('reportlab', 'PIL', 'stickers')
+
+
+def measure_import_times(module: str) -> list[tuple[str, int, int, int]]:
+    completed_process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=pathlib.Path(__file__).parent.resolve(),
+        capture_output=True,
+        text=True
+    )
+    if completed_process.returncode:
+        raise RuntimeError(completed_process.stderr)
+    import_times = []
+    for line in completed_process.stderr.splitlines():
+        if match := _IMPORT_TIME_LINE.match(line):
+            self_time, cumulative_time, indent, name = match.groups()
+            import_times.append((name, len(indent) // 2, int(self_time), int(cumulative_time)))
+    return import_times
+
+
+def get_total_time(import_times: list[tuple[str, int, int, int]], module: str) -> float:
+    return next(
+        cumulative_time
+        for name, depth, _, cumulative_time in import_times
+        if name == module and depth == 0
+    ) / 10 ** 6
+
+
+def get_eagerly_imported(import_times: list[tuple[str, int, int, int]]) -> list[str]:
+    return sorted({name.split('.')[0] for name, *_ in import_times} & set(_LAZY_MODULES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время импорта модулей при запуске бота')
+    parser.add_argument('--module', default='bot')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--budget', type=float, help='допустимое время импорта в секундах')
+    args = parser.parse_args()
+
+    import_times = measure_import_times(args.module)
+    total_time = get_total_time(import_times, args.module)
+    direct_imports = [
+        (name, cumulative_time)
+        for name, depth, _, cumulative_time in import_times
+        if depth == 1
+    ]
+    packages = Counter()
+    for name, _, self_time, _ in import_times:
+        packages[name.split('.')[0]] += self_time
+
+    print(f'Импорт {args.module}: {total_time:.3f} с.\n')
+    print('Прямые импорты:')
+    for name, cumulative_time in sorted(direct_imports, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f'    {name}: {cumulative_time / 10 ** 6:.3f} с.')
+    print('\nПакеты (собственное время):')
+    for name, self_time in packages.most_common(args.top):
+        print(f'    {name}: {self_time / 10 ** 6:.3f} с.')
+
+    eagerly_imported = get_eagerly_imported(import_times)
+    if eagerly_imported:
+        print(f'\nПри запуске загружаются модули, которые должны загружаться лениво: {", ".join(eagerly_imported)}')
+    if args.budget is not None and total_time > args.budget:
+        print(f'\nПревышен бюджет времени запуска: {total_time:.3f} с. > {args.budget} с.')
+    if eagerly_imported or args.budget is not None and total_time > args.budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
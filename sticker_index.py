@@ -0,0 +1,167 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import cache
+from typing import Iterable
+
+from wb_api.classes import Order, OrderQRCode, Supply
+
+SEARCH_LIMIT = 20
+
+
+def normalize_sticker_number(sticker_number: str) -> str:
+    return re.sub(r'\D', '', sticker_number)
+
+
+def is_order_query(query: str) -> bool:
+    query = query.strip()
+    if re.fullmatch(r'[\d\s-]+', query):
+        return bool(normalize_sticker_number(query))
+    return bool(re.fullmatch(r'[\w./-]+', query) and re.search(r'\d', query))
+
+
+@dataclass
+class SearchResult:
+    kind: str
+    key: str
+    supply_ids: list[str]
+    name: str = ''
+
+
+def _get_supply_terms(supply: Supply) -> set[str]:
+    terms = {supply.id.lower(), supply.name.lower(), *supply.name.lower().split()}
+    if digits := normalize_sticker_number(supply.id):
+        terms.add(digits)
+    return {term for term in terms if term}
+
+
+class StickerIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._order_supplies = {}
+        self._sticker_orders = {}
+        self._order_stickers = defaultdict(set)
+        self._article_orders = defaultdict(dict)
+        self._order_articles = {}
+        self._supplies = {}
+        self._term_entries = defaultdict(set)
+        self._sorted_terms = []
+
+    def _add_term(self, term: str, entry: tuple[str, str | int]):
+        if term not in self._term_entries:
+            bisect.insort(self._sorted_terms, term)
+        self._term_entries[term].add(entry)
+
+    def _remove_term(self, term: str, entry: tuple[str, str | int]):
+        entries = self._term_entries.get(term)
+        if not entries:
+            return
+        entries.discard(entry)
+        if not entries:
+            del self._term_entries[term]
+            del self._sorted_terms[bisect.bisect_left(self._sorted_terms, term)]
+
+    def _remove_order(self, order_id: int):
+        self._order_supplies.pop(order_id, None)
+        self._remove_term(str(order_id), ('order', order_id))
+        for sticker_number in self._order_stickers.pop(order_id, ()):
+            if self._sticker_orders.get(sticker_number) == order_id:
+                del self._sticker_orders[sticker_number]
+            self._remove_term(sticker_number, ('order', order_id))
+        article = self._order_articles.pop(order_id, None)
+        if article is not None:
+            self._article_orders[article].pop(order_id, None)
+            if not self._article_orders[article]:
+                del self._article_orders[article]
+                self._remove_term(article, ('article', article))
+
+    def update_supplies(self, supplies: Iterable[Supply]):
+        with self._lock:
+            for supply in supplies:
+                if supply.id in self._supplies:
+                    for term in _get_supply_terms(self._supplies[supply.id]):
+                        self._remove_term(term, ('supply', supply.id))
+                self._supplies[supply.id] = supply
+                for term in _get_supply_terms(supply):
+                    self._add_term(term, ('supply', supply.id))
+
+    def update_supply(self, supply_id: str, orders: Iterable[Order], qr_codes: Iterable[OrderQRCode] = ()):
+        orders = list(orders)
+        with self._lock:
+            order_ids = {order.id for order in orders}
+            removed_order_ids = [
+                order_id
+                for order_id, order_supply_id in self._order_supplies.items()
+                if order_supply_id == supply_id and order_id not in order_ids
+            ]
+            for order_id in removed_order_ids:
+                self._remove_order(order_id)
+            for order in orders:
+                self._order_supplies[order.id] = supply_id
+                self._order_articles[order.id] = order.article.lower()
+                self._article_orders[order.article.lower()][order.id] = supply_id
+                self._add_term(str(order.id), ('order', order.id))
+                self._add_term(order.article.lower(), ('article', order.article.lower()))
+            for qr_code in qr_codes:
+                sticker_number = normalize_sticker_number(f'{qr_code.part_a}{qr_code.part_b}')
+                self._sticker_orders[sticker_number] = qr_code.order_id
+                self._order_stickers[qr_code.order_id].add(sticker_number)
+                self._add_term(sticker_number, ('order', qr_code.order_id))
+
+    def move_order(self, order_id: int, supply_id: str):
+        with self._lock:
+            if order_id not in self._order_supplies:
+                return
+            self._order_supplies[order_id] = supply_id
+            self._article_orders[self._order_articles[order_id]][order_id] = supply_id
+
+    def find_order(self, query: str) -> tuple[int, str] | None:
+        digits = normalize_sticker_number(query)
+        if not digits or re.search(r'[^\W\d_]', query):
+            return
+        with self._lock:
+            order_id = self._sticker_orders.get(digits)
+            if order_id is None and int(digits) in self._order_supplies:
+                order_id = int(digits)
+            if order_id is None or order_id not in self._order_supplies:
+                return
+            return order_id, self._order_supplies[order_id]
+
+    def find_supplies_by_article(self, article: str) -> list[str]:
+        with self._lock:
+            return sorted(set(self._article_orders.get(article.strip().lower(), {}).values()))
+
+    def _get_search_result(self, kind: str, key: str | int) -> SearchResult | None:
+        if kind == 'supply' and key in self._supplies:
+            return SearchResult(kind, key, [key], self._supplies[key].name)
+        if kind == 'order' and key in self._order_supplies:
+            return SearchResult(kind, str(key), [self._order_supplies[key]], self._order_articles[key])
+        if kind == 'article' and key in self._article_orders:
+            return SearchResult(kind, key, sorted(set(self._article_orders[key].values())))
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> list[SearchResult]:
+        terms = {query.strip().lower()}
+        digits = normalize_sticker_number(query)
+        if digits and not re.search(r'[^\W\d_]', query):
+            terms.add(digits)
+        terms.discard('')
+        results = {}
+        with self._lock:
+            for term in sorted(terms):
+                index = bisect.bisect_left(self._sorted_terms, term)
+                while index < len(self._sorted_terms) and self._sorted_terms[index].startswith(term):
+                    for kind, key in sorted(self._term_entries[self._sorted_terms[index]], key=repr):
+                        if len(results) == limit:
+                            return list(results.values())
+                        if (kind, key) not in results and (result := self._get_search_result(kind, key)):
+                            results[(kind, key)] = result
+                    index += 1
+        return list(results.values())
+
+
+@cache
+def get_sticker_index(seller_key: str) -> StickerIndex:
+    return StickerIndex()
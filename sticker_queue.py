@@ -0,0 +1,688 @@
+import hashlib
+import json
+import os
+import pathlib
+import pickle
+import sqlite3
+import time
+from contextlib import closing, suppress
+from dataclasses import dataclass
+from functools import cache, partial
+
+import config
+from profiling import profile
+from tracing import get_trace_id, span
+from utils import run_concurrently, LazyModule
+from wb_api.classes import Order, Product
+from wb_api.client import WBApiClient
+from wb_api.registry import WBClientRegistry
+
+_DB_FILE = config.STICKER_QUEUE_DB if hasattr(config, 'STICKER_QUEUE_DB') else 'sticker_jobs.sqlite3'
+_RESULTS_DIR = config.STICKER_RESULTS_DIR if hasattr(config, 'STICKER_RESULTS_DIR') else 'sticker_results'
+_STICKER_LAYOUT = config.STICKER_LAYOUT if hasattr(config, 'STICKER_LAYOUT') else 'labels'
+_PRERENDER_ENABLED = config.PRERENDER_ENABLED if hasattr(config, 'PRERENDER_ENABLED') else True
+_PRERENDER_DELAY = config.PRERENDER_DELAY if hasattr(config, 'PRERENDER_DELAY') else 30
+_PRERENDER_TTL = config.PRERENDER_TTL if hasattr(config, 'PRERENDER_TTL') else 3600
+_PRERENDER_MAX_LOAD = config.PRERENDER_MAX_LOAD if hasattr(config, 'PRERENDER_MAX_LOAD') else 0.7
+_PRERENDER_THROTTLE_DELAY = 1
+_WORKER_POLL_INTERVAL = 1
+
+stickers = LazyModule('stickers')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_key TEXT NOT NULL,
+    supply_id TEXT NOT NULL,
+    order_ids TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    seller TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'queued',
+    status_message_id INTEGER,
+    rendered INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    reported INTEGER NOT NULL DEFAULT -1,
+    result_path TEXT,
+    error TEXT,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    timings TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key, status);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, delivered);
+CREATE TABLE IF NOT EXISTS job_parts (
+    job_id INTEGER NOT NULL,
+    part_number INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    delivered INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, part_number)
+);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    path TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+'''
+_ADDED_COLUMNS = {
+    'timings': "TEXT NOT NULL DEFAULT '{}'",
+    'seller': "TEXT NOT NULL DEFAULT ''",
+    'parts_total': 'INTEGER NOT NULL DEFAULT 0',
+    'trace_id': 'TEXT',
+    'speculative': 'INTEGER NOT NULL DEFAULT 0',
+    'not_before': 'REAL NOT NULL DEFAULT 0',
+    'batch_id': 'INTEGER'
+}
+
+
+class SpeculativeJobPreempted(Exception):
+    pass
+
+
+class JobOrdersMissing(Exception):
+    pass
+
+
+@dataclass
+class StickerJob:
+    id: int
+    job_key: str
+    supply_id: str
+    order_ids: list[int]
+    chat_id: int
+    seller: str
+    status: str
+    status_message_id: int | None
+    rendered: int
+    total: int
+    reported: int
+    result_path: str | None
+    error: str | None
+    delivered: bool
+    timings: dict
+    parts_total: int
+    trace_id: str | None
+    speculative: bool
+    batch_id: int | None
+    is_batch_leader: bool = False
+
+    @staticmethod
+    def from_row(row: sqlite3.Row):
+        return StickerJob(
+            id=row['id'],
+            job_key=row['job_key'],
+            supply_id=row['supply_id'],
+            order_ids=json.loads(row['order_ids']),
+            chat_id=row['chat_id'],
+            seller=row['seller'],
+            status=row['status'],
+            status_message_id=row['status_message_id'],
+            rendered=row['rendered'],
+            total=row['total'],
+            reported=row['reported'],
+            result_path=row['result_path'],
+            error=row['error'],
+            delivered=bool(row['delivered']),
+            timings=json.loads(row['timings']),
+            parts_total=row['parts_total'],
+            trace_id=row['trace_id'],
+            speculative=bool(row['speculative']),
+            batch_id=row['batch_id']
+        )
+
+
+def get_job_key(seller: str, supply_id: str, order_ids) -> str:
+    orders = ','.join(str(order_id) for order_id in sorted(order_ids))
+    return hashlib.sha1(f'{seller}:{supply_id}:{orders}'.encode()).hexdigest()
+
+
+def is_machine_busy(max_load: float = _PRERENDER_MAX_LOAD) -> bool:
+    try:
+        load, *_ = os.getloadavg()
+    except OSError:
+        return False
+    return load / (os.cpu_count() or 1) > max_load
+
+
+class StickerJobQueue:
+
+    def __init__(self, db_path: str = _DB_FILE, results_dir: str = _RESULTS_DIR):
+        self.db_path = db_path
+        self.results_dir = results_dir
+        pathlib.Path(results_dir).mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(_SCHEMA)
+            existing_columns = {
+                column['name']
+                for column in connection.execute('PRAGMA table_info(jobs)')
+            }
+            for column, definition in _ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _update(self, job_id: int, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{field} = ?' for field in fields)
+        with closing(self._connect()) as connection:
+            connection.execute(
+                f'UPDATE jobs SET {assignments} WHERE id = ?',
+                (*fields.values(), job_id)
+            )
+
+    def _enqueue(
+            self,
+            connection: sqlite3.Connection,
+            supply_id: str,
+            order_ids: list[int],
+            chat_id: int,
+            seller: str,
+            batch_id: int = None
+    ) -> tuple[StickerJob, bool]:
+        job_key = get_job_key(seller, supply_id, order_ids)
+        now = time.time()
+        row = connection.execute(
+            "SELECT * FROM jobs WHERE job_key = ? AND status IN ('queued', 'running') AND speculative = 0",
+            (job_key,)
+        ).fetchone()
+        if row:
+            return StickerJob.from_row(row), False
+        row = connection.execute(
+            "SELECT * FROM jobs WHERE job_key = ? AND status IN ('queued', 'running', 'done') AND speculative = 1 "
+            'ORDER BY id DESC LIMIT 1',
+            (job_key,)
+        ).fetchone()
+        if row:
+            connection.execute(
+                'UPDATE jobs SET speculative = 0, not_before = 0, chat_id = ?, trace_id = ?, updated_at = ? '
+                'WHERE id = ?',
+                (chat_id, get_trace_id(), now, row['id'])
+            )
+            self._cancel_speculative(connection, seller, supply_id)
+            row = connection.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+            return StickerJob.from_row(row), True
+        self._cancel_speculative(connection, seller, supply_id)
+        cursor = connection.execute(
+            'INSERT INTO jobs (job_key, supply_id, order_ids, chat_id, seller, trace_id, batch_id, '
+            'created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_key, supply_id, json.dumps(sorted(order_ids)), chat_id, seller, get_trace_id(), batch_id, now, now)
+        )
+        row = connection.execute(
+            'SELECT * FROM jobs WHERE id = ?',
+            (cursor.lastrowid,)
+        ).fetchone()
+        return StickerJob.from_row(row), True
+
+    def enqueue(
+            self,
+            supply_id: str,
+            order_ids: list[int],
+            chat_id: int,
+            seller: str
+    ) -> tuple[StickerJob, bool]:
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            job, is_new_job = self._enqueue(connection, supply_id, order_ids, chat_id, seller)
+            connection.execute('COMMIT')
+        return job, is_new_job
+
+    def enqueue_batch(
+            self,
+            supply_orders: dict[str, list[int]],
+            chat_id: int,
+            seller: str
+    ) -> list[tuple[StickerJob, bool]]:
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            batch_id = connection.execute(
+                'INSERT INTO batches (created_at, updated_at) VALUES (?, ?)',
+                (now, now)
+            ).lastrowid
+            jobs = [
+                self._enqueue(connection, supply_id, order_ids, chat_id, seller, batch_id)
+                for supply_id, order_ids in supply_orders.items()
+            ]
+            if not any(job.batch_id == batch_id for job, _ in jobs):
+                connection.execute('DELETE FROM batches WHERE id = ?', (batch_id,))
+            connection.execute('COMMIT')
+        return jobs
+
+    def get_batch_jobs(self, batch_id: int) -> list[StickerJob]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                'SELECT * FROM jobs WHERE batch_id = ? ORDER BY id',
+                (batch_id,)
+            ).fetchall()
+        return [StickerJob.from_row(row) for row in rows]
+
+    def get_batch_path(self, batch_id: int) -> str | None:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT path FROM batches WHERE id = ? AND status = 'ready'",
+                (batch_id,)
+            ).fetchone()
+        return row['path'] if row else None
+
+    def set_batch_ready(self, batch_id: int, path: str):
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "UPDATE batches SET status = 'ready', path = ?, updated_at = ? WHERE id = ?",
+                (path, time.time(), batch_id)
+            )
+
+    def fail_batch(self, batch_id: int, error: str):
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                "UPDATE batches SET status = 'failed', updated_at = ? WHERE id = ?",
+                (now, batch_id)
+            )
+            connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE batch_id = ? AND status = 'queued'",
+                (error, now, batch_id)
+            )
+            connection.execute('COMMIT')
+
+    def release_batch(self, batch_id: int, job_id: int) -> str | None:
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                "SELECT path, EXISTS (SELECT 1 FROM jobs WHERE batch_id = batches.id AND id != ? "
+                "AND status IN ('queued', 'running')) AS has_active_jobs FROM batches WHERE id = ?",
+                (job_id, batch_id)
+            ).fetchone()
+            if not row or row['has_active_jobs']:
+                connection.execute('COMMIT')
+                return
+            connection.execute('DELETE FROM batches WHERE id = ?', (batch_id,))
+            connection.execute('COMMIT')
+        return row['path']
+
+    @staticmethod
+    def _cancel_speculative(connection: sqlite3.Connection, seller: str, supply_id: str):
+        connection.execute(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? "
+            "WHERE seller = ? AND supply_id = ? AND speculative = 1 AND status IN ('queued', 'running', 'done')",
+            (time.time(), seller, supply_id)
+        )
+
+    def enqueue_speculative(self, supply_id: str, seller: str, delay: float = _PRERENDER_DELAY):
+        if not _PRERENDER_ENABLED:
+            return
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            cursor = connection.execute(
+                "UPDATE jobs SET not_before = ?, order_ids = '[]', job_key = ?, updated_at = ? "
+                "WHERE seller = ? AND supply_id = ? AND speculative = 1 AND status = 'queued'",
+                (now + delay, get_job_key(seller, supply_id, []), now, seller, supply_id)
+            )
+            if not cursor.rowcount:
+                self._cancel_speculative(connection, seller, supply_id)
+                connection.execute(
+                    'INSERT INTO jobs (job_key, supply_id, order_ids, chat_id, seller, speculative, not_before, '
+                    'created_at, updated_at) VALUES (?, ?, ?, 0, ?, 1, ?, ?, ?)',
+                    (get_job_key(seller, supply_id, []), supply_id, '[]', seller, now + delay, now, now)
+                )
+            connection.execute('COMMIT')
+
+    def set_orders(self, job_id: int, seller: str, supply_id: str, order_ids: list[int]):
+        self._update(
+            job_id,
+            order_ids=json.dumps(sorted(order_ids)),
+            job_key=get_job_key(seller, supply_id, order_ids)
+        )
+
+    def check_speculative(self, job_id: int) -> bool:
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT status, speculative, "
+                "EXISTS (SELECT 1 FROM jobs WHERE status = 'queued' AND speculative = 0) AS has_queued_jobs "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if not row or row['status'] == 'cancelled':
+            raise SpeculativeJobPreempted()
+        if not row['speculative']:
+            return False
+        if row['has_queued_jobs']:
+            raise SpeculativeJobPreempted()
+        return True
+
+    def preempt(self, job_id: int) -> list[str]:
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            rows = connection.execute(
+                'SELECT path FROM job_parts WHERE job_id = ? AND delivered = 0',
+                (job_id,)
+            ).fetchall()
+            connection.execute('DELETE FROM job_parts WHERE job_id = ? AND delivered = 0', (job_id,))
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', rendered = 0, updated_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+            job = connection.execute('SELECT seller, supply_id FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job:
+                connection.execute(
+                    "UPDATE jobs SET order_ids = '[]', job_key = ? "
+                    "WHERE id = ? AND speculative = 1 AND status = 'queued'",
+                    (get_job_key(job['seller'], job['supply_id'], []), job_id)
+                )
+            connection.execute('COMMIT')
+        return [row['path'] for row in rows]
+
+    def expire_speculative(self, max_age: float = _PRERENDER_TTL) -> list[str]:
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            job_ids = [
+                row['id']
+                for row in connection.execute(
+                    "SELECT id FROM jobs WHERE speculative = 1 AND (status IN ('cancelled', 'failed') "
+                    "OR status = 'done' AND updated_at < ?)",
+                    (time.time() - max_age,)
+                )
+            ]
+            placeholders = ', '.join('?' * len(job_ids))
+            rows = connection.execute(
+                f'SELECT path FROM job_parts WHERE job_id IN ({placeholders})',
+                job_ids
+            ).fetchall()
+            connection.execute(f'DELETE FROM job_parts WHERE job_id IN ({placeholders})', job_ids)
+            connection.execute(f'DELETE FROM jobs WHERE id IN ({placeholders})', job_ids)
+            connection.execute('COMMIT')
+        return [row['path'] for row in rows]
+
+    def claim_next(self, include_speculative: bool = True) -> StickerJob | None:
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND speculative <= ? AND not_before <= ? "
+                "AND (batch_id IS NULL OR batch_id IN (SELECT id FROM batches WHERE status IN ('pending', 'ready'))) "
+                'ORDER BY speculative, id LIMIT 1',
+                (int(include_speculative), time.time())
+            ).fetchone()
+            if not row:
+                connection.execute('COMMIT')
+                return
+            connection.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                (time.time(), row['id'])
+            )
+            cursor = connection.execute(
+                "UPDATE batches SET status = 'loading', updated_at = ? WHERE id = ? AND status = 'pending'",
+                (time.time(), row['batch_id'])
+            )
+            connection.execute('COMMIT')
+        job = StickerJob.from_row(row)
+        job.status = 'running'
+        job.is_batch_leader = bool(cursor.rowcount)
+        return job
+
+    def requeue_interrupted(self):
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "UPDATE batches SET status = 'pending', updated_at = ? WHERE status = 'loading'",
+                (time.time(),)
+            )
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', rendered = 0, updated_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+            connection.execute(
+                "DELETE FROM job_parts WHERE delivered = 0 AND job_id IN (SELECT id FROM jobs WHERE status = 'queued')"
+            )
+
+    def set_status_message(self, job_id: int, message_id: int):
+        self._update(job_id, status_message_id=message_id)
+
+    def set_progress(self, job_id: int, rendered: int, total: int):
+        self._update(job_id, rendered=rendered, total=total)
+
+    def set_reported(self, job_id: int, reported: int):
+        self._update(job_id, reported=reported)
+
+    @staticmethod
+    def _add_part(connection: sqlite3.Connection, job_id: int, part_number: int, path: str) -> bool:
+        cursor = connection.execute(
+            'INSERT INTO job_parts (job_id, part_number, path) VALUES (?, ?, ?) '
+            'ON CONFLICT (job_id, part_number) DO UPDATE SET path = excluded.path WHERE job_parts.delivered = 0',
+            (job_id, part_number, path)
+        )
+        return bool(cursor.rowcount)
+
+    def add_part(self, job_id: int, part_number: int, path: str) -> bool:
+        with closing(self._connect()) as connection:
+            return self._add_part(connection, job_id, part_number, path)
+
+    def finish(self, job_id: int, parts_total: int, last_part_path: str | None, timings: dict) -> bool:
+        with closing(self._connect()) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            is_part_added = bool(last_part_path) and self._add_part(connection, job_id, parts_total, last_part_path)
+            connection.execute(
+                "UPDATE jobs SET status = 'done', parts_total = ?, timings = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'running'",
+                (parts_total, json.dumps(timings), time.time(), job_id)
+            )
+            connection.execute('COMMIT')
+        return is_part_added
+
+    def get_undelivered_parts(self, job_id: int) -> list[tuple[int, str]]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                'SELECT part_number, path FROM job_parts WHERE job_id = ? AND delivered = 0 ORDER BY part_number',
+                (job_id,)
+            ).fetchall()
+        return [(row['part_number'], row['path']) for row in rows]
+
+    def mark_part_delivered(self, job_id: int, part_number: int):
+        with closing(self._connect()) as connection:
+            connection.execute(
+                'UPDATE job_parts SET delivered = 1 WHERE job_id = ? AND part_number = ?',
+                (job_id, part_number)
+            )
+
+    def fail(self, job_id: int, error: str):
+        self._update(job_id, status='failed', error=error)
+
+    def mark_delivered(self, job_id: int):
+        self._update(job_id, delivered=1)
+
+    def get_undelivered_jobs(self) -> list[StickerJob]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                'SELECT * FROM jobs WHERE delivered = 0 AND speculative = 0 ORDER BY id'
+            ).fetchall()
+        return [StickerJob.from_row(row) for row in rows]
+
+    def get_parts_prefix(self, job: StickerJob) -> str:
+        return os.path.join(self.results_dir, f'{job.id}_{job.supply_id}')
+
+
+def get_products(wb_api_client: WBApiClient, articles: set[str]) -> list[Product]:
+    products = {
+        product_card['vendorCode']: Product.parse_from_card(product_card)
+        for product_card in wb_api_client.get_products_by_articles(sorted(articles))
+        if product_card.get('vendorCode') in articles
+    }
+    return [products.get(article) or Product(article=article) for article in articles]
+
+
+def wait_for_capacity(queue: StickerJobQueue, job: StickerJob):
+    while queue.check_speculative(job.id) and is_machine_busy():
+        time.sleep(_PRERENDER_THROTTLE_DELAY)
+
+
+def get_job_orders(job: StickerJob, supply_orders: list[Order]) -> list[Order]:
+    order_ids = set(job.order_ids)
+    missing_order_ids = order_ids - {order.id for order in supply_orders}
+    if missing_order_ids:
+        raise JobOrdersMissing(
+            f'В поставке {job.supply_id} не найдены заказы: {", ".join(map(str, sorted(missing_order_ids)))}'
+        )
+    return [order for order in supply_orders if order.id in order_ids]
+
+
+def load_batch(queue: StickerJobQueue, batch_id: int, wb_api_client: WBApiClient) -> str:
+    jobs = queue.get_batch_jobs(batch_id)
+    supply_ids = sorted({job.supply_id for job in jobs})
+    supply_orders = dict(zip(supply_ids, run_concurrently(*[
+        partial(wb_api_client.fetch_supply_orders, supply_id)
+        for supply_id in supply_ids
+    ], executor=wb_api_client.fan_out_executor)))
+    order_ids = {order_id for job in jobs for order_id in job.order_ids}
+    orders = {
+        order.id: order
+        for orders in supply_orders.values()
+        for order in orders
+        if order.id in order_ids
+    }
+    order_qr_codes, products = run_concurrently(
+        partial(wb_api_client.fetch_qr_codes_for_orders, sorted(orders)),
+        partial(get_products, wb_api_client, {order.article for order in orders.values()}),
+        executor=wb_api_client.fan_out_executor
+    )
+    batch_path = os.path.join(queue.results_dir, f'batch_{batch_id}.pickle')
+    with open(batch_path, 'wb') as batch_file:
+        pickle.dump((supply_orders, order_qr_codes, products), batch_file)
+    queue.set_batch_ready(batch_id, batch_path)
+    return batch_path
+
+
+def get_batch_job_data(queue: StickerJobQueue, job: StickerJob, wb_api_client: WBApiClient) -> tuple | None:
+    if job.is_batch_leader:
+        try:
+            with span('load_batch', batch_id=job.batch_id):
+                batch_path = load_batch(queue, job.batch_id, wb_api_client)
+        except Exception as error:
+            queue.fail_batch(job.batch_id, f'{error.__class__.__name__}: {error}')
+            raise
+    else:
+        batch_path = queue.get_batch_path(job.batch_id)
+    try:
+        with open(batch_path, 'rb') as batch_file:
+            supply_orders, order_qr_codes, products = pickle.load(batch_file)
+    except (OSError, TypeError, pickle.UnpicklingError):
+        return
+    if job.supply_id not in supply_orders:
+        return
+    orders = get_job_orders(job, supply_orders[job.supply_id])
+    order_ids = {order.id for order in orders}
+    articles = {order.article for order in orders}
+    return (
+        orders,
+        [qr_code for qr_code in order_qr_codes if qr_code.order_id in order_ids],
+        [product for product in products if product.article in articles]
+    )
+
+
+def process_job(queue: StickerJobQueue, job: StickerJob, wb_api_client: WBApiClient):
+    try:
+        render_job(queue, job, wb_api_client)
+    except SpeculativeJobPreempted:
+        for part_path in queue.preempt(job.id):
+            with suppress(OSError):
+                os.remove(part_path)
+    finally:
+        if job.batch_id:
+            batch_path = queue.release_batch(job.batch_id, job.id)
+            if batch_path:
+                with suppress(OSError):
+                    os.remove(batch_path)
+
+
+def load_job_data(queue: StickerJobQueue, job: StickerJob, wb_api_client: WBApiClient, finish_stage) -> tuple:
+    supply_orders = wb_api_client.fetch_supply_orders(job.supply_id)
+    if job.speculative and not job.order_ids:
+        job.order_ids = [order.id for order in supply_orders]
+        queue.set_orders(job.id, job.seller, job.supply_id, job.order_ids)
+    orders = get_job_orders(job, supply_orders)
+    finish_stage('orders')
+    order_qr_codes, products = run_concurrently(
+        partial(wb_api_client.fetch_qr_codes_for_orders, [order.id for order in orders]),
+        partial(get_products, wb_api_client, set([order.article for order in orders])),
+        executor=wb_api_client.fan_out_executor
+    )
+    finish_stage('qr_codes_and_products')
+    return orders, order_qr_codes, products
+
+
+def render_job(queue: StickerJobQueue, job: StickerJob, wb_api_client: WBApiClient):
+    timings = {}
+    stage_started_at = time.monotonic()
+
+    def finish_stage(stage: str):
+        nonlocal stage_started_at
+        now = time.monotonic()
+        timings[stage] = now - stage_started_at
+        stage_started_at = now
+
+    job_data = get_batch_job_data(queue, job, wb_api_client) if job.batch_id else None
+    if job_data:
+        finish_stage('batch_data')
+    orders, order_qr_codes, products = job_data or load_job_data(queue, job, wb_api_client, finish_stage)
+
+    def on_article_rendered(rendered: int, total: int):
+        queue.set_progress(job.id, rendered, total)
+        if job.speculative:
+            wait_for_capacity(queue, job)
+
+    queue.set_progress(job.id, 0, len(set([order.article for order in orders])))
+    if job.speculative:
+        wait_for_capacity(queue, job)
+    if _STICKER_LAYOUT == 'sheet':
+        write_sticker_parts = stickers.write_orders_sticker_sheets
+    else:
+        write_sticker_parts = stickers.write_orders_sticker_parts
+    parts_total = 0
+    last_part_path = None
+    for part_path, is_last_part in write_sticker_parts(
+            orders,
+            products,
+            order_qr_codes,
+            queue.get_parts_prefix(job),
+            on_article_rendered=on_article_rendered
+    ):
+        parts_total += 1
+        if is_last_part:
+            last_part_path = part_path
+        elif not queue.add_part(job.id, parts_total, part_path):
+            os.remove(part_path)
+    finish_stage('render')
+    if not queue.finish(job.id, parts_total, last_part_path, timings) and last_part_path:
+        os.remove(last_part_path)
+
+
+def run_worker(db_path: str, results_dir: str, wb_tokens: list[str]):
+    queue = StickerJobQueue(db_path, results_dir)
+    wb_client_registry = WBClientRegistry()
+    for wb_token in wb_tokens:
+        wb_client_registry.register(wb_token)
+    while True:
+        job = queue.claim_next(include_speculative=not is_machine_busy())
+        if not job:
+            time.sleep(_WORKER_POLL_INTERVAL)
+            continue
+        wb_api_client = wb_client_registry.get_client(job.seller)
+        if not wb_api_client:
+            queue.fail(job.id, f'Неизвестный продавец {job.seller}')
+            continue
+        try:
+            with profile('stickers', job_id=job.id, supply_id=job.supply_id, orders_count=len(job.order_ids)), \
+                    span('sticker_job', trace_id=job.trace_id, job_id=job.id, supply_id=job.supply_id):
+                process_job(queue, job, wb_api_client)
+        except Exception as error:
+            queue.fail(job.id, f'{error.__class__.__name__}: {error}')
+
+
+@cache
+def get_sticker_job_queue() -> StickerJobQueue:
+    return StickerJobQueue()
@@ -1,23 +1,98 @@
+import hashlib
 import os
 import pathlib
 from base64 import b64decode
+from collections import defaultdict
+from contextlib import suppress
+from functools import cache
 from io import BytesIO
+from typing import Callable, Generator
 from zipfile import ZipFile, ZIP_DEFLATED
 
+import more_itertools
 from PIL import Image as PILImage
 from reportlab.graphics.barcode import code128
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 from reportlab.platypus import BaseDocTemplate, PageTemplate, NextPageTemplate
 from reportlab.platypus import Image, Frame, PageBreak
 from reportlab.platypus.para import Paragraph
 from reportlab.platypus.tables import Table
 
 import config
+from tracing import span
 from wb_api.classes import Order, Product, OrderQRCode, SupplyQRCode
 
+_STICKER_PART_SIZE = config.STICKER_PART_SIZE if hasattr(config, 'STICKER_PART_SIZE') else 45 * 1024 ** 2
+_SHEET_COLUMNS = config.STICKER_SHEET_COLUMNS if hasattr(config, 'STICKER_SHEET_COLUMNS') else 2
+_SHEET_ROWS = config.STICKER_SHEET_ROWS if hasattr(config, 'STICKER_SHEET_ROWS') else 4
+_SHEET_MARGIN = (config.STICKER_SHEET_MARGIN if hasattr(config, 'STICKER_SHEET_MARGIN') else 8) * mm
+_STICKER_SIZE = (120 * mm, 75 * mm)
+_CUT_MARK_GAP = 1.5 * mm
+_STICKER_CACHE_DIR = config.STICKER_CACHE_DIR if hasattr(config, 'STICKER_CACHE_DIR') else 'sticker_cache'
+_STICKER_CACHE_SIZE = config.STICKER_CACHE_SIZE if hasattr(config, 'STICKER_CACHE_SIZE') else 500 * 1024 ** 2
+_STICKER_CACHE_VERSION = 1
+
+
+class ArticleStickerCache:
+
+    def __init__(self, directory: str = _STICKER_CACHE_DIR, max_size: int = _STICKER_CACHE_SIZE):
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(product: Product, qr_codes: list[OrderQRCode]) -> str:
+        digest = hashlib.sha1(repr((
+            _STICKER_CACHE_VERSION,
+            product.article,
+            product.name,
+            product.barcode,
+            product.brand,
+            tuple(product.countries),
+            tuple(product.colors)
+        )).encode())
+        for qr_code in qr_codes:
+            digest.update(qr_code.file.encode())
+        return digest.hexdigest()
+
+    def get(self, product: Product, qr_codes: list[OrderQRCode]) -> BytesIO | None:
+        path = self.directory / f'{self.get_key(product, qr_codes)}.pdf'
+        with suppress(OSError):
+            sticker_file = BytesIO(path.read_bytes())
+            os.utime(path)
+            sticker_file.name = f'{product.article}.pdf'
+            return sticker_file
+
+    def set(self, product: Product, qr_codes: list[OrderQRCode], content: bytes):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{self.get_key(product, qr_codes)}.pdf'
+        temp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+        temp_path.write_bytes(content)
+        os.replace(temp_path, path)
+        self._trim()
+
+    def _trim(self):
+        sticker_files = []
+        for path in self.directory.glob('*.pdf'):
+            with suppress(OSError):
+                stat = path.stat()
+                sticker_files.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in sticker_files)
+        for _, size, path in sorted(sticker_files):
+            if total_size <= self.max_size:
+                break
+            with suppress(OSError):
+                path.unlink()
+            total_size -= size
+
+
+article_sticker_cache = ArticleStickerCache()
+
 
 def get_supply_sticker(supply_qr_code: SupplyQRCode) -> bytes:
     sticker_in_bytes = b64decode(
@@ -32,44 +107,220 @@ def get_supply_sticker(supply_qr_code: SupplyQRCode) -> bytes:
     return supply_sticker
 
 
-def get_orders_stickers(
+def group_qr_codes_by_article(
         orders: list[Order],
         products: list[Product],
-        qr_codes: list[OrderQRCode],
-        supply_id: str
-) -> BytesIO:
-    articles = set(order.article for order in orders)
-    sticker_files = []
-    for article in articles:
-        orders_with_same_article = [
-            order.id
-            for order in orders
-            if order.article == article
-        ]
-        product = next(
-            filter(
-                lambda p: p.article == article,
-                products
-            )
-        )
-        orders_qr_codes = [
-            qr_code
-            for qr_code in qr_codes
-            if qr_code.order_id in orders_with_same_article
-        ]
-        sticker_file = create_stickers_by_article(
-            product,
-            orders_qr_codes
+        qr_codes: list[OrderQRCode]
+) -> list[tuple[Product, list[OrderQRCode]]]:
+    products_by_article = {product.article: product for product in products}
+    qr_codes_by_order_id = {qr_code.order_id: qr_code for qr_code in qr_codes}
+    order_ids_by_article = defaultdict(list)
+    for order in orders:
+        order_ids_by_article[order.article].append(order.id)
+    return [
+        (
+            products_by_article[article],
+            [
+                qr_codes_by_order_id[order_id]
+                for order_id in order_ids_by_article[article]
+                if order_id in qr_codes_by_order_id
+            ]
         )
-        sticker_files.append(sticker_file)
+        for article in sorted(order_ids_by_article)
+    ]
+
+
+def iter_article_stickers(
+        orders: list[Order],
+        products: list[Product],
+        qr_codes: list[OrderQRCode],
+        on_article_rendered: Callable[[int, int], None] = None
+) -> Generator[BytesIO, None, None]:
+    articles = group_qr_codes_by_article(orders, products, qr_codes)
+    for rendered, (product, article_qr_codes) in enumerate(articles, start=1):
+        with span('render_article', article=product.article, stickers=len(article_qr_codes)) as article_span:
+            sticker_file = article_sticker_cache.get(product, article_qr_codes)
+            if article_span:
+                article_span.attributes['cached'] = sticker_file is not None
+            if sticker_file is None:
+                sticker_file = create_stickers_by_article(product, article_qr_codes)
+                article_sticker_cache.set(product, article_qr_codes, sticker_file.getvalue())
+        yield sticker_file
+        if on_article_rendered:
+            on_article_rendered(rendered, len(articles))
+
+
+def write_orders_sticker_parts(
+        orders: list[Order],
+        products: list[Product],
+        qr_codes: list[OrderQRCode],
+        path_prefix: str,
+        max_part_size: int = _STICKER_PART_SIZE,
+        on_article_rendered: Callable[[int, int], None] = None
+) -> Generator[tuple[str, bool], None, None]:
+    part_number = 0
+    part_path = None
+    archive = None
+    for sticker_file in iter_article_stickers(orders, products, qr_codes, on_article_rendered):
+        with sticker_file:
+            sticker_content = sticker_file.getvalue()
+        if archive and archive.fp.tell() + len(sticker_content) > max_part_size:
+            archive.close()
+            archive = None
+            yield part_path, False
+        if not archive:
+            part_number += 1
+            part_path = f'{path_prefix}_{part_number}.zip'
+            archive = ZipFile(part_path, 'w', ZIP_DEFLATED)
+        archive.writestr(sticker_file.name, sticker_content)
+    if archive:
+        archive.close()
+        yield part_path, True
+
+
+def _get_sheet_grid() -> tuple[float, float, float]:
+    page_width, page_height = A4
+    cell_width = (page_width - 2 * _SHEET_MARGIN) / _SHEET_COLUMNS
+    cell_height = (page_height - 2 * _SHEET_MARGIN) / _SHEET_ROWS
+    scale = min(cell_width / _STICKER_SIZE[0], cell_height / _STICKER_SIZE[1])
+    return cell_width, cell_height, scale
+
+
+def _draw_cut_marks(canvas: Canvas):
+    if _SHEET_MARGIN <= 2 * _CUT_MARK_GAP:
+        return
+    page_width, page_height = A4
+    cell_width, cell_height, _ = _get_sheet_grid()
+    canvas.saveState()
+    canvas.setLineWidth(0.25)
+    for column in range(_SHEET_COLUMNS + 1):
+        x = _SHEET_MARGIN + column * cell_width
+        canvas.line(x, _CUT_MARK_GAP, x, _SHEET_MARGIN - _CUT_MARK_GAP)
+        canvas.line(x, page_height - _SHEET_MARGIN + _CUT_MARK_GAP, x, page_height - _CUT_MARK_GAP)
+    for row in range(_SHEET_ROWS + 1):
+        y = _SHEET_MARGIN + row * cell_height
+        canvas.line(_CUT_MARK_GAP, y, _SHEET_MARGIN - _CUT_MARK_GAP, y)
+        canvas.line(page_width - _SHEET_MARGIN + _CUT_MARK_GAP, y, page_width - _CUT_MARK_GAP, y)
+    canvas.restoreState()
+
 
-    zip_file = BytesIO()
-    zip_file.name = f'Stickers for {supply_id}.zip'
-    with ZipFile(zip_file, 'a', ZIP_DEFLATED, False) as archive:
-        for sticker_file in sticker_files:
-            archive.writestr(sticker_file.name, sticker_file.getvalue())
-            sticker_file.close()
-    return zip_file
+def _move_to_cell(canvas: Canvas, cell: int):
+    cell_width, cell_height, scale = _get_sheet_grid()
+    column = cell % _SHEET_COLUMNS
+    row = cell // _SHEET_COLUMNS
+    x = _SHEET_MARGIN + column * cell_width + (cell_width - _STICKER_SIZE[0] * scale) / 2
+    y = A4[1] - _SHEET_MARGIN - (row + 1) * cell_height + (cell_height - _STICKER_SIZE[1] * scale) / 2
+    canvas.translate(x, y)
+    canvas.scale(scale, scale)
+
+
+def _draw_description(canvas: Canvas, product: Product, style: ParagraphStyle):
+    _draw_barcode(canvas, product)
+    frame_description = Frame(10 * mm, 5 * mm, 100 * mm, 40 * mm, topPadding=0)
+    frame_description.addFromList([_get_description_table(product, style)], canvas)
+
+
+def write_orders_sticker_sheets(
+        orders: list[Order],
+        products: list[Product],
+        qr_codes: list[OrderQRCode],
+        path_prefix: str,
+        max_part_size: int = _STICKER_PART_SIZE,
+        on_article_rendered: Callable[[int, int], None] = None
+) -> Generator[tuple[str, bool], None, None]:
+    articles = group_qr_codes_by_article(orders, products, qr_codes)
+    labels = [
+        (article_index, qr_code)
+        for article_index, (_, article_qr_codes) in enumerate(articles)
+        for qr_code in article_qr_codes
+    ]
+    pages = list(more_itertools.chunked(labels, max(1, _SHEET_COLUMNS * _SHEET_ROWS // 2)))
+    style = _get_description_style()
+    part_number = 0
+    part_path = None
+    part_size = 0
+    canvas = None
+    description_forms = set()
+    for page_number, page_labels in enumerate(pages, start=1):
+        qr_code_contents = [b64decode(qr_code.file, validate=True) for _, qr_code in page_labels]
+        page_size = sum(len(qr_code_content) for qr_code_content in qr_code_contents)
+        if canvas and part_size + page_size > max_part_size:
+            canvas.save()
+            canvas = None
+            yield part_path, False
+        if not canvas:
+            part_number += 1
+            part_path = f'{path_prefix}_{part_number}.pdf'
+            canvas = Canvas(part_path, pagesize=A4, pageCompression=1)
+            part_size = 0
+            description_forms = set()
+        part_size += page_size
+        with span('render_sheet', page=page_number, stickers=len(page_labels)):
+            for article_index in sorted({article_index for article_index, _ in page_labels} - description_forms):
+                canvas.beginForm(f'description_{article_index}', upperx=_STICKER_SIZE[0], uppery=_STICKER_SIZE[1])
+                _draw_description(canvas, articles[article_index][0], style)
+                canvas.endForm()
+                description_forms.add(article_index)
+            _draw_cut_marks(canvas)
+            for label_number, (article_index, _) in enumerate(page_labels):
+                canvas.saveState()
+                _move_to_cell(canvas, 2 * label_number)
+                canvas.drawImage(
+                    ImageReader(BytesIO(qr_code_contents[label_number])),
+                    (_STICKER_SIZE[0] - 95 * mm) / 2,
+                    _STICKER_SIZE[1] - 6 - 65 * mm,
+                    width=95 * mm,
+                    height=65 * mm
+                )
+                canvas.restoreState()
+                canvas.saveState()
+                _move_to_cell(canvas, 2 * label_number + 1)
+                canvas.doForm(f'description_{article_index}')
+                canvas.restoreState()
+            canvas.showPage()
+        if on_article_rendered:
+            rendered = pages[page_number][0][0] if page_number < len(pages) else len(articles)
+            on_article_rendered(rendered, len(articles))
+    if canvas:
+        canvas.save()
+        yield part_path, True
+
+
+@cache
+def _get_description_style() -> ParagraphStyle:
+    font_path = os.path.join(pathlib.Path(__file__).parent.resolve(), config.FONT_FILE)
+    pdfmetrics.registerFont(TTFont(config.FONT_NAME, font_path))
+    style = getSampleStyleSheet()['BodyText']
+    style.fontName = config.FONT_NAME
+    style.fontSize = 9.5
+    style.leading = 10
+    return style
+
+
+def _get_description_table(product: Product, style: ParagraphStyle) -> Table:
+    colors = ', '.join(product.colors)
+    countries = ', '.join(product.countries)
+    data = [
+        [Paragraph(product.name, style)],
+        [Paragraph(f'Артикул: {product.article}', style)],
+        [Paragraph(f'Страна: {countries}', style)],
+        [Paragraph(f'Бренд: {product.brand}', style)],
+    ]
+    if colors:
+        data.append([Paragraph(f'Цвет: {colors}', style)])
+    return Table(data, colWidths=[100 * mm])
+
+
+def _draw_barcode(canvas: Canvas, product: Product):
+    canvas.saveState()
+    barcode128 = code128.Code128(
+        product.barcode,
+        barHeight=50,
+        barWidth=1.45,
+        humanReadable=True
+    )
+    barcode128.drawOn(canvas, x=19.5 * mm, y=53 * mm)
+    canvas.restoreState()
 
 
 def create_stickers_by_article(
@@ -89,50 +340,27 @@ def create_stickers_by_article(
     pdf_file.name = f'{product.article}.pdf'
     pdf = BaseDocTemplate(pdf_file, showBoundary=0)
 
-    font_path = os.path.join(pathlib.Path(__file__).parent.resolve(), config.FONT_FILE)
-    pdfmetrics.registerFont(TTFont(config.FONT_NAME, font_path))
-    sticker_size = (120 * mm, 75 * mm)
-    style = getSampleStyleSheet()['BodyText']
-    style.fontName = config.FONT_NAME
-    style.fontSize = 9.5
-    style.leading = 10
-    frame_sticker = Frame(0, 0, *sticker_size)
+    style = _get_description_style()
+    frame_sticker = Frame(0, 0, *_STICKER_SIZE)
     frame_description = Frame(10 * mm, 5 * mm, 100 * mm, 40 * mm, topPadding=0)
 
     elements = []
     for qr_code in order_qr_code_files:
-        colors = ', '.join(product.colors)
-        countries = ', '.join(product.countries)
-        data = [
-            [Paragraph(product.name, style)],
-            [Paragraph(f'Артикул: {product.article}', style)],
-            [Paragraph(f'Страна: {countries}', style)],
-            [Paragraph(f'Бренд: {product.brand}', style)],
-        ]
-        if colors:
-            data.append([Paragraph(f'Цвет: {colors}', style)])
-
         elements.append(Image(qr_code, useDPI=300, width=95 * mm, height=65 * mm))
         elements.append(NextPageTemplate('Barcode'))
         elements.append(PageBreak())
-        elements.append(Table(data, colWidths=[100 * mm]))
+        elements.append(_get_description_table(product, style))
         elements.append(NextPageTemplate('Image'))
         elements.append(PageBreak())
 
-        def barcode(canvas, doc):
-            canvas.saveState()
-            barcode128 = code128.Code128(
-                product.barcode,
-                barHeight=50,
-                barWidth=1.45,
-                humanReadable=True
-            )
-            barcode128.drawOn(canvas, x=19.5 * mm, y=53 * mm)
-            canvas.restoreState()
-
         pdf.addPageTemplates(
-            [PageTemplate(id='Image', frames=frame_sticker, pagesize=sticker_size),
-             PageTemplate(id='Barcode', frames=frame_description, pagesize=sticker_size, onPage=barcode)]
+            [PageTemplate(id='Image', frames=frame_sticker, pagesize=_STICKER_SIZE),
+             PageTemplate(
+                 id='Barcode',
+                 frames=frame_description,
+                 pagesize=_STICKER_SIZE,
+                 onPage=lambda canvas, doc: _draw_barcode(canvas, product)
+             )]
         )
     pdf.build(elements)
     return pdf_file
@@ -0,0 +1,99 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+auto_assembly = pytest.importorskip('auto_assembly')
+
+_RULES = [
+    {'supply': 'Платья {date}', 'articles': ['dress']},
+    {'supply': 'Поставка {date}'}
+]
+
+
+def make_order(order_id: int, article: str, hour: int = 10) -> SimpleNamespace:
+    created_at = datetime.datetime(2024, 3, 1, hour).astimezone()
+    return SimpleNamespace(id=order_id, article=article, created_at=created_at)
+
+
+def get_order_ids(plan) -> dict[str, list[int]]:
+    return {supply_name: [order.id for order in orders] for supply_name, orders in plan.assignments.items()}
+
+
+class FakeClient:
+
+    def __init__(self, new_orders: list, supplies: list = ()):
+        self.seller_key = 'seller'
+        self.fan_out_executor = None
+        self.new_orders = new_orders
+        self.supplies = list(supplies)
+        self.added = []
+
+    def get_new_orders(self):
+        return self.new_orders
+
+    def get_supplies(self):
+        return self.supplies
+
+    def create_new_supply(self, supply_name: str) -> str:
+        supply_id = f'WB-{len(self.supplies) + 1}'
+        self.supplies.append(SimpleNamespace(id=supply_id, name=supply_name, is_done=False))
+        return supply_id
+
+    def add_order_to_supply(self, supply_id: str, order_id: int) -> int:
+        if order_id == 13:
+            return 0
+        self.added.append((supply_id, order_id))
+        return 1
+
+
+@pytest.fixture(autouse=True)
+def sticker_job_queue(monkeypatch):
+    queue = SimpleNamespace(speculative=[])
+    queue.enqueue_speculative = lambda supply_id, seller: queue.speculative.append(supply_id)
+    monkeypatch.setattr(auto_assembly, 'get_sticker_job_queue', lambda: queue)
+    return queue
+
+
+def test_assembly_date_moves_to_next_day_after_cutoff():
+    assert auto_assembly.get_assembly_date(make_order(1, 'a', hour=17), '16:00') == datetime.date(2024, 3, 2)
+    assert auto_assembly.get_assembly_date(make_order(1, 'a', hour=15), '16:00') == datetime.date(2024, 3, 1)
+    assert auto_assembly.get_assembly_date(make_order(1, 'a', hour=17), None) == datetime.date(2024, 3, 1)
+
+
+def test_first_matching_rule_names_supply():
+    assert auto_assembly.get_supply_name(make_order(1, 'dress'), _RULES).startswith('Платья ')
+    assert auto_assembly.get_supply_name(make_order(1, 'shirt'), _RULES).startswith('Поставка ')
+    assert auto_assembly.get_supply_name(make_order(1, 'shirt'), _RULES[:1]) is None
+
+
+def test_plan_uses_open_supplies_and_skips_unmatched_orders():
+    dress, shirt = make_order(1, 'dress'), make_order(2, 'shirt')
+    supply_name = auto_assembly.get_supply_name(dress, _RULES)
+    client = FakeClient(
+        [dress, shirt],
+        [SimpleNamespace(id='WB-open', name=supply_name, is_done=False)]
+    )
+    plan = auto_assembly.make_plan(client, _RULES[:1])
+    assert get_order_ids(plan) == {supply_name: [1]}
+    assert plan.supply_ids == {supply_name: 'WB-open'}
+    assert plan.skipped == [shirt]
+
+
+def test_approved_plan_assigns_only_approved_orders():
+    client = FakeClient([make_order(1, 'dress'), make_order(2, 'dress'), make_order(3, 'dress')])
+    plan = auto_assembly.make_plan(client, _RULES, approved_order_ids={'Платья': [1, 4], 'Другая': [2]})
+    assert plan.get_order_ids() == {'Другая': [2], 'Платья': [1]}
+    assert plan.outdated == [4]
+
+
+def test_execute_plan_creates_supplies_and_reports_failures(sticker_job_queue):
+    client = FakeClient([make_order(1, 'dress'), make_order(13, 'dress'), make_order(2, 'shirt')])
+    plan = auto_assembly.make_plan(client, _RULES)
+    report = auto_assembly.execute_plan(client, plan, batch_size=2)
+    dress_supply, shirt_supply = sorted(plan.assignments)
+    assert report.created_supplies == [dress_supply, shirt_supply]
+    assert report.assigned == {dress_supply: 1, shirt_supply: 1}
+    assert report.failed == [13]
+    assert sorted(client.added) == [(plan.supply_ids[dress_supply], 1), (plan.supply_ids[shirt_supply], 2)]
+    assert sticker_job_queue.speculative == [plan.supply_ids[dress_supply], plan.supply_ids[shirt_supply]]
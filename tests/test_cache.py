@@ -0,0 +1,194 @@
+from types import SimpleNamespace
+
+import pytest
+
+from wb_api.cache import FIFO, LRU, WBCache, cached, invalidates
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class FakeClient:
+
+    def __init__(self, cache: WBCache, seller_key: str = 'seller'):
+        self.cache = cache
+        self.seller_key = seller_key
+        self.order_status_ttl = 60
+        self.calls = []
+
+    @cached(ttl=30)
+    def get_supplies(self, quantity: int = 50) -> list[str]:
+        self.calls.append(('get_supplies', quantity))
+        return [f'supply_{number}' for number in range(quantity)]
+
+    @cached(ttl=30)
+    def get_supply_orders(self, supply_id: str) -> list[int]:
+        self.calls.append(('get_supply_orders', supply_id))
+        return [1, 2, 3]
+
+    @invalidates('get_supply_orders')
+    def add_order_to_supply(self, supply_id: str, order_id: int):
+        self.calls.append(('add_order_to_supply', supply_id, order_id))
+
+    def fetch_order_statuses(self, order_ids: list[int]) -> list[SimpleNamespace]:
+        self.calls.append(('fetch_order_statuses', order_ids))
+        return [SimpleNamespace(id=order_id, status='new') for order_id in order_ids]
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock: FakeClock) -> WBCache:
+    return WBCache(clock=clock)
+
+
+def get_value_size() -> int:
+    return WBCache.get_size('x' * 100)
+
+
+def test_entry_expires_after_ttl(cache: WBCache, clock: FakeClock):
+    cache.set('key', 'value', ttl=10)
+    clock.advance(9.9)
+    assert cache.get('key') == (True, 'value')
+    clock.advance(0.1)
+    assert cache.get('key') == (False, None)
+    assert not cache.contains('key')
+    assert cache.get_stats()['expirations'] == 1
+
+
+def test_lru_eviction_keeps_recently_read_entry(clock: FakeClock):
+    cache = WBCache(max_bytes=get_value_size() * 2, clock=clock)
+    cache.set('first', 'x' * 100, ttl=60, policy=LRU)
+    cache.set('second', 'x' * 100, ttl=60, policy=LRU)
+    cache.get('first')
+    cache.set('third', 'x' * 100, ttl=60, policy=LRU)
+    assert cache.contains('first')
+    assert not cache.contains('second')
+    assert cache.contains('third')
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_fifo_eviction_ignores_reads(clock: FakeClock):
+    cache = WBCache(max_bytes=get_value_size() * 2, clock=clock)
+    cache.set('first', 'x' * 100, ttl=60, policy=FIFO)
+    cache.set('second', 'x' * 100, ttl=60, policy=FIFO)
+    cache.get('first')
+    cache.set('third', 'x' * 100, ttl=60, policy=FIFO)
+    assert not cache.contains('first')
+    assert cache.contains('second')
+    assert cache.contains('third')
+
+
+def test_value_larger_than_budget_is_not_stored(clock: FakeClock):
+    cache = WBCache(max_bytes=get_value_size() - 1, clock=clock)
+    cache.set('key', 'x' * 100, ttl=60)
+    assert not cache.contains('key')
+    assert cache.get_stats()['size_bytes'] == 0
+
+
+def test_cached_method_is_called_once_until_ttl(cache: WBCache, clock: FakeClock):
+    client = FakeClient(cache)
+    assert client.get_supplies(quantity=2) == ['supply_0', 'supply_1']
+    client.get_supplies(quantity=2)
+    clock.advance(30)
+    client.get_supplies(quantity=2)
+    assert client.calls == [('get_supplies', 2), ('get_supplies', 2)]
+
+
+def test_cached_list_is_copied(cache: WBCache):
+    client = FakeClient(cache)
+    client.get_supply_orders('WB-1').append(4)
+    assert client.get_supply_orders('WB-1') == [1, 2, 3]
+
+
+def test_invalidate_drops_only_method_group(cache: WBCache):
+    client = FakeClient(cache)
+    client.get_supplies()
+    client.get_supply_orders('WB-1')
+    client.add_order_to_supply('WB-1', 4)
+    client.get_supplies()
+    client.get_supply_orders('WB-1')
+    assert client.calls == [
+        ('get_supplies', 50),
+        ('get_supply_orders', 'WB-1'),
+        ('add_order_to_supply', 'WB-1', 4),
+        ('get_supply_orders', 'WB-1')
+    ]
+    assert cache.get_stats()['invalidations'] == 1
+
+
+def test_invalidate_is_per_seller(cache: WBCache):
+    client = FakeClient(cache)
+    other_client = FakeClient(cache, seller_key='other_seller')
+    client.get_supply_orders('WB-1')
+    other_client.get_supply_orders('WB-1')
+    client.add_order_to_supply('WB-1', 4)
+    other_client.get_supply_orders('WB-1')
+    assert other_client.calls == [('get_supply_orders', 'WB-1')]
+
+
+def test_order_statuses_are_cached_per_order(cache: WBCache, clock: FakeClock):
+    client_module = pytest.importorskip('wb_api.client')
+    client = FakeClient(cache)
+    get_order_statuses = client_module.WBApiClient.get_order_statuses
+
+    assert set(get_order_statuses(client, [1, 2])) == {1, 2}
+    assert set(get_order_statuses(client, [2, 3])) == {2, 3}
+    clock.advance(60)
+    get_order_statuses(client, [1])
+    cache.invalidate((client.seller_key, 'get_order_statuses'))
+    get_order_statuses(client, [3])
+    assert client.calls == [
+        ('fetch_order_statuses', [1, 2]),
+        ('fetch_order_statuses', [3]),
+        ('fetch_order_statuses', [1]),
+        ('fetch_order_statuses', [3])
+    ]
+
+
+def test_stats_count_hits_misses_and_size(cache: WBCache, clock: FakeClock):
+    cache.set('first', 'value', ttl=10)
+    cache.set('second', 'value', ttl=20)
+    cache.get('first')
+    cache.get('missing')
+    clock.advance(10)
+    cache.get('first')
+    cache.invalidate(None)
+    assert cache.get_stats() == {
+        'entries': 0,
+        'size_bytes': 0,
+        'max_bytes': cache.max_bytes,
+        'hits': 1,
+        'misses': 2,
+        'evictions': 0,
+        'expirations': 1,
+        'invalidations': 1
+    }
+
+
+def test_registry_gives_each_seller_own_cache_and_fan_out_pool():
+    registry = pytest.importorskip('wb_api.registry').WBClientRegistry()
+    first_client = registry.register('first_token', [1])
+    second_client = registry.register('second_token', [2])
+    assert registry.register('first_token') is first_client
+    assert first_client.cache is not second_client.cache
+    assert first_client.fan_out_executor is not second_client.fan_out_executor
+
+    first_client.cache.set('supplies', 'x' * 100, ttl=30)
+    first_client.cache.set('orders', 'x' * 100, ttl=30)
+    second_client.cache.get('supplies')
+    stats = registry.get_cache_stats()
+    assert (stats['entries'], stats['misses']) == (2, 1)
+    assert stats['max_bytes'] == first_client.cache.max_bytes + second_client.cache.max_bytes
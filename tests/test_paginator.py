@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+paginator = pytest.importorskip('paginator')
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(paginator, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_views_are_stored_per_message(clock):
+    view_cache = paginator.ViewCache(ttl=300)
+    view_cache.set(1, 10, {'new_orders': ['order']})
+    view_cache.set(1, 10, {'supply_WB-1': ['supply']})
+    assert view_cache.get(1, 10, 'new_orders') == ['order']
+    assert view_cache.get(1, 10, 'supply_WB-1') == ['supply']
+    assert view_cache.get(1, 11, 'new_orders') is None
+    assert view_cache.get(2, 10, 'new_orders') is None
+
+
+def test_views_expire_after_ttl(clock):
+    view_cache = paginator.ViewCache(ttl=300)
+    view_cache.set(1, 10, {'new_orders': ['order']})
+    clock.now = 300
+    assert view_cache.get(1, 10, 'new_orders') == ['order']
+    clock.now = 300.1
+    assert view_cache.get(1, 10, 'new_orders') is None
+
+
+def test_views_are_carried_to_new_message(clock):
+    view_cache = paginator.ViewCache(ttl=300)
+    view_cache.set(1, 10, {'new_orders': ['order']})
+    view_cache.carry(1, 10, 11)
+    view_cache.set(1, 11, {'order_5': ['details']})
+    assert view_cache.get(1, 11, 'new_orders') == ['order']
+    assert view_cache.get(1, 11, 'order_5') == ['details']
+
+
+def test_least_recently_used_message_is_evicted(clock):
+    view_cache = paginator.ViewCache(ttl=300, max_size=2)
+    view_cache.set(1, 10, {'view': 10})
+    view_cache.set(1, 11, {'view': 11})
+    view_cache.get(1, 10, 'view')
+    view_cache.set(1, 12, {'view': 12})
+    assert view_cache.get(1, 10, 'view') == 10
+    assert view_cache.get(1, 11, 'view') is None
+    assert view_cache.get(1, 12, 'view') == 12
+
+
+def test_clear_drops_all_views(clock):
+    view_cache = paginator.ViewCache(ttl=300)
+    view_cache.set(1, 10, {'view': 10})
+    view_cache.clear()
+    assert view_cache.get(1, 10, 'view') is None
+
+
+@pytest.mark.parametrize('page_number, items_count, clamped_page_number', [
+    (-1, 25, 0),
+    (1, 25, 1),
+    (5, 25, 2),
+    (3, 0, 0)
+])
+def test_clamp_page_number(page_number: int, items_count: int, clamped_page_number: int):
+    assert paginator.clamp_page_number(page_number, items_count, page_size=10) == clamped_page_number
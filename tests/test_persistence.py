@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+persistence = pytest.importorskip('persistence')
+
+
+def test_only_light_keys_are_persisted(tmp_path):
+    filename = str(tmp_path / 'bot_data.pickle')
+    bot_persistence = persistence.CompactPicklePersistence(filename)
+    bot_persistence.update_user_data(1, {'state': 'HANDLE_SUPPLY', 'current_supply': 'WB-1', 'orders': [1, 2]})
+    bot_persistence.update_chat_data(1, {'message_to_delete': [10], 'qr_codes': [b'png']})
+    bot_persistence.flush()
+
+    restored = persistence.CompactPicklePersistence(filename)
+    assert restored.get_user_data()[1] == {'state': 'HANDLE_SUPPLY', 'current_supply': 'WB-1'}
+    assert restored.get_chat_data()[1] == {'message_to_delete': [10]}
+
+
+def test_flush_while_updates_arrive(tmp_path):
+    bot_persistence = persistence.CompactPicklePersistence(str(tmp_path / 'bot_data.pickle'))
+    bot_persistence.update_user_data(0, {'state': 'START'})
+    stop_event = threading.Event()
+
+    def update_users():
+        user_id = 0
+        while not stop_event.is_set():
+            user_id += 1
+            bot_persistence.update_user_data(user_id, {'state': 'START'})
+
+    updater = threading.Thread(target=update_users)
+    updater.start()
+    try:
+        for _ in range(50):
+            bot_persistence.flush()
+    finally:
+        stop_event.set()
+        updater.join()
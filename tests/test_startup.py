@@ -0,0 +1,38 @@
+import importlib.util
+
+import pytest
+
+from startup_report import get_eagerly_imported, get_total_time, measure_import_times
+
+_STARTUP_BUDGET = 1.5
+_BOT_DEPENDENCIES = ('config', 'environs', 'telegram', 'requests', 'pydantic', 'more_itertools')
+
+requires_bot_dependencies = pytest.mark.skipif(
+    any(importlib.util.find_spec(module) is None for module in _BOT_DEPENDENCIES),
+    reason='не установлены зависимости бота или нет config.py'
+)
+
+
+@pytest.fixture(scope='module')
+def bot_import_times():
+    return measure_import_times('bot')
+
+
+@requires_bot_dependencies
+def test_bot_import_fits_budget(bot_import_times):
+    assert get_total_time(bot_import_times, 'bot') <= _STARTUP_BUDGET
+
+
+@requires_bot_dependencies
+def test_sticker_modules_are_not_imported_at_startup(bot_import_times):
+    assert get_eagerly_imported(bot_import_times) == []
+
+
+def test_eagerly_imported_detects_sticker_modules():
+    import_times = [
+        ('bot', 0, 100, 1000),
+        ('stickers', 1, 50, 500),
+        ('reportlab.pdfgen', 2, 300, 300)
+    ]
+    assert get_eagerly_imported(import_times) == ['reportlab', 'stickers']
+    assert get_total_time(import_times, 'bot') == 0.001
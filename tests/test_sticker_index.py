@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+sticker_index = pytest.importorskip('sticker_index')
+
+
+@pytest.fixture
+def index():
+    index = sticker_index.StickerIndex()
+    index.update_supplies([
+        SimpleNamespace(id='WB-GI-1001', name='Платья март'),
+        SimpleNamespace(id='WB-GI-2002', name='Рубашки')
+    ])
+    index.update_supply(
+        'WB-GI-1001',
+        [SimpleNamespace(id=501, article='Dress-1'), SimpleNamespace(id=502, article='Dress-2')],
+        [SimpleNamespace(order_id=501, part_a='1234567', part_b='8901')]
+    )
+    index.update_supply('WB-GI-2002', [SimpleNamespace(id=601, article='Shirt-1')])
+    return index
+
+
+def get_keys(results: list) -> list[tuple[str, str]]:
+    return [(result.kind, result.key) for result in results]
+
+
+def test_search_finds_supplies_by_name_word_and_id(index):
+    assert get_keys(index.search('март')) == [('supply', 'WB-GI-1001')]
+    assert get_keys(index.search('wb-gi-2')) == [('supply', 'WB-GI-2002')]
+
+
+def test_search_finds_orders_by_prefix_and_sticker_number(index):
+    assert get_keys(index.search('50')) == [('order', '501'), ('order', '502')]
+    assert get_keys(index.search('1234567 8901')) == [('order', '501')]
+
+
+def test_search_finds_articles_case_insensitively(index):
+    results = index.search('DRESS')
+    assert get_keys(results) == [('article', 'dress-1'), ('article', 'dress-2')]
+    assert results[0].supply_ids == ['WB-GI-1001']
+
+
+def test_search_respects_limit(index):
+    assert len(index.search('50', limit=1)) == 1
+
+
+def test_moved_and_removed_orders_are_reindexed(index):
+    index.move_order(502, 'WB-GI-2002')
+    assert index.find_order('502') == (502, 'WB-GI-2002')
+    index.update_supply('WB-GI-2002', [])
+    assert index.search('shirt') == []
+    assert index.find_order('601') is None
+
+
+def test_removed_order_sticker_number_is_unindexed(index):
+    index.update_supply('WB-GI-1001', [SimpleNamespace(id=502, article='Dress-2')])
+    assert index.search('1234567') == []
+    assert index.find_order('1234567-8901') is None
+    assert '12345678901' not in index._sorted_terms
+    assert '12345678901' not in index._sticker_orders
+
+
+def test_find_order_by_sticker_number(index):
+    assert index.find_order('1234567-8901') == (501, 'WB-GI-1001')
+    assert index.find_order('Dress-1') is None
+    assert index.find_supplies_by_article(' dress-1 ') == ['WB-GI-1001']
+
+
+@pytest.mark.parametrize('query, is_order_query', [
+    ('1234567 8901', True),
+    ('501', True),
+    ('Dress-1', True),
+    ('привет', False),
+    ('dress', False),
+    ('платье 1', False),
+    ('', False)
+])
+def test_is_order_query(query: str, is_order_query: bool):
+    assert sticker_index.is_order_query(query) == is_order_query
@@ -0,0 +1,226 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+sticker_queue = pytest.importorskip('sticker_queue')
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return sticker_queue.StickerJobQueue(str(tmp_path / 'jobs.sqlite3'), str(tmp_path / 'results'))
+
+
+def claim_speculative(queue) -> 'sticker_queue.StickerJob':
+    queue.enqueue_speculative('WB-1', 'seller', delay=0)
+    job = queue.claim_next()
+    queue.set_orders(job.id, 'seller', 'WB-1', [1, 2])
+    return job
+
+
+def test_speculative_job_waits_for_delay(queue):
+    queue.enqueue_speculative('WB-1', 'seller', delay=60)
+    assert queue.claim_next() is None
+
+
+def test_speculative_enqueue_is_debounced(queue):
+    queue.enqueue_speculative('WB-1', 'seller', delay=60)
+    queue.enqueue_speculative('WB-1', 'seller', delay=0)
+    job = queue.claim_next()
+    assert job.speculative
+    assert queue.claim_next() is None
+
+
+def test_speculative_jobs_are_not_claimed_when_busy(queue):
+    queue.enqueue_speculative('WB-1', 'seller', delay=0)
+    assert queue.claim_next(include_speculative=False) is None
+
+
+def test_enqueue_adopts_finished_speculative_job(queue):
+    job = claim_speculative(queue)
+    queue.finish(job.id, 1, None, {})
+    adopted_job, is_new_job = queue.enqueue('WB-1', [2, 1], chat_id=100, seller='seller')
+    assert is_new_job
+    assert adopted_job.id == job.id
+    assert adopted_job.status == 'done'
+    assert not adopted_job.speculative
+    assert adopted_job.chat_id == 100
+
+
+def test_enqueue_with_other_orders_cancels_speculative_job(queue):
+    job = claim_speculative(queue)
+    new_job, is_new_job = queue.enqueue('WB-1', [1, 2, 3], chat_id=100, seller='seller')
+    assert is_new_job
+    assert new_job.id != job.id
+    with pytest.raises(sticker_queue.SpeculativeJobPreempted):
+        queue.check_speculative(job.id)
+
+
+def test_regular_job_preempts_running_speculative_job(queue, tmp_path):
+    job = claim_speculative(queue)
+    part_path = tmp_path / 'part.zip'
+    part_path.write_bytes(b'')
+    queue.add_part(job.id, 1, str(part_path))
+    assert queue.check_speculative(job.id)
+    queue.enqueue('WB-2', [3], chat_id=100, seller='seller')
+    with pytest.raises(sticker_queue.SpeculativeJobPreempted):
+        queue.check_speculative(job.id)
+    assert queue.preempt(job.id) == [str(part_path)]
+    assert queue.claim_next().supply_id == 'WB-2'
+    assert queue.claim_next().id == job.id
+
+
+def test_finish_ignores_preempted_job(queue):
+    job = claim_speculative(queue)
+    queue.preempt(job.id)
+    queue.finish(job.id, 1, None, {})
+    assert queue.claim_next().id == job.id
+
+
+def test_expired_speculative_jobs_are_removed(queue, tmp_path):
+    job = claim_speculative(queue)
+    part_path = str(tmp_path / 'part.zip')
+    queue.finish(job.id, 1, part_path, {})
+    assert queue.expire_speculative(max_age=60) == []
+    time.sleep(0.01)
+    assert queue.expire_speculative(max_age=0) == [part_path]
+    assert queue.enqueue('WB-1', [1, 2], chat_id=100, seller='seller')[0].id != job.id
+
+
+class FakeWBClient:
+
+    def __init__(self, supply_orders: dict, fail: bool = False):
+        self.supply_orders = supply_orders
+        self.fail = fail
+        self.fan_out_executor = None
+        self.calls = []
+
+    def fetch_supply_orders(self, supply_id: str) -> list:
+        self.calls.append(('fetch_supply_orders', supply_id))
+        if self.fail:
+            raise RuntimeError('WB API недоступно')
+        return self.supply_orders[supply_id]
+
+    def fetch_qr_codes_for_orders(self, order_ids: list[int]) -> list:
+        self.calls.append(('fetch_qr_codes_for_orders', tuple(order_ids)))
+        return [SimpleNamespace(order_id=order_id) for order_id in order_ids]
+
+    def get_products_by_articles(self, articles: list[str]) -> list[dict]:
+        self.calls.append(('get_products_by_articles', tuple(articles)))
+        return [
+            {'vendorCode': article, 'characteristics': [], 'sizes': [{'skus': ['2000000000011']}]}
+            for article in articles
+        ]
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    rendered = {}
+
+    def write_sticker_parts(orders, products, qr_codes, path_prefix, on_article_rendered):
+        rendered[path_prefix.rsplit('_', maxsplit=1)[-1]] = (
+            [order.id for order in orders],
+            sorted(product.article for product in products),
+            sorted(qr_code.order_id for qr_code in qr_codes)
+        )
+        part_path = f'{path_prefix}_1.zip'
+        open(part_path, 'wb').close()
+        yield part_path, True
+
+    monkeypatch.setattr(sticker_queue, '_STICKER_LAYOUT', 'labels')
+    monkeypatch.setattr(
+        sticker_queue,
+        'stickers',
+        SimpleNamespace(write_orders_sticker_parts=write_sticker_parts)
+    )
+    return rendered
+
+
+def make_supply_orders() -> dict:
+    return {
+        'WB-1': [SimpleNamespace(id=1, article='a'), SimpleNamespace(id=2, article='b')],
+        'WB-2': [SimpleNamespace(id=3, article='a'), SimpleNamespace(id=4, article='c')]
+    }
+
+
+def test_batch_shares_lookups_between_supplies(queue, rendered, tmp_path):
+    client = FakeWBClient(make_supply_orders())
+    jobs = queue.enqueue_batch({'WB-1': [1, 2], 'WB-2': [3]}, chat_id=100, seller='seller')
+    assert [is_new_job for _, is_new_job in jobs] == [True, True]
+
+    leader_job = queue.claim_next()
+    assert leader_job.is_batch_leader
+    assert queue.claim_next() is None
+    sticker_queue.process_job(queue, leader_job, client)
+    job = queue.claim_next()
+    assert not job.is_batch_leader
+    sticker_queue.process_job(queue, job, client)
+
+    assert sorted(client.calls) == [
+        ('fetch_qr_codes_for_orders', (1, 2, 3)),
+        ('fetch_supply_orders', 'WB-1'),
+        ('fetch_supply_orders', 'WB-2'),
+        ('get_products_by_articles', ('a', 'b'))
+    ]
+    assert rendered == {
+        'WB-1': ([1, 2], ['a', 'b'], [1, 2]),
+        'WB-2': ([3], ['a'], [3])
+    }
+    assert [job.status for job in queue.get_batch_jobs(leader_job.batch_id)] == ['done', 'done']
+    assert not list((tmp_path / 'results').glob('batch_*'))
+
+
+def test_batch_reuses_running_job_for_same_supply(queue):
+    job, _ = queue.enqueue('WB-1', [1, 2], chat_id=100, seller='seller')
+    jobs = queue.enqueue_batch({'WB-1': [1, 2], 'WB-2': [3]}, chat_id=100, seller='seller')
+    assert [(batch_job.id == job.id, is_new_job) for batch_job, is_new_job in jobs] == [(True, False), (False, True)]
+
+
+def test_failed_batch_load_fails_all_jobs(queue, rendered):
+    client = FakeWBClient(make_supply_orders(), fail=True)
+    queue.enqueue_batch({'WB-1': [1, 2], 'WB-2': [3]}, chat_id=100, seller='seller')
+    leader_job = queue.claim_next()
+    with pytest.raises(RuntimeError):
+        sticker_queue.process_job(queue, leader_job, client)
+    queue.fail(leader_job.id, 'RuntimeError')
+    assert [job.status for job in queue.get_batch_jobs(leader_job.batch_id)] == ['failed', 'failed']
+    assert queue.claim_next() is None
+    assert rendered == {}
+
+
+def test_missing_orders_fail_the_job(queue, rendered):
+    client = FakeWBClient(make_supply_orders())
+    queue.enqueue('WB-1', [1, 2, 5], chat_id=100, seller='seller')
+    job = queue.claim_next()
+    with pytest.raises(sticker_queue.JobOrdersMissing, match='5'):
+        sticker_queue.process_job(queue, job, client)
+    assert rendered == {}
+
+
+def test_preempted_job_reloads_supply_orders(queue, rendered, monkeypatch):
+    monkeypatch.setattr(sticker_queue, 'is_machine_busy', lambda: False)
+    supply_orders = make_supply_orders()
+    client = FakeWBClient(supply_orders)
+    queue.enqueue_speculative('WB-1', 'seller', delay=0)
+    job = queue.claim_next()
+    sticker_queue.load_job_data(queue, job, client, lambda stage: None)
+    queue.enqueue('WB-2', [3], chat_id=100, seller='seller')
+    queue.preempt(job.id)
+
+    supply_orders['WB-1'].append(SimpleNamespace(id=5, article='c'))
+    sticker_queue.process_job(queue, queue.claim_next(), client)
+    job = queue.claim_next()
+    assert job.order_ids == []
+    sticker_queue.process_job(queue, job, client)
+    assert rendered['WB-1'] == ([1, 2, 5], ['a', 'b', 'c'], [1, 2, 5])
+    adopted_job, is_new_job = queue.enqueue('WB-1', [1, 2, 5], chat_id=100, seller='seller')
+    assert (adopted_job.id, is_new_job) == (job.id, True)
+
+
+def test_interrupted_batch_load_is_restarted(queue):
+    queue.enqueue_batch({'WB-1': [1, 2], 'WB-2': [3]}, chat_id=100, seller='seller')
+    leader_job = queue.claim_next()
+    queue.requeue_interrupted()
+    job = queue.claim_next()
+    assert job.id == leader_job.id
+    assert job.is_batch_leader
@@ -0,0 +1,74 @@
+from base64 import b64encode
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+
+stickers = pytest.importorskip('stickers')
+PILImage = pytest.importorskip('PIL.Image')
+
+from wb_api.classes import Product
+
+
+def make_qr_code(order_id: int) -> SimpleNamespace:
+    file = BytesIO()
+    PILImage.new('RGB', (58, 40), 'white').save(file, format='PNG')
+    return SimpleNamespace(
+        order_id=order_id,
+        file=b64encode(file.getvalue()).decode(),
+        part_a='1234567',
+        part_b=str(order_id)
+    )
+
+
+@pytest.fixture
+def supply():
+    orders = [
+        SimpleNamespace(id=1, article='b'),
+        SimpleNamespace(id=2, article='a'),
+        SimpleNamespace(id=3, article='b'),
+        SimpleNamespace(id=4, article='a'),
+        SimpleNamespace(id=5, article='a')
+    ]
+    products = [Product(article='a', barcode='2000000000011'), Product(article='b', barcode='2000000000028')]
+    qr_codes = [make_qr_code(order.id) for order in orders]
+    return orders, products, qr_codes
+
+
+def test_qr_codes_are_grouped_by_sorted_article(supply):
+    orders, products, qr_codes = supply
+    groups = stickers.group_qr_codes_by_article(orders, products, qr_codes[:-1])
+    assert [
+        (product.article, [qr_code.order_id for qr_code in article_qr_codes])
+        for product, article_qr_codes in groups
+    ] == [
+        ('a', [2, 4]),
+        ('b', [1, 3])
+    ]
+
+
+def test_sheets_are_written_in_one_part(supply, tmp_path):
+    orders, products, qr_codes = supply
+    rendered = []
+    parts = list(stickers.write_orders_sticker_sheets(
+        orders,
+        products,
+        qr_codes,
+        str(tmp_path / 'supply'),
+        on_article_rendered=lambda rendered_count, total: rendered.append((rendered_count, total))
+    ))
+    assert parts == [(str(tmp_path / 'supply_1.pdf'), True)]
+    assert (tmp_path / 'supply_1.pdf').read_bytes().startswith(b'%PDF')
+    assert rendered[-1] == (2, 2)
+
+
+def test_sheets_are_split_into_parts_by_size(supply, tmp_path):
+    orders, products, qr_codes = supply
+    parts = list(stickers.write_orders_sticker_sheets(
+        orders,
+        products,
+        qr_codes,
+        str(tmp_path / 'supply'),
+        max_part_size=1
+    ))
+    assert parts == [(str(tmp_path / 'supply_1.pdf'), False), (str(tmp_path / 'supply_2.pdf'), True)]
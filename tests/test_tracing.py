@@ -0,0 +1,87 @@
+import json
+import logging
+
+import pytest
+
+from trace_report import get_trace_duration, iter_waterfall, load_spans
+
+
+def make_span(span_id: str, parent_id: str | None, name: str, started_at: float, duration: float) -> dict:
+    return {
+        'trace_id': 'trace',
+        'span_id': span_id,
+        'parent_id': parent_id,
+        'name': name,
+        'started_at': started_at,
+        'duration': duration,
+        'attributes': {},
+        'error': None
+    }
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(json.loads(record.getMessage()))
+
+
+def test_waterfall_orders_children_by_start_time():
+    spans = [
+        make_span('root', None, 'update', 0.0, 1.0),
+        make_span('second', 'root', 'http', 0.5, 0.2),
+        make_span('first', 'root', 'http', 0.1, 0.3),
+        make_span('nested', 'first', 'wb_api', 0.1, 0.1)
+    ]
+    assert [(span['span_id'], depth) for span, depth in iter_waterfall(spans)] == [
+        ('root', 0),
+        ('first', 1),
+        ('nested', 2),
+        ('second', 1)
+    ]
+
+
+def test_waterfall_treats_spans_with_unknown_parent_as_roots():
+    spans = [make_span('job', 'span_from_other_process', 'sticker_job', 0.0, 1.0)]
+    assert [depth for _, depth in iter_waterfall(spans)] == [0]
+
+
+def test_trace_duration_covers_all_spans():
+    spans = [
+        make_span('root', None, 'update', 10.0, 1.0),
+        make_span('job', 'root', 'sticker_job', 10.5, 2.0)
+    ]
+    assert get_trace_duration(spans) == 2.5
+
+
+def test_load_spans_groups_by_trace_and_skips_broken_lines(tmp_path):
+    span = make_span('root', None, 'update', 0.0, 1.0)
+    (tmp_path / 'MainProcess.jsonl').write_text(f'{json.dumps(span)}\n{{broken\n', encoding='utf-8')
+    assert load_spans(str(tmp_path)) == {'trace': [span]}
+
+
+def test_span_nests_and_continues_trace(monkeypatch):
+    tracing = pytest.importorskip('tracing')
+    handler = ListHandler()
+    logger = logging.getLogger('test_tracing')
+    logger.addHandler(handler)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    monkeypatch.setattr(tracing, '_TRACING_ENABLED', True)
+    monkeypatch.setattr(tracing, '_trace_logger', logger)
+
+    with tracing.span('update', state='START') as root_span:
+        with tracing.span('http', method='GET'):
+            assert tracing.get_trace_id() == root_span.trace_id
+    with tracing.span('sticker_job', trace_id=root_span.trace_id):
+        pass
+
+    http_span, update_span, job_span = handler.records
+    assert http_span['parent_id'] == update_span['span_id']
+    assert http_span['attributes'] == {'method': 'GET', 'index': 0}
+    assert job_span['trace_id'] == update_span['trace_id']
+    assert job_span['parent_id'] is None
+    assert tracing.get_trace_id() is None
@@ -0,0 +1,95 @@
+import argparse
+import json
+import pathlib
+import sys
+from collections import defaultdict
+
+_BAR_WIDTH = 40
+
+
+def load_spans(traces_dir: str) -> dict[str, list[dict]]:
+    traces = defaultdict(list)
+    for path in sorted(pathlib.Path(traces_dir).glob('*.jsonl*')):
+        with open(path, encoding='utf-8') as traces_file:
+            for line in traces_file:
+                try:
+                    span = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                traces[span['trace_id']].append(span)
+    return traces
+
+
+def get_trace_duration(spans: list[dict]) -> float:
+    started_at = min(span['started_at'] for span in spans)
+    return max(span['started_at'] + span['duration'] for span in spans) - started_at
+
+
+def iter_waterfall(spans: list[dict]):
+    span_ids = {span['span_id'] for span in spans}
+    children = defaultdict(list)
+    for span in spans:
+        parent_id = span['parent_id'] if span['parent_id'] in span_ids else None
+        children[parent_id].append(span)
+
+    def walk(parent_id: str | None, depth: int):
+        for span in sorted(children[parent_id], key=lambda span: span['started_at']):
+            yield span, depth
+            yield from walk(span['span_id'], depth + 1)
+
+    yield from walk(None, 0)
+
+
+def print_trace(trace_id: str, spans: list[dict]):
+    started_at = min(span['started_at'] for span in spans)
+    trace_duration = get_trace_duration(spans) or 1e-6
+    print(f'Трассировка {trace_id}: {trace_duration * 1000:.1f} мс, операций: {len(spans)}\n')
+    for span, depth in iter_waterfall(spans):
+        offset = span['started_at'] - started_at
+        bar_start = int(offset / trace_duration * _BAR_WIDTH)
+        bar_length = max(1, round(span['duration'] / trace_duration * _BAR_WIDTH))
+        bar = (' ' * bar_start + '█' * bar_length)[:_BAR_WIDTH].ljust(_BAR_WIDTH)
+        attributes = ' '.join(f'{key}={value}' for key, value in span['attributes'].items())
+        error = f' ОШИБКА: {span["error"]}' if span['error'] else ''
+        print(
+            f'{offset * 1000:9.1f} {span["duration"] * 1000:9.1f} |{bar}| '
+            f'{"  " * depth}{span["name"]} {attributes}{error}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Трассировки обработки обновлений и заданий на стикеры')
+    parser.add_argument('trace_id', nargs='?')
+    parser.add_argument('--dir', default='traces')
+    parser.add_argument('--last', action='store_true', help='показать последнюю трассировку')
+    parser.add_argument('--slowest', type=int, metavar='N', help='список N самых долгих трассировок')
+    args = parser.parse_args()
+
+    traces = load_spans(args.dir)
+    if not traces:
+        print(f'В папке {args.dir} нет трассировок')
+        sys.exit(1)
+
+    if args.slowest:
+        print('Самые долгие трассировки:')
+        slowest_traces = sorted(traces.items(), key=lambda item: get_trace_duration(item[1]), reverse=True)
+        for trace_id, spans in slowest_traces[:args.slowest]:
+            root_span = min(spans, key=lambda span: span['started_at'])
+            print(
+                f'    {trace_id}: {get_trace_duration(spans) * 1000:.1f} мс, '
+                f'{root_span["name"]}, операций: {len(spans)}'
+            )
+        return
+
+    if args.trace_id:
+        trace_id = args.trace_id
+    else:
+        trace_id = max(traces, key=lambda trace_id: max(span['started_at'] for span in traces[trace_id]))
+    if trace_id not in traces:
+        print(f'Трассировка {trace_id} не найдена')
+        sys.exit(1)
+    print_trace(trace_id, traces[trace_id])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import pathlib
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import config
+
+_TRACING_ENABLED = config.TRACING_ENABLED if hasattr(config, 'TRACING_ENABLED') else False
+_TRACES_DIR = config.TRACES_DIR if hasattr(config, 'TRACES_DIR') else 'traces'
+_TRACES_FILE_SIZE = config.TRACES_FILE_SIZE if hasattr(config, 'TRACES_FILE_SIZE') else 10 * 1024 ** 2
+_TRACES_BACKUP_COUNT = config.TRACES_BACKUP_COUNT if hasattr(config, 'TRACES_BACKUP_COUNT') else 5
+
+_current_span = ContextVar('current_span', default=None)
+_trace_logger = None
+_trace_logger_lock = threading.Lock()
+
+
+class Span:
+
+    def __init__(self, name: str, trace_id: str, parent: 'Span' = None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.children_count = 0
+        self._children_lock = threading.Lock()
+        if parent:
+            self.attributes['index'] = parent.next_child_index()
+
+    def next_child_index(self) -> int:
+        with self._children_lock:
+            self.children_count += 1
+            return self.children_count - 1
+
+
+def _get_trace_logger() -> logging.Logger:
+    global _trace_logger
+    with _trace_logger_lock:
+        if _trace_logger is None:
+            traces_dir = pathlib.Path(_TRACES_DIR)
+            traces_dir.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                traces_dir / f'{multiprocessing.current_process().name}.jsonl',
+                maxBytes=_TRACES_FILE_SIZE,
+                backupCount=_TRACES_BACKUP_COUNT,
+                encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _trace_logger = logging.getLogger('tracing')
+            _trace_logger.propagate = False
+            _trace_logger.setLevel(logging.INFO)
+            _trace_logger.addHandler(handler)
+        return _trace_logger
+
+
+def get_trace_id() -> str | None:
+    current_span = _current_span.get()
+    return current_span.trace_id if current_span else None
+
+
+@contextmanager
+def span(name: str, trace_id: str = None, **attributes):
+    if not _TRACING_ENABLED:
+        yield
+        return
+    parent = _current_span.get()
+    if trace_id and (not parent or parent.trace_id != trace_id):
+        parent = None
+    current_span = Span(
+        name,
+        trace_id or (parent.trace_id if parent else uuid.uuid4().hex[:16]),
+        parent,
+        **attributes
+    )
+    token = _current_span.set(current_span)
+    started_at = time.time()
+    error = None
+    try:
+        yield current_span
+    except BaseException as exception:
+        error = exception
+        raise
+    finally:
+        _current_span.reset(token)
+        _get_trace_logger().info(json.dumps(
+            {
+                'trace_id': current_span.trace_id,
+                'span_id': current_span.span_id,
+                'parent_id': current_span.parent_id,
+                'name': name,
+                'started_at': round(started_at, 6),
+                'duration': round(time.time() - started_at, 6),
+                'attributes': current_span.attributes,
+                'error': repr(error) if error else None
+            },
+            ensure_ascii=False,
+            default=str
+        ))
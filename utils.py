@@ -1,4 +1,24 @@
+import contextvars
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait
 from datetime import datetime
+from typing import Callable
+
+import config
+
+_FAN_OUT_WORKERS = config.FAN_OUT_WORKERS if hasattr(config, 'FAN_OUT_WORKERS') else 16
+_FAN_OUT_TIMEOUT = config.FAN_OUT_TIMEOUT if hasattr(config, 'FAN_OUT_TIMEOUT') else 30
+
+
+def create_fan_out_executor(name: str = '') -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=_FAN_OUT_WORKERS,
+        thread_name_prefix=f'fan_out_{name}' if name else 'fan_out'
+    )
+
+
+_fan_out_executor = create_fan_out_executor()
 
 
 def convert_to_created_ago(created_at: datetime) -> str:
@@ -6,3 +26,41 @@ def convert_to_created_ago(created_at: datetime) -> str:
     hours, seconds = divmod(int(created_ago), 3600)
     minutes, seconds = divmod(seconds, 60)
     return f'{hours:02.0f}ч. {minutes:02.0f}м.'
+
+
+class LazyModule:
+
+    def __init__(self, module_name: str):
+        self.module_name = module_name
+
+    def __getattr__(self, attribute: str):
+        return getattr(importlib.import_module(self.module_name), attribute)
+
+
+def preload_modules_in_background(*module_names: str):
+    def preload():
+        for module_name in module_names:
+            importlib.import_module(module_name)
+
+    threading.Thread(target=preload, daemon=True).start()
+
+
+def run_concurrently(
+        *calls: Callable,
+        timeout: float = _FAN_OUT_TIMEOUT,
+        executor: ThreadPoolExecutor = None
+) -> list:
+    executor = executor or _fan_out_executor
+    futures = [
+        executor.submit(contextvars.copy_context().run, call)
+        for call in calls
+    ]
+    done, not_done = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+    for future in not_done:
+        future.cancel()
+    for future in futures:
+        if future in done and future.exception():
+            raise future.exception()
+    if not_done:
+        raise TimeoutError(f'Не все запросы выполнены за {timeout} с.')
+    return [future.result() for future in futures]
@@ -0,0 +1,49 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from wb_api.client import WBApiClient
+
+_SUPPLIES_QUANTITY = config.SUPPLIES_QUANTITY if hasattr(config, 'SUPPLIES_QUANTITY') else 40
+_WARM_UP_TIMEOUT = config.WARM_UP_TIMEOUT if hasattr(config, 'WARM_UP_TIMEOUT') else 30
+
+logger = logging.getLogger(__name__)
+
+_process_started_at = time.monotonic()
+_first_response_at = None
+
+
+def warm_up(
+        wb_api_client: WBApiClient,
+        supplies_quantity: int = _SUPPLIES_QUANTITY,
+        timeout: int = _WARM_UP_TIMEOUT
+):
+    started_at = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=2)
+    loads = {
+        'supplies': executor.submit(
+            wb_api_client.get_supplies,
+            only_active=False,
+            quantity=supplies_quantity
+        ),
+        'new_orders': executor.submit(wb_api_client.get_new_orders)
+    }
+    executor.shutdown(wait=False)
+    for name, load in loads.items():
+        time_left = max(0, timeout - (time.monotonic() - started_at))
+        try:
+            load.result(timeout=time_left)
+        except Exception as error:
+            logger.warning(f'Не удалось прогреть {name} для {wb_api_client.seller_key}: {error!r}')
+    logger.info(f'Прогрев кэша занял {time.monotonic() - started_at:.2f} с.')
+
+
+def mark_first_response():
+    global _first_response_at
+    if _first_response_at is not None:
+        return
+    _first_response_at = time.monotonic()
+    logger.info(
+        f'Первый ответ пользователю через {_first_response_at - _process_started_at:.2f} с. после запуска'
+    )
@@ -0,0 +1,140 @@
+import copy
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Hashable
+
+CACHE_MAX_BYTES = 64 * 1024 ** 2
+LRU = 'lru'
+FIFO = 'fifo'
+
+
+class WBCache:
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_size(value: Any) -> int:
+        try:
+            return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return 1024
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.size_bytes -= entry['size']
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            if self.clock() >= entry['expires_at']:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            if entry['policy'] == LRU:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry['value']
+
+    def contains(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and self.clock() < entry['expires_at']
+
+    def set(self, key: Hashable, value: Any, ttl: float, group: Hashable = None, policy: str = LRU):
+        size = self.get_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'value': value,
+                'expires_at': self.clock() + ttl,
+                'group': group,
+                'policy': policy,
+                'size': size
+            }
+            self.size_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, *groups: Hashable):
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry['group'] in groups]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+
+def get_method_key(seller_key: str, method: str, args: tuple, kwargs: dict) -> tuple:
+    return seller_key, method, repr(args), repr(sorted(kwargs.items()))
+
+
+def cached(ttl: float, policy: str = LRU):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            key = get_method_key(self.seller_key, func.__name__, args, kwargs)
+            is_hit, value = self.cache.get(key)
+            if not is_hit:
+                value = func(self, *args, **kwargs)
+                self.cache.set(key, value, ttl, group=(self.seller_key, func.__name__), policy=policy)
+            return copy.copy(value) if isinstance(value, list) else value
+
+        return wrapper
+
+    return decorator
+
+
+def invalidates(*methods: str):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.cache.invalidate(*[(self.seller_key, method) for method in methods])
+
+        return wrapper
+
+    return decorator
+
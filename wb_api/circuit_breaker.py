@@ -0,0 +1,93 @@
+import inspect
+import threading
+import time
+from functools import wraps
+
+import requests
+
+from metrics import metrics
+from .errors import CircuitOpenError
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+
+def is_outage_error(error: Exception) -> bool:
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (ConnectionError, requests.ConnectionError, requests.Timeout))
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures_count = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            retry_at = self.opened_at + self.reset_timeout
+            if self.state == self.OPEN and time.monotonic() >= retry_at:
+                self.state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(self.name, retry_at)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures_count = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures_count += 1
+            if self.state == self.HALF_OPEN or self.failures_count >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.increment('wb_api_circuit_opened_total', method=self.name)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def with_circuit_breaker(func):
+    if inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def generator_wrapper(client, *args, **kwargs):
+            breaker = client.get_circuit_breaker(func.__name__)
+            breaker.before_call()
+            try:
+                yield from func(client, *args, **kwargs)
+            except Exception as error:
+                if is_outage_error(error):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                raise
+            breaker.record_success()
+
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(client, *args, **kwargs):
+        breaker = client.get_circuit_breaker(func.__name__)
+        breaker.before_call()
+        try:
+            result = func(client, *args, **kwargs)
+        except Exception as error:
+            if is_outage_error(error):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    return wrapper
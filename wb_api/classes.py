@@ -1,13 +1,19 @@
 import datetime
 from dataclasses import dataclass
+from functools import partial
 from pprint import pprint
 
 import requests
 from pydantic import BaseModel, Field
 
+from utils import run_concurrently
 from wb_api.errors import retry_on_network_error, check_response
 
 
+CANCELLED_WB_STATUSES = ('canceled', 'canceled_by_client', 'declined_by_client')
+PROBLEM_WB_STATUSES = ('defect',)
+
+
 class Supply(BaseModel):
     id: str
     name: str
@@ -24,6 +30,20 @@ class Order(BaseModel):
     created_at: datetime.datetime = Field(alias='createdAt')
 
 
+class OrderStatus(BaseModel):
+    id: int
+    supplier_status: str = Field(alias='supplierStatus', default='')
+    wb_status: str = Field(alias='wbStatus', default='')
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self.supplier_status == 'cancel' or self.wb_status in CANCELLED_WB_STATUSES
+
+    @property
+    def is_problem(self) -> bool:
+        return self.wb_status in PROBLEM_WB_STATUSES
+
+
 class OrderQRCode(BaseModel):
     order_id: int = Field(alias='orderId')
     file: str
@@ -63,12 +83,17 @@ class Product:
             barcode=barcode,
             colors=characteristics.get('Цвет', []),
             countries=characteristics.get('Страна производства', []),
-            media_files=product_card.get('mediaFiles', [])
+            media_urls=product_card.get('mediaFiles', [])
         )
 
-    @retry_on_network_error
     def get_media(self):
-        for media_file in self.media_urls:
-            response = requests.get(media_file)
-            check_response(response)
-            self.media_files.append(response.content)
+        self.media_files = run_concurrently(
+            *[partial(_download_media_file, media_url) for media_url in self.media_urls]
+        )
+
+
+@retry_on_network_error
+def _download_media_file(media_url: str) -> bytes:
+    response = requests.get(media_url)
+    check_response(response)
+    return response.content
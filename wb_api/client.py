@@ -1,48 +1,129 @@
+import hashlib
+import threading
+import time
+from urllib.parse import urlparse
 from typing import Iterable, Generator
 
 import more_itertools
 import requests
+import requests.adapters
 
-from .classes import Supply, Order, Product, OrderQRCode, SupplyQRCode
+from .classes import Supply, Order, OrderStatus, Product, OrderQRCode, SupplyQRCode
+from .cache import FIFO, WBCache, cached, get_method_key, invalidates
+from .circuit_breaker import CircuitBreaker, with_circuit_breaker
 from .errors import check_response, retry_on_network_error
+from metrics import track_wb_call
+from tracing import span
+from utils import create_fan_out_executor
+
+WB_API_URL = 'https://suppliers-api.wildberries.ru'
+REQUESTS_PER_SECOND = 5
+MAX_CONCURRENT_REQUESTS = 4
+ORDER_STATUS_TTL = 60
+
+
+def get_seller_key(token: str) -> str:
+    return hashlib.sha1((token or '').encode()).hexdigest()[:12]
+
+
+class RateLimitedSession(requests.Session):
+
+    def __init__(self, requests_per_second: float, max_concurrent_requests: int):
+        super().__init__()
+        self.min_interval = 1 / requests_per_second
+        self._next_request_at = 0.0
+        self._rate_lock = threading.Lock()
+        self._concurrency = threading.BoundedSemaphore(max_concurrent_requests)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=max_concurrent_requests,
+            pool_maxsize=max_concurrent_requests
+        )
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method: str, url: str, *args, **kwargs):
+        with span('http', method=method, path=urlparse(url).path) as http_span:
+            with self._rate_lock:
+                now = time.monotonic()
+                request_at = max(now, self._next_request_at)
+                self._next_request_at = request_at + self.min_interval
+            if request_at > now:
+                time.sleep(request_at - now)
+            waited_at = time.monotonic()
+            with self._concurrency:
+                if http_span:
+                    http_span.attributes['wait'] = round(time.monotonic() - now, 4)
+                    http_span.attributes['queue_wait'] = round(time.monotonic() - waited_at, 4)
+                response = super().request(method, url, *args, **kwargs)
+            if http_span:
+                http_span.attributes['status'] = response.status_code
+            return response
 
 
 class WBApiClient:
-    instance = None
-    is_initialized = False
 
-    def __new__(cls, *args, **kwargs):
-        if not cls.instance:
-            cls.instance = super().__new__(cls)
-        return cls.instance
+    def __init__(
+            self,
+            token: str = None,
+            base_url: str = WB_API_URL,
+            requests_per_second: float = REQUESTS_PER_SECOND,
+            max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+            order_status_ttl: float = ORDER_STATUS_TTL,
+            cache: WBCache = None
+    ):
+        self.seller_key = get_seller_key(token)
+        self._headers = {'Authorization': token}
+        self._base_url = base_url
+        self._session = RateLimitedSession(requests_per_second, max_concurrent_requests)
+        self._circuit_breakers = {}
+        self._circuit_breakers_lock = threading.Lock()
+        self.order_status_ttl = order_status_ttl
+        self.cache = cache or WBCache()
+        self.fan_out_executor = create_fan_out_executor(self.seller_key)
+
+    def is_cached(self, method: str, *args, **kwargs) -> bool:
+        return self.cache.contains(get_method_key(self.seller_key, method, args, kwargs))
 
-    def __init__(self, token=None):
-        if not self.is_initialized:
-            self._headers = {'Authorization': token}
-            self.__class__.is_initialized = True
+    def get_circuit_breaker(self, method: str) -> CircuitBreaker:
+        with self._circuit_breakers_lock:
+            if method not in self._circuit_breakers:
+                self._circuit_breakers[method] = CircuitBreaker(method)
+            return self._circuit_breakers[method]
 
-    @retry_on_network_error
+    @cached(ttl=30)
     def get_supply_orders(self, supply_id: str) -> list[Order]:
-        response = requests.get(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies/{supply_id}/orders',
+        return self.fetch_supply_orders(supply_id)
+
+    @track_wb_call
+    @retry_on_network_error
+    @with_circuit_breaker
+    def fetch_supply_orders(self, supply_id: str) -> list[Order]:
+        response = self._session.get(
+            f'{self._base_url}/api/v3/supplies/{supply_id}/orders',
             headers=self._headers
         )
         check_response(response)
         return [Order.parse_obj(order) for order in response.json()['orders']]
 
+    @cached(ttl=30)
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_supply(self, supply_id: str) -> Supply:
-        response = requests.get(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies/{supply_id}',
+        response = self._session.get(
+            f'{self._base_url}/api/v3/supplies/{supply_id}',
             headers=self._headers
         )
         check_response(response)
         return Supply.parse_obj(response.json())
 
+    @cached(ttl=3600)
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_product(self, article: str) -> Product:
-        response = requests.post(
-            'https://suppliers-api.wildberries.ru/content/v1/cards/filter',
+        response = self._session.post(
+            f'{self._base_url}/content/v1/cards/filter',
             json={'vendorCodes': [article]},
             headers=self._headers
         )
@@ -52,14 +133,16 @@ class WBApiClient:
                 return Product.parse_from_card(product_card)
         return Product(article=article)
 
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_all_products(self) -> Generator:
         cursor = {
             'limit': 1000
         }
         while True:
-            response = requests.post(
-                'https://suppliers-api.wildberries.ru/content/v1/cards/cursor/list',
+            response = self._session.post(
+                f'{self._base_url}/content/v1/cards/cursor/list',
                 headers=self._headers,
                 json={
                     'sort': {
@@ -84,11 +167,13 @@ class WBApiClient:
             else:
                 continue
 
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_products_by_articles(self, articles: Iterable) -> Generator:
         for chunk in more_itertools.chunked(articles, 100):
-            response = requests.post(
-                'https://suppliers-api.wildberries.ru/content/v1/cards/filter',
+            response = self._session.post(
+                f'{self._base_url}/content/v1/cards/filter',
                 json={'vendorCodes': chunk},
                 headers=self._headers
             )
@@ -96,7 +181,10 @@ class WBApiClient:
             for product_card in response.json()['data']:
                 yield product_card
 
+    @cached(ttl=30)
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_supplies(self, only_active: bool = True, quantity: int = 50) -> list[Supply]:
         params = {
             'limit': 1000,
@@ -104,8 +192,8 @@ class WBApiClient:
         }
         all_supply_objects = []
         while True:  # Находим последнюю страницу с поставками
-            response = requests.get(
-                'https://suppliers-api.wildberries.ru/api/v3/supplies',
+            response = self._session.get(
+                f'{self._base_url}/api/v3/supplies',
                 headers=self._headers,
                 params=params
             )
@@ -129,12 +217,18 @@ class WBApiClient:
                 break
         return supplies
 
-    @retry_on_network_error
+    @cached(ttl=3600, policy=FIFO)
     def get_qr_codes_for_orders(self, order_ids: list[int]) -> list[OrderQRCode]:
+        return self.fetch_qr_codes_for_orders(order_ids)
+
+    @track_wb_call
+    @retry_on_network_error
+    @with_circuit_breaker
+    def fetch_qr_codes_for_orders(self, order_ids: list[int]) -> list[OrderQRCode]:
         stickers = list()
         for chunk in more_itertools.chunked(order_ids, 100):
-            response = requests.post(
-                'https://suppliers-api.wildberries.ru/api/v3/orders/stickers',
+            response = self._session.post(
+                f'{self._base_url}/api/v3/orders/stickers',
                 headers=self._headers,
                 json={'orders': chunk},
                 params={
@@ -148,19 +242,25 @@ class WBApiClient:
         return stickers
 
 
+    @invalidates('get_supplies', 'get_supply')
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def send_supply_to_deliver(self, supply_id: str) -> bool:
-        response = requests.patch(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies/{supply_id}/deliver',
+        response = self._session.patch(
+            f'{self._base_url}/api/v3/supplies/{supply_id}/deliver',
             headers=self._headers
         )
         check_response(response)
         return response.ok
 
+    @cached(ttl=3600, policy=FIFO)
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_supply_qr_code(self, supply_id: str) -> SupplyQRCode:
-        response = requests.get(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies/{supply_id}/barcode',
+        response = self._session.get(
+            f'{self._base_url}/api/v3/supplies/{supply_id}/barcode',
             headers=self._headers,
             params={
                 'type': 'png',
@@ -171,10 +271,13 @@ class WBApiClient:
         check_response(response)
         return SupplyQRCode.parse_obj(response.json())
 
+    @cached(ttl=15)
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_new_orders(self) -> list[Order]:
-        response = requests.get(
-            'https://suppliers-api.wildberries.ru/api/v3/orders/new',
+        response = self._session.get(
+            f'{self._base_url}/api/v3/orders/new',
             headers=self._headers
         )
         check_response(response)
@@ -183,7 +286,9 @@ class WBApiClient:
             for order in response.json()['orders']
         ]
 
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def get_orders(
             self,
             next: int = 0,
@@ -199,8 +304,8 @@ class WBApiClient:
             params['dateFrom'] = datestamp_from
         if datestamp_to:
             params['dateTo'] = datestamp_to
-        response = requests.get(
-            'https://suppliers-api.wildberries.ru/api/v3/orders',
+        response = self._session.get(
+            f'{self._base_url}/api/v3/orders',
             headers=self._headers,
             params=params
         )
@@ -212,29 +317,72 @@ class WBApiClient:
         ]
         return orders, response_content['next']
 
+    @track_wb_call
+    @retry_on_network_error
+    @with_circuit_breaker
+    def fetch_order_statuses(self, order_ids: list[int]) -> list[OrderStatus]:
+        statuses = []
+        for chunk in more_itertools.chunked(order_ids, 1000):
+            response = self._session.post(
+                f'{self._base_url}/api/v3/orders/status',
+                headers=self._headers,
+                json={'orders': chunk}
+            )
+            check_response(response)
+            statuses.extend([OrderStatus.parse_obj(status) for status in response.json()['orders']])
+        return statuses
+
+    def get_order_statuses(self, order_ids: Iterable[int]) -> dict[int, OrderStatus]:
+        statuses = {}
+        for order_id in set(order_ids):
+            is_hit, status = self.cache.get((self.seller_key, 'order_status', order_id))
+            if is_hit:
+                statuses[order_id] = status
+        missing_order_ids = sorted(set(order_ids) - set(statuses))
+        if not missing_order_ids:
+            return statuses
+        for status in self.fetch_order_statuses(missing_order_ids):
+            statuses[status.id] = status
+            self.cache.set(
+                (self.seller_key, 'order_status', status.id),
+                status,
+                self.order_status_ttl,
+                group=(self.seller_key, 'get_order_statuses')
+            )
+        return statuses
+
+    @invalidates('get_supply_orders', 'get_new_orders', 'get_order_statuses')
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def add_order_to_supply(self, supply_id: str, order_id: int | str) -> int:
-        response = requests.patch(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies/{supply_id}/orders/{order_id}',
+        response = self._session.patch(
+            f'{self._base_url}/api/v3/supplies/{supply_id}/orders/{order_id}',
             headers=self._headers
         )
         check_response(response)
         return response.ok
 
+    @invalidates('get_supplies')
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def create_new_supply(self, supply_name: str) -> str:
-        response = requests.post(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies',
+        response = self._session.post(
+            f'{self._base_url}/api/v3/supplies',
             headers=self._headers,
             json={'name': supply_name}
         )
         check_response(response)
         return response.json()['id']
 
+    @invalidates('get_supplies', 'get_supply')
+    @track_wb_call
     @retry_on_network_error
+    @with_circuit_breaker
     def delete_supply_by_id(self, supply_id: str) -> int:
-        response = requests.delete(
-            f'https://suppliers-api.wildberries.ru/api/v3/supplies/{supply_id}',
+        response = self._session.delete(
+            f'{self._base_url}/api/v3/supplies/{supply_id}',
             headers=self._headers
         )
         check_response(response)
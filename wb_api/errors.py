@@ -1,8 +1,12 @@
 import time
+from functools import wraps
 
+import requests
 from requests import Response
 from requests.exceptions import ChunkedEncodingError, JSONDecodeError
 
+from metrics import metrics
+
 
 class WBAPIError(Exception):
     def __init__(self, message: str, code: str | int = None):
@@ -14,6 +18,13 @@ class WBAPIError(Exception):
         return f'{self.code}: {self.message}' if self.code else self.message
 
 
+class CircuitOpenError(WBAPIError):
+    def __init__(self, method: str, retry_at: float):
+        super().__init__(message=f'{method} временно недоступен')
+        self.method = method
+        self.retry_at = retry_at
+
+
 def check_response(response: Response):
     response.raise_for_status()
     try:
@@ -33,13 +44,15 @@ def check_response(response: Response):
 
 
 def retry_on_network_error(func):
+    @wraps(func)
     def wrapper(*args, **kwargs):
         delay = 0
         while True:
             delay = min(delay, 30)
             try:
                 return func(*args, **kwargs)
-            except (ChunkedEncodingError, ConnectionError):
+            except (ChunkedEncodingError, ConnectionError, requests.ConnectionError):
+                metrics.increment('wb_api_retries_total', method=func.__name__)
                 time.sleep(delay)
                 delay += 5
                 continue
@@ -0,0 +1,52 @@
+import threading
+from typing import Iterable
+
+from .cache import WBCache
+from .client import WBApiClient, get_seller_key
+
+
+class WBClientRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._user_sellers = {}
+
+    def register(self, token: str, user_ids: Iterable[int] = (), **client_options) -> WBApiClient:
+        seller_key = get_seller_key(token)
+        with self._lock:
+            if seller_key not in self._clients:
+                self._clients[seller_key] = WBApiClient(token=token, cache=WBCache(), **client_options)
+            for user_id in user_ids:
+                self._user_sellers[user_id] = seller_key
+            return self._clients[seller_key]
+
+    def get_client(self, seller_key: str) -> WBApiClient | None:
+        return self._clients.get(seller_key)
+
+    def get_client_for_user(self, user_id: int) -> WBApiClient:
+        return self._clients[self._user_sellers[user_id]]
+
+    def get_clients(self) -> list[WBApiClient]:
+        return list(self._clients.values())
+
+    def get_user_ids(self, seller_key: str) -> list[int]:
+        return [
+            user_id
+            for user_id, user_seller_key in self._user_sellers.items()
+            if user_seller_key == seller_key
+        ]
+
+    def get_cache_stats(self) -> dict:
+        stats = {}
+        for wb_api_client in self.get_clients():
+            for name, value in wb_api_client.cache.get_stats().items():
+                stats[name] = stats.get(name, 0) + value
+        return stats
+
+    @property
+    def user_ids(self) -> list[int]:
+        return list(self._user_sellers)
+
+
+wb_client_registry = WBClientRegistry()